@@ -0,0 +1,270 @@
+"""
+Массовый импорт рецептов из NDJSON (api/recipes/import/
+и команда import_recipes).
+
+Каждая строка — JSON-объект в формате POST /api/recipes/, но поле
+image содержит не base64, а имя уже загруженного файла медиахранилища
+(например, foodgram_app/images/<хеш>.png). Необязательное поле author —
+id автора; без него рецепт получает автора по умолчанию.
+
+Записи обрабатываются порциями по BATCH_SIZE: поля проверяются
+без запросов полями CreateRecipeSerializer (RecipeRecordSerializer),
+ингредиенты, теги, авторы и файлы порции — несколькими запросами
+по множествам id, а корректные рецепты вставляются bulk_create
+(рецепты, теги, ингредиенты) в одной транзакции на порцию. Короткие
+ссылки строятся из случайного префикса порции и номера записи,
+поэтому не требуют проверок в базе и не совпадают с обычными
+трёхсимвольными. Если вставка порции нарушила ограничение
+базы (совпала короткая ссылка, параллельно удалён автор), порция
+вставляется заново по одной записи. Производные данные (журнал
+изменений, поисковый индекс, ссылки на файлы, кеши) обновляются один
+раз на вставку. Ошибочные записи возвращаются с номерами строк
+и не мешают импорту остальных.
+"""
+import string
+
+import orjson
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from foodgram_app.bulk import insert_rows
+from foodgram_app.changes import record_changes
+from foodgram_app.invalidation import publish
+from foodgram_app.models import (
+    Ingredient,
+    IngredientRecipe,
+    MediaFile,
+    Recipe,
+    Tag,
+)
+from foodgram_app.search import update_search_indexes
+
+from .serializers import CreateRecipeSerializer
+
+User = get_user_model()
+
+RecipeTag = Recipe.tags.through
+
+BATCH_SIZE = 1000
+SHORT_LINK_PREFIX_LENGTH = 8
+SHORT_LINK_ALPHABET = string.ascii_letters + string.digits
+
+
+def encode_number(number):
+    """Число в системе счисления по алфавиту коротких ссылок."""
+    base = len(SHORT_LINK_ALPHABET)
+    digits = SHORT_LINK_ALPHABET[number % base]
+    while number >= base:
+        number //= base
+        digits = SHORT_LINK_ALPHABET[number % base] + digits
+    return digits
+
+
+def short_links(count):
+    """
+    count коротких ссылок без запросов к базе: префикс фиксированной
+    длины общий для порции, суффикс — номер записи в ней.
+    """
+    prefix = Recipe.generate_short_code(SHORT_LINK_PREFIX_LENGTH)
+    return [prefix + encode_number(number) for number in range(count)]
+
+
+class RecipeRecordSerializer(CreateRecipeSerializer):
+    """
+    Запись импорта: поля и проверки CreateRecipeSerializer, но image —
+    имя файла в медиахранилище, tags — id тегов, author — id автора.
+    Существование тегов, ингредиентов, авторов и файлов проверяется
+    для всей порции сразу (RecipeImporter.existing).
+    """
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = serializers.CharField()
+    author = serializers.IntegerField(required=False)
+
+    def validate_ingredients(self, value):
+        return value
+
+
+def validate_record(record):
+    """
+    Проверки одной записи, не требующие запросов к базе.
+    Возвращает словарь ошибок по полям и проверенные данные.
+    """
+    serializer = RecipeRecordSerializer(data=record)
+    if not serializer.is_valid():
+        return serializer.errors, None
+    return {}, serializer.validated_data
+
+
+class ImportResult:
+    """Итог импорта: число созданных рецептов и ошибки по строкам."""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'errors': self.errors}
+
+
+class RecipeImporter:
+    """
+    Импортирует рецепты порциями. default_author — автор записей
+    без поля author (None — поле обязательно).
+    """
+
+    def __init__(self, default_author=None, batch_size=BATCH_SIZE):
+        self.default_author_id = getattr(default_author, 'pk', None)
+        self.batch_size = batch_size
+        self.result = ImportResult()
+
+    def run(self, lines):
+        """Импортирует строки NDJSON (bytes или str) и возвращает итог."""
+        batch = []
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                self.result.add_error(
+                    number, {'non_field_errors': ['Некорректный JSON.']})
+                continue
+            errors, record = validate_record(record)
+            if errors:
+                self.result.add_error(number, errors)
+                continue
+            batch.append((number, record))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.result
+
+    def existing(self, batch):
+        """Множества существующих id и файлов, упомянутых в порции."""
+        tag_ids, ingredient_ids, author_ids, images = (
+            set(), set(), set(), set())
+        for _, record in batch:
+            tag_ids.update(record['tags'])
+            ingredient_ids.update(item['id'] for item in record['ingredients'])
+            author_ids.add(record.get('author', self.default_author_id))
+            images.add(record['image'])
+        author_ids.discard(None)
+        return {
+            'tags': set(Tag.objects.filter(
+                pk__in=tag_ids).values_list('pk', flat=True)),
+            'ingredients': set(Ingredient.objects.filter(
+                pk__in=ingredient_ids).values_list('pk', flat=True)),
+            'author': set(User.objects.filter(
+                pk__in=author_ids).values_list('pk', flat=True)),
+            'image': set(MediaFile.objects.filter(
+                name__in=images).values_list('name', flat=True)),
+        }
+
+    def check_references(self, record, existing):
+        """Ошибки ссылок записи на несуществующие объекты."""
+        errors = {}
+        missing_tags = set(record['tags']) - existing['tags']
+        if missing_tags:
+            errors['tags'] = [
+                f'Теги не найдены: {sorted(missing_tags)}.']
+        missing_ingredients = {
+            item['id'] for item in record['ingredients']
+        } - existing['ingredients']
+        if missing_ingredients:
+            errors['ingredients'] = [
+                f'Ингредиенты не найдены: {sorted(missing_ingredients)}.']
+        author = record.get('author', self.default_author_id)
+        if author is None:
+            errors['author'] = ['Не указан автор рецепта.']
+        elif author not in existing['author']:
+            errors['author'] = [f'Пользователь {author} не найден.']
+        if record['image'] not in existing['image']:
+            errors['image'] = ['Файл не найден в медиахранилище.']
+        return errors
+
+    def import_batch(self, batch):
+        """Проверяет ссылки порции и вставляет корректные рецепты."""
+        existing = self.existing(batch)
+        valid = []
+        for number, record in batch:
+            errors = self.check_references(record, existing)
+            if errors:
+                self.result.add_error(number, errors)
+            else:
+                valid.append((number, record))
+        if not valid:
+            return
+        try:
+            self.insert([record for _, record in valid])
+        except IntegrityError:
+            # Транзакция порции откатилась целиком: повторяем по одной
+            # записи, с новыми короткими ссылками.
+            for number, record in valid:
+                try:
+                    self.insert([record])
+                except IntegrityError as error:
+                    self.result.add_error(number, {'non_field_errors': [
+                        f'Рецепт не сохранён: {error}']})
+
+    def insert(self, valid):
+        """Вставляет рецепты valid одной транзакцией."""
+        with transaction.atomic():
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    author_id=record.get('author', self.default_author_id),
+                    name=record['name'],
+                    text=record['text'],
+                    image=record['image'],
+                    cooking_time=record['cooking_time'],
+                    short_link=short_link,
+                )
+                for record, short_link in zip(valid,
+                                              short_links(len(valid)))
+            ])
+            if recipes[0].pk is None:
+                # bulk_create возвращает id не на всех СУБД.
+                ids = dict(Recipe.objects.filter(short_link__in=[
+                    recipe.short_link for recipe in recipes
+                ]).values_list('short_link', 'pk'))
+                for recipe in recipes:
+                    recipe.pk = ids[recipe.short_link]
+            insert_rows(RecipeTag, ('recipe', 'tag'), [
+                (recipe.pk, tag_id)
+                for recipe, record in zip(recipes, valid)
+                for tag_id in record['tags']
+            ])
+            insert_rows(IngredientRecipe, ('recipe', 'ingredient', 'amount'), [
+                (recipe.pk, item['id'], item['amount'])
+                for recipe, record in zip(recipes, valid)
+                for item in record['ingredients']
+            ])
+            self.add_media_references(valid)
+            recipe_ids = [recipe.pk for recipe in recipes]
+            record_changes(recipe_ids)
+            update_search_indexes(recipe_ids)
+            publish(Recipe, None)
+        self.result.created += len(recipes)
+
+    @staticmethod
+    def add_media_references(records):
+        """Каждый рецепт добавляет ссылку на свой файл."""
+        storage = Recipe._meta.get_field('image').storage
+        if not hasattr(storage, 'add_reference'):
+            return
+        counts = {}
+        for record in records:
+            counts[record['image']] = counts.get(record['image'], 0) + 1
+        for name, count in counts.items():
+            storage.add_reference(name, count)
+
+
+def import_recipes(lines, default_author=None, batch_size=BATCH_SIZE):
+    """Импортирует рецепты из строк NDJSON; возвращает ImportResult."""
+    return RecipeImporter(default_author, batch_size).run(lines)
@@ -0,0 +1,161 @@
+"""
+Сжатие ответов gzip и brotli с выбором по Accept-Encoding.
+
+CompressionMiddleware сжимает обычные и потоковые ответы
+(StreamingHttpResponse сжимается по частям). Для кешируемых ответов
+(вьюсеты с PrecompressedMixin) сжатые байты сохраняются в кеше
+по хешу содержимого: повторный запрос с тем же телом отдаёт
+готовый результат без повторного сжатия.
+brotli — необязательная зависимость: без неё используется только gzip.
+"""
+import hashlib
+import re
+import zlib
+
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+
+from foodgram_main.metrics import count_cache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+MIN_COMPRESS_LENGTH = 200
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+# Сжатие заранее, для кеша, можно делать сильнее: оно выполняется
+# один раз на версию содержимого.
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 11
+CACHE_ALIAS = 'default'
+CACHE_TIMEOUT = 60 * 60
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(application/(json|x-ndjson|javascript|xml)|text/)', re.IGNORECASE)
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding с ненулевым q."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in (
+                '0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(request):
+    """Лучшая доступная кодировка для запроса или None."""
+    accepted = accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding, cached=False):
+    """Сжимает байты целиком."""
+    if encoding == 'br':
+        return brotli.compress(
+            content,
+            quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    compressor = zlib.compressobj(
+        CACHED_GZIP_LEVEL if cached else GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """Сжимает поток частей, не собирая его в памяти."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_cached(content, encoding):
+    """
+    Сжатые байты из кеша по хешу содержимого; при промахе
+    сжимает с максимальным уровнем и сохраняет.
+    """
+    cache = caches[CACHE_ALIAS]
+    key = ('compressed:' + encoding + ':'
+           + hashlib.blake2b(content, digest_size=16).hexdigest())
+    compressed = cache.get(key)
+    count_cache('compression', compressed is not None)
+    if compressed is None:
+        compressed = compress(content, encoding, cached=True)
+        cache.set(key, compressed, CACHE_TIMEOUT)
+    return compressed
+
+
+class PrecompressedMixin:
+    """
+    Миксин вьюсета: помечает успешные GET-ответы как кешируемые,
+    чтобы CompressionMiddleware брал сжатые байты из кеша.
+    Метод is_precompressed можно переопределить.
+    """
+
+    def is_precompressed(self, request, response):
+        return request.method == 'GET' and response.status_code == 200
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response,
+                                             *args, **kwargs)
+        response.precompressed = self.is_precompressed(request, response)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы gzip или brotli. Должен стоять в MIDDLEWARE
+    выше всех, кто читает или изменяет тело ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.has_header('Content-Encoding')
+                or not COMPRESSIBLE_TYPES.match(
+                    response.get('Content-Type', ''))):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < MIN_COMPRESS_LENGTH:
+                return response
+            if getattr(response, 'precompressed', False):
+                compressed = compress_cached(response.content, encoding)
+            else:
+                compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,72 @@
+"""
+Потоковая выгрузка каталога рецептов в NDJSON: один рецепт
+в формате RecipeSerializer на строку.
+
+id рецептов читаются итератором (на PostgreSQL — серверным курсором),
+представление строится порциями по EXPORT_CHUNK_SIZE рецептов
+быстрым путём serialize_recipes: память не зависит от размера
+каталога, на порцию выполняется фиксированное число запросов.
+Используется api/recipes/export.ndjson/ и командой export_recipes.
+"""
+from datetime import datetime, time
+from itertools import islice
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from foodgram_app.changes import changed_recipes
+from foodgram_app.interactions import EMPTY
+from foodgram_app.models import RecipeChange
+from foodgram_main.db_router import reading_from
+
+from .renderers import ORJSONRenderer
+from .representations import serialize_recipes
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def parse_updated_since(value):
+    """Дата или дата-время ISO 8601; ValueError при ошибке."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_recipes(queryset, author=None, tags=(), updated_since=None):
+    """
+    Рецепты автора, с любым из тегов (slug) и изменённые
+    не раньше updated_since (по журналу RecipeChange), по порядку id.
+    """
+    if author is not None:
+        queryset = queryset.filter(author=author)
+    if tags:
+        queryset = queryset.filter(tags__slug__in=tags).distinct()
+    if updated_since is not None:
+        queryset = queryset.filter(changed_recipes(
+            RecipeChange.objects.filter(created_at__gte=updated_since)))
+    return queryset.order_by('pk')
+
+
+def export_lines(queryset, request=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Байтовые порции NDJSON по chunk_size рецептов. Все запросы
+    идут в базу queryset.db, персональных флагов в выгрузке нет.
+    """
+    if request is not None:
+        request._interactions = EMPTY
+    renderer = ORJSONRenderer()
+    recipe_ids = queryset.values_list('pk', flat=True).iterator(
+        chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(recipe_ids, chunk_size))
+        if not chunk:
+            return
+        with reading_from(queryset.db):
+            recipes = serialize_recipes(chunk, request)
+        yield b''.join(renderer.render(recipe) + b'\n' for recipe in recipes)
@@ -3,6 +3,7 @@ from django_filters import FilterSet
 from django_filters.rest_framework import filters
 
 from foodgram_app.models import Ingredient, Recipe, Tag
+from foodgram_app.search import search_recipes
 
 User = get_user_model()
 
@@ -28,6 +29,7 @@ class TagFavCartFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all())
+    search = filters.CharFilter(method='filter_search')
 
     def filter_is_favorited(self, queryset, name, value):
         """Фильтрует избранные рецепты."""
@@ -43,6 +45,16 @@ class TagFavCartFilter(FilterSet):
             return queryset.filter(shoppingcart_recipes__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """
+        Полнотекстовый поиск по названию, описанию и ингредиентам,
+        результаты отсортированы по релевантности.
+        """
+        if value.strip():
+            return search_recipes(queryset, value)
+        return queryset
+
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search']
@@ -0,0 +1,485 @@
+"""
+Нагрузочное тестирование по HTTP на основе postman-коллекции.
+
+Запросы берутся из postman_collection/foodgram.postman_collection.json
+по имени («get_recipe_detail // No Auth»): метод, адрес, тело,
+заголовки и авторизация apikey (в том числе унаследованная от папки).
+Переменные {{...}} подставляются из области видимости: итерация
+сценария, виртуальный пользователь, общие данные подготовки и,
+последними, переменные коллекции. Что сохранить из ответа
+(в коллекции это делают JS-тесты pm.collectionVariables.set),
+задаётся в шагах сценариев ниже.
+
+Прогон:
+- SETUP один раз регистрирует автора, читает теги и ингредиенты
+  и создаёт рецепт для просмотра (в базе нужны минимум 3 тега
+  и 2 ингредиента, как и для самой коллекции);
+- concurrency виртуальных пользователей — корутины asyncio, каждая
+  со своим keep-alive соединением, — регистрируются и входят (LOGIN),
+  после чего до конца duration (или iterations раз) выбирают
+  сценарий из SCENARIOS случайно по весам.
+
+По каждому шагу считаются число запросов, пропускная способность,
+перцентили задержки и доля ошибок: статус 4xx/5xx, обрыв соединения
+или таймаут. После ошибки оставшиеся шаги итерации пропускаются.
+Сводку можно сохранить как базовую и сравнивать с ней следующие
+прогоны (compare).
+
+HTTP/1.1-клиент написан на asyncio-потоках стандартной библиотеки:
+нужен только запущенный стек (gunicorn или nginx), без сети
+и сторонних пакетов. Пользователи, созданные прогоном, получают
+имена с префиксом loadtest-.
+"""
+import asyncio
+import json
+import random
+import re
+import string
+import time
+import uuid
+from collections import ChainMap, Counter, defaultdict
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+DEFAULT_COLLECTION = (Path(__file__).resolve().parents[2]
+                      / 'postman_collection'
+                      / 'foodgram.postman_collection.json')
+VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+PERCENTILES = (50, 90, 95, 99)
+USER_PREFIX = 'loadtest'
+# Регрессия задержки засчитывается, только если p95 вырос и
+# в долях (tolerance), и не меньше чем на столько миллисекунд.
+MIN_REGRESSION_MS = 5.0
+ERROR_RATE_TOLERANCE = 0.01
+# Шаги с меньшим числом запросов не сравниваются: p95 и доля
+# ошибок на десятке запросов — шум.
+MIN_COMPARED_COUNT = 30
+
+# Шаг: (имя запроса в коллекции, {переменная: путь в JSON ответа}).
+# Путь — ключи и индексы через точку или функция от ответа.
+SETUP = (
+    ('create_second_user', {'secondUserId': 'id'}),
+    ('get_token_for_second_user', {'secondUserToken': 'auth_token'}),
+    ('get_tag_list // No Auth', {
+        'firstTagId': '0.id', 'secondTagId': '1.id', 'thirdTagId': '2.id',
+        'secondTagSlug': '1.slug', 'thirdTagSlug': '2.slug',
+    }),
+    ('get_ingredients_list // No Auth', {
+        'firstIndredientId': '0.id', 'secondIndredientId': '1.id',
+        'ingredientNameFirstLatter': lambda data: data[0]['name'][:1],
+    }),
+    ('create_first_recipe // Second User', {'firstRecipeId': 'id'}),
+)
+# Шаги «// Second User» в сценариях выполняются от имени самого
+# виртуального пользователя: его токен записывается и в
+# secondUserToken, а общий secondUserToken автора не нужен.
+LOGIN = (
+    ('create_first_user', {'userId': 'id'}),
+    ('get_token_for_first_user', {'userToken': 'auth_token',
+                                  'secondUserToken': 'auth_token'}),
+)
+SCENARIOS = {
+    'browse': (60, (
+        ('get_recipes_list // No Auth', {}),
+        ('get_recipes_list_with_two_tags_param // User', {}),
+        ('get_recipe_detail // No Auth', {}),
+        ('get_recipe_short_link // No Auth', {}),
+        ('get_tag_list // No Auth', {}),
+        ('get_ingredients_list_with_name_filter // User', {}),
+    )),
+    'cook': (20, (
+        ('create_fifth_recipe // User', {'firstRecipeId': 'id'}),
+        ('update_recipe // Second User', {}),
+        ('add_to_favorite // User', {}),
+        ('add_to_shopping_cart // User', {}),
+        ('get_recipes_list_with_is_in_shopping_cart_param // User', {}),
+        ('download_shopping_cart // User', {}),
+        ('remove_from_favorite // User', {}),
+        ('remove_from_shopping_cart // User', {}),
+        ('delete_first_recipe // Second User', {}),
+    )),
+    'subscribe': (10, (
+        ('create_subscription_with_recipes_limit_param // User', {}),
+        ('get_subscription_list // User', {}),
+        ('delete_second_subscription // User', {}),
+    )),
+    'register': (10, LOGIN + (
+        ('users_me // User', {}),
+        ('logout // User', {}),
+    )),
+}
+
+
+class LoadTestError(Exception):
+    """Прогон невозможен: нет запроса, переменной или подготовка упала."""
+
+
+class StepFailed(Exception):
+    """Шаг сценария завершился ошибкой; итерация прерывается."""
+
+
+def load_collection(path):
+    """
+    Запросы коллекции по имени и её переменные. При повторе имени
+    берётся первый запрос; авторизация наследуется от папок.
+    """
+    with open(path, encoding='utf-8') as source:
+        collection = json.load(source)
+    requests = {}
+
+    def walk(items, auth):
+        for item in items:
+            item_auth = (item.get('request') or item).get('auth') or auth
+            if 'item' in item:
+                walk(item['item'], item_auth)
+            else:
+                requests.setdefault(item['name'],
+                                    parse_request(item['request'], item_auth))
+
+    walk(collection.get('item', []), collection.get('auth'))
+    variables = {variable['key']: variable['value']
+                 for variable in collection.get('variable', [])}
+    return requests, variables
+
+
+def parse_request(request, auth):
+    """Метод, адрес, заголовки и тело запроса коллекции."""
+    url = request['url']
+    headers = {header['key']: header['value']
+               for header in request.get('header', [])
+               if not header.get('disabled')}
+    if auth and auth.get('type') == 'apikey':
+        apikey = {field['key']: field['value'] for field in auth['apikey']}
+        headers[apikey.get('key', 'Authorization')] = apikey['value']
+    body = request.get('body') or {}
+    raw = body.get('raw', '') if body.get('mode') == 'raw' else ''
+    if raw and body.get('options', {}).get('raw', {}).get(
+            'language') == 'json':
+        headers.setdefault('Content-Type', 'application/json')
+    return {
+        'method': request['method'],
+        'url': url['raw'] if isinstance(url, dict) else url,
+        'headers': headers,
+        'body': raw,
+    }
+
+
+def substitute(template, scope):
+    """Подставляет {{переменные}}; неизвестная переменная — ошибка."""
+    def replace(match):
+        try:
+            return str(scope[match.group(1)])
+        except KeyError:
+            raise LoadTestError(
+                f'Не задана переменная {match.group(1)}') from None
+    return VARIABLE.sub(replace, template)
+
+
+def pick(data, path):
+    """Значение из ответа по пути «0.id» или функции."""
+    if callable(path):
+        return path(data)
+    for part in path.split('.'):
+        data = data[int(part)] if isinstance(data, list) else data[part]
+    return data
+
+
+def new_identity(scope, email, username):
+    """
+    Уникальные email и имя для регистрации. Переменные коллекции
+    подставляются в JSON как есть, поэтому значения — JSON-строки.
+    """
+    name = f'{USER_PREFIX}-{uuid.uuid4().hex[:12]}'
+    scope[email] = json.dumps(f'{name}@example.com')
+    scope[username] = json.dumps(name)
+
+
+class Connection:
+    """HTTP/1.1-соединение, переиспользуемое между запросами."""
+
+    def __init__(self, host, port, netloc):
+        self.host = host
+        self.port = port
+        self.netloc = netloc
+        self.reader = self.writer = None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def request(self, method, target, headers, body):
+        """Статус и тело ответа."""
+        reused = self.writer is not None
+        try:
+            return await self.exchange(method, target, headers, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            if not reused:
+                raise
+        # Сервер закрыл простаивавшее соединение: повтор на новом.
+        return await self.exchange(method, target, headers, body)
+
+    async def exchange(self, method, target, headers, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+        head = [f'{method} {target} HTTP/1.1', f'Host: {self.netloc}',
+                *(f'{name}: {value}' for name, value in headers.items())]
+        if body or method not in ('GET', 'HEAD', 'DELETE'):
+            head.append(f'Content-Length: {len(body)}')
+        self.writer.write('\r\n'.join(head).encode('latin-1')
+                          + b'\r\n\r\n' + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Сервер закрыл соединение')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if method == 'HEAD' or status in (204, 304):
+            content = b''
+        elif response_headers.get('transfer-encoding') == 'chunked':
+            content = await self.read_chunked()
+        elif 'content-length' in response_headers:
+            content = await self.reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            content = await self.reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, content
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if not size:
+                # Завершающие заголовки до пустой строки.
+                while (await self.reader.readline()) not in (
+                        b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+class LoadTest:
+    """Один прогон: подготовка, виртуальные пользователи и статистика."""
+
+    def __init__(self, base_url, collection=DEFAULT_COLLECTION,
+                 concurrency=10, duration=60.0, iterations=None,
+                 weights=None, ramp_up=0.0, think_time=0.0, timeout=30.0,
+                 seed=None):
+        url = urlsplit(base_url)
+        if url.scheme != 'http':
+            raise LoadTestError('Поддерживается только http://')
+        self.address = (url.hostname, url.port or 80, url.netloc)
+        self.requests, variables = load_collection(collection)
+        variables['baseUrl'] = f'http://{url.netloc}'
+        self.shared = ChainMap({}, variables)
+        self.weights = weights or {name: weight for name, (weight, _)
+                                   in SCENARIOS.items()}
+        unknown = set(self.weights) - set(SCENARIOS)
+        if unknown:
+            raise LoadTestError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        for _, steps in (('setup', SETUP), ('login', LOGIN),
+                         *SCENARIOS.values()):
+            for name, _ in steps:
+                if name not in self.requests:
+                    raise LoadTestError(f'В коллекции нет запроса {name}')
+        self.concurrency = concurrency
+        self.duration = duration
+        self.iterations = iterations
+        self.ramp_up = ramp_up
+        self.think_time = think_time
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.elapsed = 0.0
+
+    async def send(self, connection, name, scope):
+        """Выполняет запрос коллекции и возвращает (статус, тело, мс)."""
+        request = self.requests[name]
+        target = substitute(request['url'], scope)
+        url = urlsplit(target)
+        target = quote(url.path + (f'?{url.query}' if url.query else ''),
+                       safe=string.punctuation)
+        headers = {header: substitute(value, scope)
+                   for header, value in request['headers'].items()}
+        body = substitute(request['body'], scope).encode()
+        started = time.perf_counter()
+        try:
+            status, content = await asyncio.wait_for(
+                connection.request(request['method'], target, headers, body),
+                self.timeout)
+        except (OSError, asyncio.IncompleteReadError,
+                asyncio.TimeoutError):
+            connection.close()
+            raise
+        return status, content, (time.perf_counter() - started) * 1000
+
+    async def run_steps(self, connection, scenario, steps, scope,
+                        record=True):
+        """Шаги сценария по порядку; StepFailed на первой ошибке."""
+        for name, captures in steps:
+            key = f'{scenario} / {name}'
+            try:
+                status, content, latency = await self.send(
+                    connection, name, scope)
+            except (OSError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError) as error:
+                if record:
+                    self.statuses[key][type(error).__name__] += 1
+                raise StepFailed(f'{key}: {error!r}') from error
+            if record:
+                self.latencies[key].append(latency)
+                self.statuses[key][status] += 1
+            if status >= 400:
+                raise StepFailed(f'{key}: статус {status}: '
+                                 f'{content[:200].decode(errors="replace")}')
+            if captures:
+                data = json.loads(content)
+                for variable, path in captures.items():
+                    scope[variable] = pick(data, path)
+
+    async def setup(self):
+        """Общие данные: автор, теги, ингредиенты и рецепт."""
+        connection = Connection(*self.address)
+        new_identity(self.shared, 'secondUserEmail', 'secondUserUsername')
+        try:
+            await self.run_steps(connection, 'setup', SETUP, self.shared,
+                                 record=False)
+        except (StepFailed, LookupError, ValueError) as error:
+            raise LoadTestError(f'Подготовка не удалась: {error}') from error
+        finally:
+            connection.close()
+
+    async def virtual_user(self, number, deadline):
+        await asyncio.sleep(self.ramp_up * number / self.concurrency)
+        connection = Connection(*self.address)
+        user = self.shared.new_child()
+        scenarios = list(self.weights)
+        weights = [self.weights[name] for name in scenarios]
+        done = 0
+        while time.monotonic() < deadline and (
+                self.iterations is None or done < self.iterations):
+            if 'userToken' in user.maps[0]:
+                scenario = self.random.choices(scenarios, weights)[0]
+                steps = SCENARIOS[scenario][1]
+                scope = user.new_child()
+                done += 1
+            else:
+                scenario, steps, scope = 'login', LOGIN, user
+            if scenario in ('login', 'register'):
+                new_identity(scope, 'email', 'username')
+            try:
+                await self.run_steps(connection, scenario, steps, scope)
+            except (StepFailed, LookupError, ValueError):
+                if scenario == 'login':
+                    # Неудачный вход тоже итерация: иначе при лежащем
+                    # сервере iterations никогда не закончатся.
+                    done += 1
+            if self.think_time:
+                await asyncio.sleep(
+                    self.random.uniform(0, 2 * self.think_time))
+        connection.close()
+
+    async def run(self):
+        """Прогон целиком; возвращает сводку summary()."""
+        await self.setup()
+        started = time.monotonic()
+        deadline = started + (self.duration or float('inf'))
+        await asyncio.gather(*(self.virtual_user(number, deadline)
+                               for number in range(self.concurrency)))
+        self.elapsed = time.monotonic() - started
+        return self.summary()
+
+    def summary(self):
+        """Статистика по шагам и итог (ключ total)."""
+        steps = {key: step_summary(self.latencies[key], statuses,
+                                   self.elapsed)
+                 for key, statuses in sorted(self.statuses.items())}
+        steps['total'] = step_summary(
+            [latency for latencies in self.latencies.values()
+             for latency in latencies],
+            sum(self.statuses.values(), Counter()), self.elapsed)
+        return {
+            'elapsed': round(self.elapsed, 3),
+            'options': {
+                'concurrency': self.concurrency,
+                'duration': self.duration,
+                'iterations': self.iterations,
+                'weights': self.weights,
+            },
+            'steps': steps,
+        }
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    if not values:
+        return 0.0
+    rank = max(int(-(-percent * len(values) // 100)), 1)
+    return values[rank - 1]
+
+
+def is_error(status):
+    return not isinstance(status, int) or status >= 400
+
+
+def step_summary(latencies, statuses, elapsed):
+    latencies = sorted(latencies)
+    count = sum(statuses.values())
+    errors = sum(number for status, number in statuses.items()
+                 if is_error(status))
+    return {
+        'count': count,
+        'rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0.0,
+        **{f'p{percent}': round(percentile(latencies, percent), 2)
+           for percent in PERCENTILES},
+        'max': round(latencies[-1], 2) if latencies else 0.0,
+        'statuses': {str(status): number
+                     for status, number in sorted(statuses.items(),
+                                                  key=str)},
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Регрессии относительно базового прогона: p95 шага вырос больше
+    чем на tolerance (и не меньше MIN_REGRESSION_MS), доля ошибок
+    выросла больше ERROR_RATE_TOLERANCE, общая пропускная способность
+    упала больше чем на tolerance. Шаги, где в одном из прогонов
+    меньше MIN_COMPARED_COUNT запросов, пропускаются. Возвращает
+    список описаний.
+    """
+    regressions = []
+    for key, step in current['steps'].items():
+        base = baseline['steps'].get(key)
+        if base is None or min(step['count'],
+                               base['count']) < MIN_COMPARED_COUNT:
+            continue
+        if (step['p95'] > base['p95'] * (1 + tolerance)
+                and step['p95'] - base['p95'] >= MIN_REGRESSION_MS):
+            regressions.append(
+                f'{key}: p95 {base["p95"]:.1f} → {step["p95"]:.1f} ms')
+        if step['error_rate'] > base['error_rate'] + ERROR_RATE_TOLERANCE:
+            regressions.append(
+                f'{key}: ошибки {base["error_rate"]:.1%} → '
+                f'{step["error_rate"]:.1%}')
+    total, base = current['steps']['total'], baseline['steps']['total']
+    if total['rps'] < base['rps'] * (1 - tolerance):
+        regressions.append(
+            f'total: {base["rps"]:.1f} → {total["rps"]:.1f} запросов/с')
+    return regressions
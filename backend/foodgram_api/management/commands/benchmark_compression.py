@@ -0,0 +1,50 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management import BaseCommand
+
+from foodgram_api import compression
+from foodgram_api.renderers import ORJSONRenderer
+
+INGREDIENTS_JSON = (Path(compression.__file__).resolve().parents[1]
+                    / 'foodgram_app/management/commands/data/'
+                      'ingredients.json')
+
+
+class Command(BaseCommand):
+    """
+    Замер трафика и CPU для сжатия ответа /api/ingredients/
+    (полный каталог ingredients.json): без сжатия, gzip и brotli
+    на лету и через кеш заранее сжатых байтов.
+    """
+    help = 'Сравнивает размер и CPU для gzip/brotli и кеша сжатия.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Число повторов замера.')
+
+    def handle(self, *args, **options):
+        with open(INGREDIENTS_JSON, encoding='utf-8') as json_file:
+            catalogue = [
+                {'id': number, **ingredient}
+                for number, ingredient in enumerate(json.load(json_file), 1)
+            ]
+        content = ORJSONRenderer().render(catalogue)
+        self.stdout.write(f'{"без сжатия":>14}: {len(content):>8} байт')
+        encodings = ['gzip']
+        if compression.brotli is not None:
+            encodings.append('br')
+        for encoding in encodings:
+            for name, method in (
+                    ('на лету', compression.compress),
+                    ('из кеша', compression.compress_cached)):
+                size = len(method(content, encoding))
+                started = time.process_time()
+                for _ in range(options['repeat']):
+                    method(content, encoding)
+                elapsed = ((time.process_time() - started)
+                           / options['repeat'] * 1000)
+                self.stdout.write(
+                    f'{encoding:>5} {name:>8}: {size:>8} байт '
+                    f'({size / len(content):.0%}), {elapsed:.2f} ms CPU')
@@ -0,0 +1,109 @@
+import time
+import tracemalloc
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from foodgram_api.export import export_lines, filter_recipes
+from foodgram_app.models import Ingredient, IngredientRecipe, Recipe, Tag
+
+User = get_user_model()
+
+RecipeTag = Recipe.tags.through
+BATCH_SIZE = 10000
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+def batches(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    """
+    Замер скорости выгрузки NDJSON (export_lines) в рецептах
+    в секунду. Данные создаются во временной транзакции
+    и откатываются после замера. С --memory дополнительно
+    измеряется пиковый объём памяти через tracemalloc.
+    """
+    help = 'Измеряет скорость потоковой выгрузки рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000,
+                            help='Число рецептов.')
+        parser.add_argument('--ingredients', type=int, default=5,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--memory', action='store_true',
+                            help='Измерить пиковую память.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        started = time.monotonic()
+        author = User.objects.create_user(
+            username='benchmark_author', email='bench@example.com',
+            password='benchmark')
+        tags = [
+            Tag.objects.create(name=f'benchmark {number}',
+                               slug=f'benchmark-{number}')
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'benchmark {number}',
+                                      measurement_unit='г')
+            for number in range(options['ingredients'])
+        ]
+        for batch in batches(range(options['recipes'])):
+            Recipe.objects.bulk_create([
+                Recipe(author=author, name=f'Рецепт {number}',
+                       text='Текст ' * 50, cooking_time=10,
+                       image='foodgram_app/images/benchmark.png',
+                       short_link=f'benchmark-{number}')
+                for number in batch
+            ])
+        recipe_ids = Recipe.objects.filter(author=author).values_list(
+            'pk', flat=True)
+        for batch in batches(recipe_ids.iterator(), BATCH_SIZE // 10):
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe_id=recipe_id, tag=tag)
+                for recipe_id in batch for tag in tags
+            ])
+            IngredientRecipe.objects.bulk_create([
+                IngredientRecipe(recipe_id=recipe_id, ingredient=ingredient,
+                                 amount=1)
+                for recipe_id in batch for ingredient in ingredients
+            ])
+        self.stdout.write(
+            f'Подготовка данных: {time.monotonic() - started:.0f} s')
+
+        queryset = filter_recipes(Recipe.objects.filter(author=author))
+        if options['memory']:
+            tracemalloc.start()
+        started = time.monotonic()
+        lines = size = 0
+        for chunk in export_lines(queryset):
+            lines += chunk.count(b'\n')
+            size += len(chunk)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Выгружено {lines} рецептов, {size / 2 ** 20:.0f} MB '
+            f'за {elapsed:.1f} s: {lines / elapsed:.0f} рецептов/с')
+        if options['memory']:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(f'Пиковая память: {peak / 2 ** 20:.1f} MB')
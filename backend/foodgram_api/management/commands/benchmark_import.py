@@ -0,0 +1,78 @@
+import time
+
+import orjson
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from foodgram_api.bulk_import import BATCH_SIZE, import_recipes
+from foodgram_app.models import Ingredient, MediaFile, Tag
+
+User = get_user_model()
+
+IMAGE = 'foodgram_app/images/benchmark.png'
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+class Command(BaseCommand):
+    """
+    Замер скорости массового импорта (import_recipes) в рецептах
+    в секунду. Данные создаются во временной транзакции
+    и откатываются после замера.
+    """
+    help = 'Измеряет скорость массового импорта рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000,
+                            help='Число рецептов.')
+        parser.add_argument('--ingredients', type=int, default=5,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Рецептов в одной транзакции.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        author = User.objects.create_user(
+            username='benchmark_author', email='bench@example.com',
+            password='benchmark')
+        tag_ids = [
+            Tag.objects.create(name=f'benchmark {number}',
+                               slug=f'benchmark-{number}').pk
+            for number in range(2)
+        ]
+        ingredient_ids = [
+            Ingredient.objects.create(name=f'benchmark {number}',
+                                      measurement_unit='г').pk
+            for number in range(options['ingredients'])
+        ]
+        MediaFile.objects.create(name=IMAGE)
+        lines = [
+            orjson.dumps({
+                'name': f'Рецепт {number}',
+                'text': 'Текст ' * 50,
+                'cooking_time': 10,
+                'image': IMAGE,
+                'tags': tag_ids,
+                'ingredients': [{'id': ingredient_id, 'amount': 1}
+                                for ingredient_id in ingredient_ids],
+            })
+            for number in range(options['recipes'])
+        ]
+        started = time.monotonic()
+        result = import_recipes(lines, author, options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Импортировано {result.created} рецептов '
+            f'(ошибок: {len(result.errors)}) за {elapsed:.1f} s: '
+            f'{result.created / elapsed:.0f} рецептов/с')
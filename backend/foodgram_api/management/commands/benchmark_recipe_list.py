@@ -0,0 +1,109 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from foodgram_api.renderers import ORJSONRenderer
+from foodgram_api.representations import serialize_recipes
+from foodgram_api.serializers import RecipeSerializer
+from foodgram_app.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+)
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+class Command(BaseCommand):
+    """
+    Замер CPU на отрисовку страницы списка рецептов:
+    RecipeSerializer + JSONRenderer против serialize_recipes
+    + ORJSONRenderer. Данные создаются во временной транзакции
+    и откатываются после замера.
+    """
+    help = 'Сравнивает скорость сериализации списка рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Рецептов на странице.')
+        parser.add_argument('--ingredients', type=int, default=10,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Число повторов замера.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic(), override_settings(
+                    ALLOWED_HOSTS=['testserver']):
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        limit = options['limit']
+        reader = User.objects.create_user(
+            username='benchmark_reader', email='bench@example.com',
+            password='benchmark')
+        tags = [
+            Tag.objects.create(name=f'benchmark {number}',
+                               slug=f'benchmark-{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'benchmark {number}',
+                                      measurement_unit='г')
+            for number in range(options['ingredients'])
+        ]
+        recipes = [
+            Recipe.objects.create(
+                author=reader, name=f'Рецепт {number}', text='Текст ' * 50,
+                image='foodgram_app/images/benchmark.png', cooking_time=10)
+            for number in range(limit)
+        ]
+        for recipe in recipes:
+            recipe.tags.set(tags)
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes for ingredient in ingredients
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=reader, recipe=recipe) for recipe in recipes[::2]
+        ])
+        request = APIRequestFactory().get('/api/recipes/')
+        request.user = reader
+        recipe_ids = [recipe.id for recipe in recipes]
+
+        def drf():
+            queryset = Recipe.objects.filter(pk__in=recipe_ids)
+            return JSONRenderer().render(RecipeSerializer(
+                queryset, many=True, context={'request': request}).data)
+
+        def fast():
+            return ORJSONRenderer().render(
+                serialize_recipes(recipe_ids, request))
+
+        results = {}
+        for name, render in (('RecipeSerializer', drf), ('fast path', fast)):
+            render()
+            started = time.process_time()
+            for _ in range(options['repeat']):
+                render()
+            results[name] = (
+                (time.process_time() - started) / options['repeat'] * 1000)
+            self.stdout.write(
+                f'{name:>16}: {results[name]:.1f} ms CPU на страницу '
+                f'из {limit} рецептов')
+        speedup = results['RecipeSerializer'] / results['fast path']
+        self.stdout.write(self.style.SUCCESS(f'Ускорение: x{speedup:.1f}'))
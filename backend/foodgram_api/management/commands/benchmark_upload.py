@@ -0,0 +1,150 @@
+import base64
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import orjson
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+User = get_user_model()
+
+MODES = ('base64', 'multipart', 'raw')
+PATH = '/api/users/me/avatar/'
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+def current_rss():
+    """Текущий RSS процесса в байтах (Linux, /proc/self/statm)."""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class RSSSampler(threading.Thread):
+    """Раз в миллисекунду запоминает максимальный RSS процесса."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss()
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.peak = max(self.peak, current_rss())
+            time.sleep(0.001)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return self.peak
+
+
+def noise_png(path, size):
+    """PNG из случайных пикселей: почти не сжимается, ~size байт."""
+    side = int((size / 3) ** 0.5)
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        path, 'PNG', compress_level=1)
+
+
+def build_request(mode, image):
+    """Запрос на замену аватара; тело собирается до замера."""
+    factory = APIRequestFactory()
+    if mode == 'base64':
+        body = orjson.dumps({'avatar': 'data:image/png;base64,'
+                             + base64.b64encode(image).decode()})
+        return factory.put(PATH, body, content_type='application/json')
+    if mode == 'multipart':
+        return factory.put(PATH, {
+            'avatar': SimpleUploadedFile('avatar.png', image, 'image/png'),
+        }, format='multipart')
+    return factory.put(PATH, image, content_type='image/png')
+
+
+class Command(BaseCommand):
+    """
+    Сравнение пикового RSS воркера при загрузке аватара размером
+    --size-mb тремя способами: base64 в JSON, multipart/form-data
+    и «сырым» телом image/png. Каждый способ замеряется в отдельном
+    процессе: тело запроса собирается до замера, прирост RSS
+    считается относительно процесса с уже готовым телом.
+    Строки в базе откатываются, файлы пишутся во временный каталог.
+    Только для Linux (RSS читается из /proc).
+    """
+    help = 'Измеряет пиковую память при загрузке большого изображения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=20,
+                            help='Размер изображения в MB.')
+        parser.add_argument('--mode', choices=MODES,
+                            help='Замерить один способ в этом процессе.')
+        parser.add_argument('--image', help='Готовый файл изображения.')
+
+    def handle(self, *args, **options):
+        if options['mode']:
+            self.stdout.write(json.dumps(self.measure(
+                options['mode'], options['image'])))
+            return
+        with tempfile.TemporaryDirectory() as directory:
+            image = os.path.join(directory, 'image.png')
+            noise_png(image, options['size_mb'] * 2 ** 20)
+            self.stdout.write(
+                f'Изображение: {os.path.getsize(image) / 2 ** 20:.1f} MB')
+            for mode in MODES:
+                result = subprocess.run(
+                    [sys.executable, 'manage.py', 'benchmark_upload',
+                     '--mode', mode, '--image', image],
+                    cwd=settings.BASE_DIR, capture_output=True, check=True,
+                    text=True)
+                stats = json.loads(result.stdout)
+                self.stdout.write(
+                    f'{mode:>9}: тело {stats["body"] / 2 ** 20:.1f} MB, '
+                    f'статус {stats["status"]}, '
+                    f'прирост RSS {stats["rss"] / 2 ** 20:.1f} MB, '
+                    f'{stats["seconds"]:.2f} s')
+
+    def measure(self, mode, path):
+        with open(path, 'rb') as image_file:
+            image = image_file.read()
+        request = build_request(mode, image)
+        body = int(request.META['CONTENT_LENGTH'])
+        del image
+        match = resolve(PATH)
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root,
+                                  ALLOWED_HOSTS=['testserver']):
+            try:
+                with transaction.atomic():
+                    user = User.objects.create_user(
+                        username='benchmark_upload',
+                        email='upload@example.com', password='benchmark')
+                    force_authenticate(request, user=user)
+                    gc.collect()
+                    baseline = current_rss()
+                    sampler = RSSSampler()
+                    sampler.start()
+                    started = time.monotonic()
+                    response = match.func(request, *match.args,
+                                          **match.kwargs)
+                    seconds = time.monotonic() - started
+                    peak = sampler.stop()
+                    raise Rollback
+            except Rollback:
+                pass
+        return {'body': body, 'status': response.status_code,
+                'rss': peak - baseline, 'seconds': seconds}
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management import BaseCommand, CommandError
+
+from foodgram_api.export import (
+    export_lines,
+    filter_recipes,
+    parse_updated_since,
+)
+from foodgram_app.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Выгрузка каталога рецептов в NDJSON — то же, что
+    api/recipes/export.ndjson/, но без HTTP. Ссылки на изображения
+    выводятся относительными (MEDIA_URL).
+    """
+    help = 'Выгружает рецепты в NDJSON, по одному на строку.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--author', type=int,
+                            help='Только рецепты автора с этим id.')
+        parser.add_argument('--tag', action='append', default=[],
+                            help='Slug тега, можно указать несколько раз.')
+        parser.add_argument('--updated-since',
+                            help='Только изменённые с этой даты (ISO 8601).')
+
+    def handle(self, *args, **options):
+        try:
+            updated_since = (parse_updated_since(options['updated_since'])
+                             if options['updated_since'] else None)
+        except ValueError:
+            raise CommandError('--updated-since: ожидается дата ISO 8601.')
+        queryset = filter_recipes(Recipe.objects.all(), options['author'],
+                                  options['tag'], updated_since)
+        if options['output'] == '-':
+            self.write(sys.stdout.buffer, queryset)
+        else:
+            with open(options['output'], 'wb') as output:
+                self.write(output, queryset)
+
+    def write(self, output, queryset):
+        for lines in export_lines(queryset):
+            output.write(lines)
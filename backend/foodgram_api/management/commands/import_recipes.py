@@ -0,0 +1,45 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from foodgram_api.bulk_import import BATCH_SIZE, import_recipes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Массовый импорт рецептов из NDJSON — то же, что
+    api/recipes/import/, но без HTTP. Формат строк описан
+    в foodgram_api.bulk_import; изображения должны быть уже
+    загружены в медиахранилище.
+    """
+    help = 'Импортирует рецепты из NDJSON, по одному на строку.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default='-',
+                            help='Файл NDJSON, по умолчанию stdin.')
+        parser.add_argument('--author', type=int,
+                            help='id автора записей без поля author.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Рецептов в одной транзакции.')
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author'] is not None:
+            author = User.objects.filter(pk=options['author']).first()
+            if author is None:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден.')
+        if options['input'] == '-':
+            result = import_recipes(sys.stdin.buffer, author,
+                                    options['batch_size'])
+        else:
+            with open(options['input'], 'rb') as lines:
+                result = import_recipes(lines, author, options['batch_size'])
+        for error in result.errors:
+            self.stderr.write(f'Строка {error["line"]}: {error["errors"]}')
+        self.stdout.write(
+            f'Создано рецептов: {result.created}, '
+            f'ошибок: {len(result.errors)}.')
@@ -0,0 +1,135 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+from django.core.management import BaseCommand, CommandError
+
+from foodgram_api.load_test import (
+    DEFAULT_COLLECTION,
+    PERCENTILES,
+    SCENARIOS,
+    LoadTest,
+    LoadTestError,
+    compare,
+)
+
+STEP_WIDTH = 64
+
+
+def parse_weights(value):
+    """«browse=6,cook=2» → {'browse': 6, 'cook': 2}."""
+    weights = {}
+    for pair in value.split(','):
+        name, _, weight = pair.partition('=')
+        try:
+            weights[name.strip()] = float(weight)
+        except ValueError:
+            raise CommandError(f'Неверный вес сценария: {pair}') from None
+    return weights
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочный прогон запущенного стека (gunicorn или nginx)
+    сценариями из postman-коллекции (см. foodgram_api.load_test).
+    Печатает по каждому шагу число запросов, запросы в секунду,
+    долю ошибок и перцентили задержки. --save-baseline сохраняет
+    сводку в JSON, --baseline сравнивает прогон с сохранённой
+    и завершается ошибкой при регрессии.
+    """
+    help = 'Нагрузочное тестирование API по сценариям postman-коллекции.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                            help='Адрес стека, только http://.')
+        parser.add_argument('--collection', default=str(DEFAULT_COLLECTION),
+                            help='Файл postman-коллекции.')
+        parser.add_argument('--concurrency', type=int, default=10,
+                            help='Число виртуальных пользователей.')
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Длительность прогона в секундах '
+                                 '(0 — без ограничения, нужен --iterations).')
+        parser.add_argument('--iterations', type=int,
+                            help='Сценариев на пользователя.')
+        parser.add_argument('--ramp-up', type=float, default=0,
+                            help='За сколько секунд стартуют все '
+                                 'пользователи.')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Средняя пауза между сценариями, секунды.')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Таймаут одного запроса, секунды.')
+        parser.add_argument('--weights', type=parse_weights,
+                            help='Веса сценариев: ' + ','.join(
+                                f'{name}={weight}' for name, (weight, _)
+                                in SCENARIOS.items()) + ' по умолчанию.')
+        parser.add_argument('--seed', type=int,
+                            help='Зерно выбора сценариев.')
+        parser.add_argument('--save-baseline',
+                            help='Сохранить сводку в этот файл.')
+        parser.add_argument('--baseline',
+                            help='Сравнить с сохранённой сводкой.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое ухудшение p95 и пропускной '
+                                 'способности, доля.')
+
+    def handle(self, *args, **options):
+        if not options['duration'] and not options['iterations']:
+            raise CommandError('Нужен --duration или --iterations.')
+        try:
+            load_test = LoadTest(
+                options['base_url'], options['collection'],
+                concurrency=options['concurrency'],
+                duration=options['duration'],
+                iterations=options['iterations'],
+                weights=options['weights'], ramp_up=options['ramp_up'],
+                think_time=options['think_time'],
+                timeout=options['timeout'], seed=options['seed'])
+            summary = asyncio.run(load_test.run())
+        except (LoadTestError, OSError) as error:
+            raise CommandError(error)
+        summary['created'] = datetime.now(timezone.utc).isoformat()
+        self.report(summary)
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w',
+                      encoding='utf-8') as target:
+                json.dump(summary, target, ensure_ascii=False, indent=2)
+            self.stdout.write(
+                f'Сводка сохранена в {options["save_baseline"]}.')
+        if options['baseline']:
+            self.compare(summary, options['baseline'], options['tolerance'])
+
+    def report(self, summary):
+        self.stdout.write(
+            f'{"Шаг":<{STEP_WIDTH}} {"запр.":>7} {"rps":>8} '
+            f'{"ошибки":>7} '
+            + ' '.join(f'{f"p{percent}":>8}' for percent in PERCENTILES)
+            + f' {"макс.":>8}  (ms)')
+        for key, step in summary['steps'].items():
+            if len(key) > STEP_WIDTH:
+                key = key[:STEP_WIDTH - 1] + '…'
+            line = (f'{key:<{STEP_WIDTH}} {step["count"]:>7} '
+                    f'{step["rps"]:>8.1f} {step["error_rate"]:>7.1%} '
+                    + ' '.join(f'{step[f"p{percent}"]:>8.1f}'
+                               for percent in PERCENTILES)
+                    + f' {step["max"]:>8.1f}')
+            if step['errors']:
+                line += '  ' + ', '.join(
+                    f'{status}: {number}'
+                    for status, number in step['statuses'].items())
+            self.stdout.write(line)
+        self.stdout.write(f'Длительность: {summary["elapsed"]:.1f} s')
+
+    def compare(self, summary, path, tolerance):
+        with open(path, encoding='utf-8') as source:
+            baseline = json.load(source)
+        if baseline['options'] != summary['options']:
+            self.stdout.write(self.style.WARNING(
+                'Параметры базового прогона отличаются: '
+                f'{baseline["options"]}'))
+        regressions = compare(summary, baseline, tolerance)
+        if regressions:
+            raise CommandError('Регрессия относительно '
+                               f'{path} ({baseline.get("created")}):\n'
+                               + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f'Регрессий относительно {path} нет.'))
@@ -0,0 +1,269 @@
+"""
+Профилирование отдельных запросов с сохранением флеймграфов.
+
+ProfilingMiddleware включается для запроса, если:
+- staff-пользователь передал заголовок X-Profile: 1 или параметр
+  ?profile=1 (пользователь берётся из сессии или токена);
+- или запрос попал в случайную выборку с долей
+  PROFILING_SAMPLE_RATE (0 — выборка выключена).
+
+Остальные запросы проходят без профилировщика: проверяются только
+заголовок, строка запроса и одно случайное число.
+
+Профилировщик выборочный: отдельный поток раз в PROFILING_INTERVAL
+секунд читает стек потока запроса (sys._current_frames), поэтому
+накладные расходы не зависят от числа вызовов функций. Снимается
+всё, что ниже middleware: DRF, сериализаторы, ORM и драйвер базы.
+Тело потокового ответа отдаётся уже после замера и в него не входит.
+
+Каждый снимок — три файла в PROFILING_DIR с общим id:
+<id>.meta.json (запрос, статус, длительность), <id>.collapsed
+(свёрнутые стеки для flamegraph.pl / speedscope) и <id>.speedscope.json.
+В каталоге хранится не больше PROFILING_MAX_CAPTURES снимков,
+самые старые удаляются. Список и файлы отдаёт api/profiles/ (staff).
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+META_SUFFIX = '.meta.json'
+FORMATS = {
+    'speedscope': ('.speedscope.json', 'application/json'),
+    'collapsed': ('.collapsed', 'text/plain; charset=utf-8'),
+}
+
+
+class Sampler(threading.Thread):
+    """
+    Снимает стек потока thread_id раз в interval секунд.
+    samples — список (индексы кадров от корня, вес в секундах),
+    frames — описания кадров (имя, файл, строка).
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = []
+        self.frames = []
+        self.indexes = {}
+
+    def frame_index(self, code):
+        index = self.indexes.get(code)
+        if index is None:
+            index = self.indexes[code] = len(self.frames)
+            self.frames.append((code.co_name, short_path(code.co_filename),
+                                code.co_firstlineno))
+        return index
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_index(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.samples.append((tuple(stack), now - last))
+            last = now
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def short_path(filename):
+    """Путь к файлу относительно самого длинного подходящего sys.path."""
+    best = ''
+    for entry in sys.path:
+        if (entry and len(entry) > len(best)
+                and filename.startswith(entry.rstrip(os.sep) + os.sep)):
+            best = entry.rstrip(os.sep) + os.sep
+    return filename[len(best):]
+
+
+def frame_label(frame):
+    name, path, line = frame
+    # «;» разделяет кадры в свёрнутом формате.
+    return f'{name} ({path}:{line})'.replace(';', ':')
+
+
+def collapsed_stacks(sampler):
+    """Строки «кадр;кадр;кадр число_выборок», самые частые первыми."""
+    labels = [frame_label(frame) for frame in sampler.frames]
+    counts = Counter(stack for stack, _ in sampler.samples)
+    return ''.join(
+        ';'.join(labels[index] for index in stack) + f' {count}\n'
+        for stack, count in counts.most_common())
+
+
+def speedscope_profile(sampler, name, duration):
+    """Профиль в формате speedscope (type: sampled)."""
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'foodgram',
+        'activeProfileIndex': 0,
+        'shared': {'frames': [
+            {'name': frame_name, 'file': path, 'line': line}
+            for frame_name, path, line in sampler.frames
+        ]},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': duration,
+            'samples': [list(stack) for stack, _ in sampler.samples],
+            'weights': [weight for _, weight in sampler.samples],
+        }],
+    }
+
+
+def staff_user(request):
+    """Пользователь из сессии или токена, если он staff, иначе None."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            user, _ = TokenAuthentication().authenticate(request) or (
+                None, None)
+        except AuthenticationFailed:
+            return None
+    return user if user is not None and user.is_staff else None
+
+
+def profile_trigger(request):
+    """
+    Причина профилирования запроса: 'staff', 'sampled' или None.
+    Без флага и выборки — одна проверка заголовка и строки запроса.
+    """
+    if (request.META.get(PROFILE_HEADER) == '1'
+            or (PROFILE_PARAM + '=' in request.META.get('QUERY_STRING', '')
+                and request.GET.get(PROFILE_PARAM) == '1')):
+        if staff_user(request) is not None:
+            return 'staff'
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+def capture_id():
+    """Id снимка: время UTC (сортируется по порядку) и случайный суффикс."""
+    return (datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+            + '-' + uuid.uuid4().hex[:8])
+
+
+def capture_path(capture, suffix):
+    return os.path.join(settings.PROFILING_DIR, capture + suffix)
+
+
+def write_file(path, content):
+    """Запись через временный файл: читатели не видят половину файла."""
+    temporary = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as target:
+        target.write(content)
+    os.replace(temporary, path)
+
+
+def list_captures():
+    """Метаданные сохранённых снимков, новые первыми."""
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(META_SUFFIX):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as meta:
+                captures.append(json.load(meta))
+        except (OSError, ValueError):
+            continue
+    return captures
+
+
+def prune_captures(limit):
+    """Удаляет самые старые снимки сверх limit."""
+    directory = settings.PROFILING_DIR
+    captures = sorted(name[:-len(META_SUFFIX)]
+                      for name in os.listdir(directory)
+                      if name.endswith(META_SUFFIX))
+    for capture in captures[:max(len(captures) - limit, 0)]:
+        for suffix in (META_SUFFIX, *(
+                suffix for suffix, _ in FORMATS.values())):
+            try:
+                os.remove(capture_path(capture, suffix))
+            except FileNotFoundError:
+                pass
+
+
+def save_capture(sampler, meta):
+    """Сохраняет снимок и возвращает его id."""
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    capture = meta['id'] = capture_id()
+    name = (f'{meta["method"]} {meta["path"]} {meta["status"]} '
+            f'{meta["duration_ms"]} ms')
+    write_file(capture_path(capture, FORMATS['collapsed'][0]),
+               collapsed_stacks(sampler))
+    write_file(capture_path(capture, FORMATS['speedscope'][0]),
+               json.dumps(speedscope_profile(
+                   sampler, name, meta['duration_ms'] / 1000)))
+    # Метаданные пишутся последними: снимок появляется в списке,
+    # только когда оба файла профиля уже на диске.
+    write_file(capture_path(capture, META_SUFFIX),
+               json.dumps(meta, ensure_ascii=False))
+    prune_captures(settings.PROFILING_MAX_CAPTURES)
+    return capture
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запросы по флагу staff или случайной выборке
+    и добавляет в ответ заголовок X-Profile-Id с id снимка.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = profile_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        sampler = Sampler(threading.get_ident(),
+                          settings.PROFILING_INTERVAL)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        duration = time.perf_counter() - started
+        user = getattr(request, 'user', None)
+        response['X-Profile-Id'] = save_capture(sampler, {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'samples': len(sampler.samples),
+            'trigger': trigger,
+            'user': user.pk if user is not None else None,
+        })
+        return response
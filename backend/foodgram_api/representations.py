@@ -0,0 +1,129 @@
+"""
+Быстрое представление списков рецептов только для чтения.
+
+Даёт ту же структуру JSON, что и RecipeSerializer, но строит её
+из values()-строк и заранее собранных словарей: вместо вложенных
+сериализаторов и Field.to_representation на каждый объект —
+фиксированное число запросов на страницу и простые словари.
+Равенство результата с RecipeSerializer проверяется тестами
+(foodgram_api/tests.py), поэтому любые изменения полей
+RecipeSerializer нужно повторять здесь.
+Параметры ?fields=, ?omit= и ?view= учитываются так же, как
+в RecipeSerializer: для пропущенных полей запросы не выполняются.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+
+from foodgram_app.interactions import interactions_for
+from foodgram_app.models import IngredientRecipe, Recipe
+
+from .serializers import RecipeSerializer
+from .sparse_fields import RECIPE_PRESETS, select_fields
+
+User = get_user_model()
+
+RecipeTag = Recipe.tags.through
+
+
+def file_url(name, request):
+    """URL файла так же, как его строит DRF FileField."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def serialize_recipes(recipe_ids, request, required=()):
+    """
+    Список рецептов в формате RecipeSerializer, в порядке recipe_ids.
+    Поля required выводятся независимо от ?fields= и ?omit=.
+    Выполняет не более семи запросов независимо от числа рецептов
+    (три из них — загрузка снимка interactions, обычно из кеша).
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return []
+    selected = select_fields(request, RecipeSerializer.Meta.fields,
+                             RECIPE_PRESETS)
+    fields = [name for name in RecipeSerializer.Meta.fields
+              if name in selected or name in required]
+    columns = ['id'] + [
+        name for name in ('author', 'name', 'image', 'text', 'cooking_time')
+        if name in fields
+    ]
+    recipes = {
+        row['id']: row for row in Recipe.objects.filter(
+            pk__in=recipe_ids).order_by().values(*columns)
+    }
+    values = {
+        'id': lambda recipe: recipe['id'],
+        'name': lambda recipe: recipe['name'],
+        'image': lambda recipe: file_url(recipe['image'], request),
+        'text': lambda recipe: recipe['text'],
+        'cooking_time': lambda recipe: recipe['cooking_time'],
+    }
+
+    if 'tags' in fields:
+        tags = defaultdict(list)
+        for recipe_id, tag_id, name, slug in (
+                RecipeTag.objects
+                .filter(recipe__in=recipe_ids)
+                .order_by('tag__name')
+                .values_list('recipe', 'tag', 'tag__name', 'tag__slug')):
+            tags[recipe_id].append(
+                {'id': tag_id, 'name': name, 'slug': slug})
+        values['tags'] = lambda recipe: tags[recipe['id']]
+
+    if 'ingredients' in fields:
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, name, unit, amount in (
+                IngredientRecipe.objects
+                .filter(recipe__in=recipe_ids)
+                .order_by('pk')
+                .values_list('recipe', 'ingredient', 'ingredient__name',
+                             'ingredient__measurement_unit', 'amount')):
+            ingredients[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+        values['ingredients'] = lambda recipe: ingredients[recipe['id']]
+
+    if 'author' in fields:
+        author_ids = {recipe['author'] for recipe in recipes.values()}
+        authors = {
+            author['id']: {
+                'id': author['id'],
+                'email': author['email'],
+                'username': author['username'],
+                'first_name': author['first_name'],
+                'last_name': author['last_name'],
+                'is_subscribed': interactions_for(request).is_subscribed(
+                    author['id']),
+                'avatar': file_url(author['avatar'], request),
+            }
+            for author in User.objects.filter(
+                pk__in=author_ids).order_by().values(
+                'id', 'email', 'username', 'first_name', 'last_name',
+                'avatar')
+        }
+        values['author'] = lambda recipe: authors[recipe['author']]
+
+    if 'is_favorited' in fields:
+        favorites = interactions_for(request).favorites
+        values['is_favorited'] = lambda recipe: recipe['id'] in favorites
+
+    if 'is_in_shopping_cart' in fields:
+        cart = interactions_for(request).cart
+        values['is_in_shopping_cart'] = lambda recipe: recipe['id'] in cart
+
+    getters = [(name, values[name]) for name in fields]
+    return [
+        {name: getter(recipes[recipe_id]) for name, getter in getters}
+        for recipe_id in recipe_ids if recipe_id in recipes
+    ]
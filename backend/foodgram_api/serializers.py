@@ -10,15 +10,27 @@ from drf_extra_fields.fields import Base64ImageField
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import (
+    Count,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    prefetch_related_objects,
+)
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 from rest_framework.validators import UniqueTogetherValidator
 
-from foodgram_app.constants import MIN_AMOUNT
+from foodgram_app.constants import MAX_AMOUNT, MIN_AMOUNT
+from foodgram_app.interactions import interactions_for
 from foodgram_app.models import Ingredient, IngredientRecipe, Recipe, Tag
+from foodgram_app.signals import recipe_ingredients_changed
 from foodgram_users.models import Follow
 
+from .sparse_fields import RECIPE_PRESETS, SparseFieldsMixin, select_fields
+from .uploads import ImageUploadField
+
 User = get_user_model()
 
 
@@ -48,7 +60,7 @@ class RegistrationUserSerializer(serializers.ModelSerializer):
 
 class UserAvatarSerializer(serializers.ModelSerializer):
     """Сериализатор для работы с аватаром."""
-    avatar = Base64ImageField(required=True)
+    avatar = ImageUploadField(required=True)
 
     class Meta:
         model = User
@@ -60,7 +72,7 @@ class UserAvatarSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализатор для просмотра и редактирования данных пользователя.
     Используемые адреса:
@@ -68,6 +80,7 @@ class UserDetailSerializer(serializers.ModelSerializer):
         Регистрация пользователя         /users/         POST
         Профиль текущего пользователя    /users/me/      GET/PUT/PATCH
         Отдельный пользователь           /users/{id}/    GET/PUT/PATCH/DELETE
+    Поддерживает ?fields= и ?omit= (см. sparse_fields).
     """
     is_subscribed = SerializerMethodField(read_only=True)
 
@@ -86,12 +99,8 @@ class UserDetailSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Возвращает True если пользователь подписан на автора."""
-        request = self.context.get('request')
-        return (
-            request
-            and not request.user.is_anonymous
-            and request.user.subscriptions.filter(author=obj).exists()
-        )
+        return interactions_for(
+            self.context.get('request')).is_subscribed(obj.pk)
 
 
 class FollowSerializer(UserDetailSerializer):
@@ -113,27 +122,39 @@ class FollowSerializer(UserDetailSerializer):
             'recipes'
         ]
 
+    @staticmethod
+    def annotate(users):
+        """Авторы с числом рецептов, посчитанным в том же запросе."""
+        return users.annotate(recipes_count=Count('recipes', distinct=True))
+
+    @staticmethod
+    def prefetch_recipes(authors, request):
+        """
+        Загружает рецепты авторов одним запросом. Параметр recipes_limit
+        ограничивает число рецептов каждого автора подзапросом.
+        """
+        if not select_fields(request, ['recipes']):
+            return
+        recipes = Recipe.objects.only('id', 'author', 'name', 'image',
+                                      'cooking_time')
+        limit = request.query_params.get('recipes_limit', '')
+        if limit.isdigit():
+            recipes = recipes.filter(pk__in=Subquery(Recipe.objects.filter(
+                author=OuterRef('author')).values('pk')[:int(limit)]))
+        prefetch_related_objects(authors, Prefetch('recipes', recipes))
+
     def get_recipes(self, obj):
-        """Возвращает сериализованные данные о рецептах автора.
-        Параметр recipes_limit использовуется, для ограничения
-        количества рецептов.
         """
-        recipes_author = obj.recipes.all()
-        request = self.context.get('request')
-        if request is not None:
-            limit_param = request.query_params.get('recipes_limit')
-            if limit_param:
-                try:
-                    limit = int(limit_param)
-                    recipes_author = recipes_author[:limit]
-                except ValueError:
-                    pass
-        return ListRecipeSerializer(recipes_author, many=True,
-                                    context={'request': request}).data
+        Возвращает сериализованные данные о рецептах автора,
+        загруженных prefetch_recipes.
+        """
+        return ListRecipeSerializer(
+            obj.recipes.all(), many=True,
+            context={'request': self.context.get('request')}).data
 
     def get_recipes_count(self, obj):
-        """Определяет количество рецептов автора на которого подписан"""
-        return obj.recipes.count()
+        """Количество рецептов автора из аннотации annotate."""
+        return obj.recipes_count
 
 
 class SubscribeCreateSerializer(serializers.ModelSerializer):
@@ -209,16 +230,37 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientCreateRecipeSerializer(serializers.Serializer):
     """
     Сериализатор промежуточной модели, связывающей рецепт и ингредиент
-    и указывающей количество ингредиентов в рецепте.
+    и указывающей количество ингредиентов в рецепте. id проверяются
+    одним запросом в CreateRecipeSerializer.validate_ingredients.
     """
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
-    amount = serializers.IntegerField(min_value=MIN_AMOUNT)
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=MIN_AMOUNT,
+                                      max_value=MAX_AMOUNT)
 
     class Meta:
         model = IngredientRecipe
         fields = ['id', 'amount']
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """
+    Список первичных ключей, объекты которого загружаются одним
+    запросом, а не запросом на каждый ключ. Неизвестные и неверные
+    ключи проверяет child_relation с его обычными ошибками.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        objects = self.child_relation.get_queryset().in_bulk(
+            {pk for pk in data if type(pk) is int})
+        return [objects[pk] if type(pk) is int and pk in objects
+                else self.child_relation.to_internal_value(pk)
+                for pk in data]
+
+
 class IngredientRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор промежуточной модели, связывающей рецепт и ингредиент
@@ -239,12 +281,12 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientCreateRecipeSerializer(
         many=True,
     )
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True,
+    tags = BulkManyRelatedField(
+        child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=Tag.objects.all()),
     )
     author = UserDetailSerializer(read_only=True)
-    image = Base64ImageField(required=False, allow_null=False)
+    image = ImageUploadField(required=False, allow_null=False)
 
     class Meta:
         model = Recipe
@@ -263,6 +305,21 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def validate_ingredients(self, value):
+        """Заменяет id ингредиентов объектами, загруженными одним запросом."""
+        ingredients = Ingredient.objects.in_bulk(
+            {item['id'] for item in value})
+        if len(ingredients) < len({item['id'] for item in value}):
+            # Ошибки по элементам, как у PrimaryKeyRelatedField.
+            message = (serializers.PrimaryKeyRelatedField
+                       .default_error_messages['does_not_exist'])
+            raise ValidationError([
+                {} if item['id'] in ingredients
+                else {'id': [message.format(pk_value=item['id'])]}
+                for item in value
+            ])
+        return [{**item, 'id': ingredients[item['id']]} for item in value]
+
     def validate(self, data):
         """
         Валидация полей (проверка ingredients, tags).
@@ -319,6 +376,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients_data, recipe)
+        recipe_ingredients_changed.send(sender=Recipe, recipe=recipe)
         return recipe
 
     @transaction.atomic
@@ -328,23 +386,41 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         """
         tags = validated_data.pop('tags', None)
         ingredients_data = validated_data.pop('ingredients', None)
+        old_ingredient_ids = list(
+            instance.ingredient_recipe.values_list('ingredient', flat=True))
         instance = super().update(instance, validated_data)
         instance.tags.set(tags)
         instance.ingredients.clear()
         self.create_ingredients(ingredients_data, instance)
+        recipe_ingredients_changed.send(
+            sender=Recipe, recipe=instance,
+            old_ingredient_ids=old_ingredient_ids)
         return instance
 
     def to_representation(self, instance):
         """Для отображения используем детализированный сериализатор."""
+        prefetch_related_objects(
+            [instance], 'tags', 'ingredient_recipe__ingredient')
         return RecipeSerializer(instance, context=self.context).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(serializers.ModelSerializer):
+    """Замена изображения рецепта (api/recipes/{id}/image/)."""
+    image = ImageUploadField(required=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Сериализатор для детального представления рецептов в API.
     Включает связанные теги, автора, ингредиенты, а также поля проверки,
     находится ли рецепт в избранном пользователя или в корзине.
+    Поддерживает ?fields=, ?omit= и ?view=card (см. sparse_fields).
     """
+    field_presets = RECIPE_PRESETS
     tags = TagSerializer(read_only=True, many=True,)
     author = UserDetailSerializer(read_only=True)
     image = Base64ImageField(required=True)
@@ -365,23 +441,38 @@ class RecipeSerializer(serializers.ModelSerializer):
         Проверяет, есть ли рецепт в избранном у пользователя.
         Возвращает True/False.
         """
-        request = self.context.get('request')
-        return (
-            request
-            and not request.user.is_anonymous
-            and request.user.favorite_recipes.filter(recipe=obj).exists()
-        )
+        return interactions_for(
+            self.context.get('request')).is_favorited(obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
         """
         Проверяем, есть ли рецепт в корзине.
         """
-        request = self.context.get('request')
-        return (
-            request
-            and not request.user.is_anonymous
-            and request.user.shoppingcart_recipes.filter(recipe=obj).exists()
-        )
+        return interactions_for(
+            self.context.get('request')).is_in_shopping_cart(obj.pk)
+
+
+class IngredientMatchRecipeSerializer(RecipeSerializer):
+    """
+    Рецепт в выдаче поиска по ингредиентам: к детальному представлению
+    добавляются число совпавших и недостающих ингредиентов.
+    Ожидает в контексте matches = {recipe_id: (совпало, не хватает)}.
+    """
+    matched_ingredients = serializers.SerializerMethodField()
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + [
+            'matched_ingredients', 'missing_ingredients'
+        ]
+
+    def get_matched_ingredients(self, obj):
+        """Сколько ингредиентов рецепта есть у пользователя."""
+        return self.context['matches'][obj.id][0]
+
+    def get_missing_ingredients(self, obj):
+        """Сколько ингредиентов рецепта придётся докупить."""
+        return self.context['matches'][obj.id][1]
 
 
 class ListRecipeSerializer(serializers.ModelSerializer):
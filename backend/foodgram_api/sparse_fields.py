@@ -0,0 +1,72 @@
+"""
+Выборочные поля в ответах API (sparse fieldsets).
+
+Параметры запроса:
+    ?fields=id,name   — вернуть только перечисленные поля;
+    ?omit=text        — убрать перечисленные поля;
+    ?view=card        — готовый набор полей из field_presets.
+Параметры действуют только на поля верхнего уровня и только
+для безопасных методов. Неизвестные имена полей игнорируются.
+Пропущенные поля не вычисляются вовсе, поэтому связанные с ними
+запросы к базе тоже не выполняются.
+"""
+from rest_framework import permissions
+from rest_framework.serializers import ListSerializer
+
+RECIPE_CARD_FIELDS = (
+    'id', 'tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+    'name', 'image', 'cooking_time',
+)
+RECIPE_PRESETS = {'card': RECIPE_CARD_FIELDS}
+
+
+def query_params(request):
+    """Параметры запроса для DRF Request и обычного HttpRequest."""
+    return getattr(request, 'query_params', request.GET)
+
+
+def split_param(request, name):
+    """Значение параметра-списка через запятую как множество."""
+    value = query_params(request).get(name, '')
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def select_fields(request, field_names, presets=None):
+    """
+    Имена полей из field_names, оставшиеся после ?view=, ?fields=
+    и ?omit=, в исходном порядке.
+    """
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return list(field_names)
+    selected = set(field_names)
+    preset = (presets or {}).get(query_params(request).get('view'))
+    if preset is not None:
+        selected &= set(preset)
+    only = split_param(request, 'fields')
+    if only:
+        selected &= only
+    selected -= split_param(request, 'omit')
+    return [name for name in field_names if name in selected]
+
+
+class SparseFieldsMixin:
+    """
+    Миксин сериализатора: оставляет поля по параметрам запроса.
+    Вложенные сериализаторы (например, автор в рецепте)
+    не затрагиваются.
+    """
+    field_presets = {}
+
+    def is_top_level(self):
+        """Сериализатор корневой или элемент корневого many=True."""
+        return self.parent is None or (
+            isinstance(self.parent, ListSerializer)
+            and self.parent.parent is None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_top_level():
+            return fields
+        selected = select_fields(self.context.get('request'), list(fields),
+                                 self.field_presets)
+        return {name: fields[name] for name in selected}
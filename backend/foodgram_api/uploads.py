@@ -0,0 +1,111 @@
+"""
+Загрузка изображений без base64: multipart/form-data и «сырое» тело
+с Content-Type: image/* (PUT api/recipes/{id}/image/,
+PUT api/users/me/avatar/, а multipart — и при создании рецепта).
+
+Тело читается потоком обработчиками загрузки Django
+(FILE_UPLOAD_HANDLERS): небольшие файлы остаются в памяти,
+большие пишутся во временный файл. Парсеры API (MultiPartParser
+и ImageUploadParser этого модуля) ставят первым MaxSizeUploadHandler:
+он прерывает загрузку с ответом 413, как только получено больше
+IMAGE_UPLOAD_MAX_SIZE байт, не дочитывая тело. Вне API (админка)
+обработчик не используется: исключение DRF там дало бы ответ 500.
+Base64 в JSON принимается, как и раньше (ImageUploadField).
+"""
+import mimetypes
+
+from drf_extra_fields.fields import Base64ImageField
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import parsers, serializers
+from rest_framework.exceptions import APIException
+
+RAW_FILE_FIELD = 'file'
+DATA_URI_HEADER = 64
+
+
+class UploadTooLarge(APIException):
+    status_code = 413
+    default_detail = 'Файл слишком большой.'
+    default_code = 'upload_too_large'
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """
+    Считает байты каждого загружаемого файла и прерывает загрузку,
+    как только файл превысил IMAGE_UPLOAD_MAX_SIZE.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        # Сырое тело (boundary is None) целиком является файлом:
+        # слишком большой Content-Length отклоняем сразу.
+        if (boundary is None and content_length
+                and content_length > settings.IMAGE_UPLOAD_MAX_SIZE):
+            raise UploadTooLarge()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise UploadTooLarge()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def limit_upload_size(parser_context):
+    """Ставит MaxSizeUploadHandler первым обработчиком загрузки запроса."""
+    request = parser_context['request']
+    if not any(isinstance(handler, MaxSizeUploadHandler)
+               for handler in request.upload_handlers):
+        request.upload_handlers.insert(0, MaxSizeUploadHandler(request))
+
+
+class MultiPartParser(parsers.MultiPartParser):
+    """multipart/form-data с ограничением размера файлов."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        limit_upload_size(parser_context)
+        return super().parse(stream, media_type, parser_context)
+
+
+class ImageUploadParser(parsers.FileUploadParser):
+    """
+    Тело запроса — само изображение с ограничением размера. Имя файла
+    необязательно: без Content-Disposition оно строится по Content-Type.
+    """
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        limit_upload_size(parser_context)
+        return super().parse(stream, media_type, parser_context)
+
+    def get_filename(self, stream, media_type, parser_context):
+        return (super().get_filename(stream, media_type, parser_context)
+                or 'upload' + (mimetypes.guess_extension(media_type) or ''))
+
+
+def upload_data(request, field_name):
+    """
+    Данные запроса для сериализатора: файл из «сырого» тела
+    передаётся под именем field_name.
+    """
+    if request.content_type.startswith('image/'):
+        return {field_name: request.data.get(RAW_FILE_FIELD)}
+    return request.data
+
+
+class ImageUploadField(Base64ImageField):
+    """Изображение строкой base64 или загруженным файлом."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return serializers.ImageField.to_internal_value(self, data)
+        # base64 длиннее исходных байтов на треть, плюс заголовок
+        # data:image/...;base64,
+        if (isinstance(data, str) and len(data)
+                > settings.IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + DATA_URI_HEADER):
+            raise serializers.ValidationError(UploadTooLarge.default_detail)
+        return super().to_internal_value(data)
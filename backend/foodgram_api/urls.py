@@ -4,6 +4,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     FudgramUserViewSet,
     IngredientViewSet,
+    ProfileViewSet,
     RecipeViewSet,
     TagViewSet,
 )
@@ -14,6 +15,7 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('users', FudgramUserViewSet, basename='users')
+router.register('profiles', ProfileViewSet, basename='profiles')
 
 
 urlpatterns = [
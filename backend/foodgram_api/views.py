@@ -1,41 +1,57 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import router
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser import utils
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
 from foodgram_api.serializers import (
     CreateRecipeSerializer,
+    IngredientMatchRecipeSerializer,
     IngredientSerializer,
     ListRecipeSerializer,
     RecipeSerializer,
     TagSerializer,
 )
+from foodgram_app import ingredient_index, interactions, recommendations
+from foodgram_app.changes import DEFAULT_LIMIT, MAX_LIMIT, changes_since
+from foodgram_app.deletion import request_user_deletion
 from foodgram_app.models import (
     Favorite,
     Ingredient,
-    IngredientRecipe,
     Recipe,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
 )
+from foodgram_app.units import merge_shopping_list
 from foodgram_users.models import Follow
 
+from .bulk_import import import_recipes
+from .compression import PrecompressedMixin
+from .export import export_lines, filter_recipes, parse_updated_since
 from .filters import IngredientFilter, TagFavCartFilter
 from .pagination import CustomPagination
 from .permissions import IsOwnerOrAdmin
+from .profiling import FORMATS, capture_path, list_captures
+from .representations import serialize_recipes
 from .serializers import (
     FollowSerializer,
+    RecipeImageSerializer,
     SubscribeCreateSerializer,
     UserAvatarSerializer,
 )
+from .sparse_fields import RECIPE_PRESETS, select_fields
+from .uploads import ImageUploadParser, MultiPartParser, upload_data
 
 """
 Список пользователей                api/users/                 GET
@@ -43,6 +59,7 @@ from .serializers import (
 
 Профиль пользователя                api/users/{id}/            GET
 Текущий пользователь                api/users/me/              GET
+Избранное, корзина и подписки       api/users/me/state/        GET
 Добавление аватара                  api/users/me/avatar/       PUT
 Удаление аватара                    api/users/me/avatar/       DELET
 
@@ -58,6 +75,17 @@ from .serializers import (
 
 User = get_user_model()
 
+# Время жизни в общих кешах списка рецептов без персональных флагов.
+SHARED_LIST_MAX_AGE = 60
+PERSONAL_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+# Изображение — base64 в JSON, multipart или само тело запроса.
+UPLOAD_PARSERS = (JSONParser, MultiPartParser, ImageUploadParser)
+# Поле RecipeSerializer -> связь, загружаемая для детального рецепта.
+DETAIL_PREFETCHES = {
+    'tags': 'tags',
+    'ingredients': 'ingredient_recipe__ingredient',
+}
+
 
 class FudgramUserViewSet(UserViewSet):
     """
@@ -75,6 +103,15 @@ class FudgramUserViewSet(UserViewSet):
     pagination_class = CustomPagination
     lookup_field = "id"
 
+    def perform_destroy(self, instance):
+        """
+        Удаление без Collector (foodgram_app.deletion): автор
+        с большим числом рецептов деактивируется и удаляется в фоне.
+        """
+        if instance == self.request.user:
+            utils.logout_user(self.request)
+        request_user_deletion(instance)
+
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
     def me(self, request):
@@ -87,15 +124,20 @@ class FudgramUserViewSet(UserViewSet):
     @action(
         detail=True,
         methods=['put', 'delete'],
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        parser_classes=UPLOAD_PARSERS,
     )
     def avatar(self, request, **kwargs):
-        """Обновляет или удаляет аватар текущего пользователя."""
+        """
+        Обновляет или удаляет аватар текущего пользователя.
+        Аватар — base64 в JSON, файл multipart/form-data
+        или само изображение в теле (Content-Type: image/*).
+        """
         user = get_object_or_404(User, pk=request.user.id)
         if request.method == 'PUT':
             serializer = UserAvatarSerializer(
                 user,
-                data=request.data,
+                data=upload_data(request, 'avatar'),
                 partial=True,
                 context={'request': request}
             )
@@ -105,9 +147,30 @@ class FudgramUserViewSet(UserViewSet):
                 {'avatar': serializer.data.get('avatar')},
                 status=status.HTTP_200_OK
             )
-        user.avatar.delete(save=True)
+        # Ссылку на файл снимает сигнал, а сам файл удаляет
+        # хранилище, когда на него никто не ссылается.
+        user.avatar = None
+        user.save(update_fields=['avatar'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, url_path='me/state',
+            permission_classes=[IsAuthenticated])
+    def state(self, request):
+        """
+        id рецептов в избранном и корзине и id авторов в подписках.
+        /api/users/me/state/?since=<cursor>          GET
+        С since возвращаются только изменения после курсора,
+        флаги is_favorited и т.п. клиент вычисляет сам.
+        """
+        since = request.query_params.get('since')
+        if since is not None:
+            if not since.isdigit():
+                return Response(
+                    {'errors': 'since должен быть курсором из ответа.'},
+                    status=status.HTTP_400_BAD_REQUEST)
+            since = int(since)
+        return Response(interactions.user_state(request.user, since))
+
     @action(
         detail=False,
         permission_classes=[IsAuthenticated]
@@ -116,8 +179,11 @@ class FudgramUserViewSet(UserViewSet):
         """
          Возвращает список авторов, на которых подписан пользователь.
         """
-        users = User.objects.filter(followers__user=request.user)
+        users = FollowSerializer.annotate(
+            User.objects.filter(followers__user=request.user)
+        ).order_by('username')
         paginated_queryset = self.paginate_queryset(users)
+        FollowSerializer.prefetch_recipes(paginated_queryset, request)
         serializer = FollowSerializer(
             paginated_queryset, many=True, context={'request': request}
         )
@@ -130,7 +196,8 @@ class FudgramUserViewSet(UserViewSet):
     )
     def subscribe(self, request, id=None):
         """Подписаться на автора."""
-        author = get_object_or_404(User, pk=id)
+        author = get_object_or_404(
+            FollowSerializer.annotate(User.objects.all()), pk=id)
         data = {
             'user': request.user.id,
             'author': author.id
@@ -139,6 +206,7 @@ class FudgramUserViewSet(UserViewSet):
                                                context={'request': request})
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        FollowSerializer.prefetch_recipes([author], request)
         author_serializer = FollowSerializer(author,
                                              context={'request': request})
         return Response(author_serializer.data, status=status.HTTP_201_CREATED)
@@ -164,11 +232,19 @@ Cписок тегов                        api/tags/
 Получение ингредиента               api/ingredients/{id}/               GET
 
 Список рецептов                     api/recipes/                        GET
+Общий для всех список рецептов      api/recipes/?shared=1               GET
 Создание рецепта                    api/recipes/                        POST
 Получение рецепта                   api/recipes/{id}/                   GET
 Обновление рецепта                  api/recipes/{id}/                   PATCH
 Удаление рецепта                    api/recipes/{id}/                   DELETE
 Получить короткую ссылку на рецепт  api/recipes/{id}/get-link/          GET
+Заменить изображение рецепта        api/recipes/{id}/image/             PUT
+Поиск рецептов по ингредиентам      api/recipes/by-ingredients/?ids=    GET
+Похожие рецепты                     api/recipes/{id}/similar/           GET
+Рекомендации для пользователя       api/recipes/for-you/                GET
+Лента изменений рецептов            api/recipes/changes/?since=         GET
+Выгрузка каталога (staff)           api/recipes/export.ndjson/          GET
+Массовый импорт (staff)             api/recipes/import/                 POST
 
 Скачать список покупок              api/recipes/download_shopping_cart/ GET
 Добавить рецепт в список покупок    api/recipes/{id}/shopping_cart/     POST
@@ -179,7 +255,7 @@ Cписок тегов                        api/tags/
 """
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(PrecompressedMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет обрабатывает адреса:
         Cписок тегов           api/tags/                           GET
@@ -191,7 +267,7 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(PrecompressedMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет обрабатывает адреса:
         Список ингредиентов     api/ingredients/                    GET
@@ -206,7 +282,7 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['name']
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(PrecompressedMixin, viewsets.ModelViewSet):
     """Вьюсет для управления рецептами."""
     queryset = Recipe.objects.all()
     serializer_class = CreateRecipeSerializer
@@ -215,12 +291,67 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = TagFavCartFilter
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        """Рецепт для детального представления — с тегами и ингредиентами."""
+        if self.action == 'retrieve':
+            return self.detail_queryset()
+        return super().get_queryset()
+
+    def detail_queryset(self):
+        """
+        Рецепты с данными для RecipeSerializer без запросов на строку.
+        Связи пропущенных в ?fields=, ?omit= и ?view= полей
+        не загружаются.
+        """
+        fields = select_fields(self.request, RecipeSerializer.Meta.fields,
+                               RECIPE_PRESETS)
+        queryset = self.queryset
+        if 'author' in fields:
+            queryset = queryset.select_related('author')
+        return queryset.prefetch_related(*(
+            lookup for field, lookup in DETAIL_PREFETCHES.items()
+            if field in fields))
+
     def get_serializer_class(self):
         """Возвращает сериализатор в зависимости от action."""
         if self.action in ('list', 'retrieve'):
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    def is_precompressed(self, request, response):
+        """
+        Сжатые байты кешируются для рецепта у анонима
+        и для общего списка рецептов.
+        """
+        return ((self.action == 'retrieve'
+                 and not request.user.is_authenticated
+                 or self.action == 'list' and self.is_shared_list(request))
+                and super().is_precompressed(request, response))
+
+    def is_shared_list(self, request):
+        """
+        ?shared=1 без персональных фильтров: ответ одинаков для всех,
+        флаги is_favorited, is_in_shopping_cart и is_subscribed
+        клиент берёт из api/users/me/state/.
+        """
+        params = request.query_params
+        return (params.get('shared') in ('1', 'true')
+                and not any(name in params for name in PERSONAL_FILTERS))
+
+    def list(self, request, *args, **kwargs):
+        """
+        Список рецептов. Структура та же, что у RecipeSerializer,
+        но строится быстрым путём serialize_recipes по id страницы.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if not self.is_shared_list(request):
+            return self.paginated_recipes(queryset)
+        request._interactions = interactions.EMPTY
+        response = self.paginated_recipes(queryset)
+        patch_cache_control(response, public=True,
+                            max_age=SHARED_LIST_MAX_AGE)
+        return response
+
     @action(detail=True, permission_classes=(AllowAny,), url_path='get-link')
     def get_short_link(self, request, pk=None):
         """Генерирует или получает из базы короткую ссылку для рецепта.
@@ -230,6 +361,169 @@ class RecipeViewSet(viewsets.ModelViewSet):
         short_url = f"{settings.SHORT_DOMAIN}/s/{recipe.short_link}"
         return Response({'short-link': short_url}, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['put'], parser_classes=UPLOAD_PARSERS)
+    def image(self, request, pk=None):
+        """
+        Заменяет изображение рецепта без передачи остальных полей.
+        /api/recipes/{id}/image/          PUT
+        Изображение — base64 в JSON, файл multipart/form-data
+        или само изображение в теле (Content-Type: image/*).
+        """
+        serializer = RecipeImageSerializer(
+            self.get_object(), data=upload_data(request, 'image'),
+            context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({'image': serializer.data['image']},
+                        status=status.HTTP_200_OK)
+
+    @action(detail=False, permission_classes=(AllowAny,),
+            url_path='by-ingredients')
+    def by_ingredients(self, request):
+        """
+        Подбирает рецепты по имеющимся ингредиентам.
+        /api/recipes/by-ingredients/?ids=1,2,3          GET
+        Сначала рецепты, где не хватает меньше ингредиентов,
+        затем с большей долей совпадений.
+        """
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.get('ids', '').split(',')
+                if value.strip()
+            ]
+        except ValueError:
+            ingredient_ids = None
+        if not ingredient_ids:
+            return Response(
+                {'errors': 'Передайте id ингредиентов: ?ids=1,2,3.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        matches = ingredient_index.get_index().match(ingredient_ids)
+        page = self.paginate_queryset(matches)
+        recipes = self.detail_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        serializer = IngredientMatchRecipeSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page
+             if recipe_id in recipes],
+            many=True,
+            context={
+                'request': request,
+                'matches': {
+                    recipe_id: (matched, missing)
+                    for recipe_id, matched, missing in page
+                },
+            })
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, permission_classes=(AllowAny,))
+    def similar(self, request, pk=None):
+        """
+        Рецепты, которые часто добавляют в избранное вместе с этим.
+        /api/recipes/{id}/similar/          GET
+        """
+        recipe = get_object_or_404(Recipe, pk=pk)
+        return self.paginated_recipes(
+            recommendations.similar_recipes(recipe))
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            url_path='for-you')
+    def for_you(self, request):
+        """
+        Рекомендации по избранному текущего пользователя.
+        /api/recipes/for-you/          GET
+        """
+        return self.paginated_recipes(
+            recommendations.recipes_for_user(request.user))
+
+    @action(detail=False, permission_classes=(AllowAny,))
+    def changes(self, request):
+        """
+        Лента изменений каталога для зеркал и индексаторов.
+        /api/recipes/changes/?since=<token>&limit=100          GET
+        Для каждого изменённого рецепта — текущее представление
+        или {"deleted": true}, если рецепт удалён. next передаётся
+        в since следующего запроса, has_more — есть ли ещё записи.
+        """
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+            if not 1 <= limit <= MAX_LIMIT:
+                raise ValueError(limit)
+            recipe_ids, next_token, has_more = changes_since(
+                request.query_params.get('since'), limit)
+        except ValueError:
+            return Response(
+                {'errors': 'Передайте since из ответа ленты и limit '
+                           f'от 1 до {MAX_LIMIT}.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        # Лента общая для всех: без персональных флагов.
+        request._interactions = interactions.EMPTY
+        recipes = {
+            recipe['id']: recipe
+            for recipe in serialize_recipes(recipe_ids, request,
+                                            required=('id',))
+        }
+        return Response({
+            'next': next_token,
+            'has_more': has_more,
+            'results': [
+                {'id': recipe_id, 'deleted': False,
+                 'recipe': recipes[recipe_id]}
+                if recipe_id in recipes else
+                {'id': recipe_id, 'deleted': True}
+                for recipe_id in recipe_ids
+            ],
+        })
+
+    @action(detail=False, permission_classes=(IsAdminUser,),
+            url_path='export.ndjson')
+    def export(self, request):
+        """
+        Потоковая выгрузка рецептов в NDJSON, только для staff.
+        /api/recipes/export.ndjson/?author=&tags=&updated_since=    GET
+        """
+        params = request.query_params
+        try:
+            author = int(params['author']) if params.get('author') else None
+            updated_since = (parse_updated_since(params['updated_since'])
+                             if params.get('updated_since') else None)
+        except ValueError:
+            return Response(
+                {'errors': 'author — id автора, updated_since — дата '
+                           'или дата-время ISO 8601.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        queryset = filter_recipes(
+            Recipe.objects.using(router.db_for_read(Recipe)),
+            author, params.getlist('tags'), updated_since)
+        response = StreamingHttpResponse(export_lines(queryset, request),
+                                         content_type='application/x-ndjson')
+        response['Content-Disposition'] = (
+            'attachment; filename="recipes.ndjson"')
+        return response
+
+    @action(detail=False, methods=['post'],
+            permission_classes=(IsAdminUser,), url_path='import')
+    def bulk_import(self, request):
+        """
+        Массовый импорт рецептов из NDJSON в теле запроса, только
+        для staff. Записи без author получают автором текущего
+        пользователя. Тело читается потоком, построчно.
+        /api/recipes/import/          POST
+        """
+        if request.stream is None:
+            return Response({'errors': 'Пустое тело запроса.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = import_recipes(request.stream, request.user)
+        return Response(
+            result.as_dict(),
+            status=(status.HTTP_201_CREATED if result.created
+                    else status.HTTP_400_BAD_REQUEST))
+
+    def paginated_recipes(self, queryset):
+        """Постраничная выдача рецептов в детальном представлении."""
+        page = self.paginate_queryset(queryset.values_list('pk', flat=True))
+        return self.get_paginated_response(
+            serialize_recipes(page, self.request))
+
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk):
@@ -318,17 +612,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def download_shopping_cart(self, request, **kwargs):
         """
         Позволяет скачать список покупок в виде текстового файла.
+        Суммы берутся из заранее посчитанной таблицы ShoppingListItem,
+        совместимые единицы измерения одного продукта объединяются.
         /api/recipes/download_shopping_cart/         GET
         """
-        ingredients = (IngredientRecipe.objects
-                       .filter(recipe__shoppingcart_recipes__user=request.user)
-                       .values('ingredient')
-                       .annotate(total_amount=Sum('amount'))
-                       .order_by('ingredient__name')
-                       .values_list(
-                           'ingredient__name',
-                           'total_amount',
-                           'ingredient__measurement_unit'))
+        ingredients = merge_shopping_list(
+            ShoppingListItem.objects
+            .filter(user=request.user)
+            .values_list(
+                'ingredient__name',
+                'total_amount',
+                'ingredient__measurement_unit'))
         lines = (
             [f'{name} - {total} {unit}' for name, total, unit in ingredients]
         )
@@ -337,3 +631,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
         response['Content-Disposition'] = (
             'attachment; filename="shopping_list.txt"')
         return response
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Снимки профилировщика запросов (foodgram_api.profiling),
+    только для staff:
+        Список снимков          api/profiles/                       GET
+        Файл снимка             api/profiles/{id}/?type=            GET
+    type — speedscope (по умолчанию) или collapsed.
+    """
+    permission_classes = (IsAdminUser,)
+    lookup_value_regex = '[0-9A-Za-z-]+'
+
+    def list(self, request):
+        return Response(list_captures())
+
+    def retrieve(self, request, pk):
+        kind = request.query_params.get('type', 'speedscope')
+        if kind not in FORMATS:
+            return Response(
+                {'errors': 'type — speedscope или collapsed.'},
+                status=status.HTTP_400_BAD_REQUEST)
+        suffix, content_type = FORMATS[kind]
+        try:
+            profile = open(capture_path(pk, suffix), 'rb')
+        except FileNotFoundError:
+            return Response({'detail': 'Снимок не найден.'},
+                            status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(profile, content_type=content_type,
+                            as_attachment=True, filename=pk + suffix)
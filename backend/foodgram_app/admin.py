@@ -1,6 +1,42 @@
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.forms.models import BaseInlineFormSet
 
 from . import models
+from .paginators import EstimatedCountPaginator
+from .signals import recipe_ingredients_changed
+
+
+class IngredientAutocomplete(AutocompleteSelect):
+    """
+    Автодополнение ингредиента в строке рецепта. Выбранный ингредиент
+    берётся из строки, загруженной с select_related, а не отдельным
+    запросом на каждую строку.
+    """
+    ingredient = None
+
+    def optgroups(self, name, value, attr=None):
+        ingredient = self.ingredient
+        if ingredient is None or [str(ingredient.pk)] != [
+                str(item) for item in value if item]:
+            return super().optgroups(name, value, attr)
+        return [(None, [self.create_option(
+            name, ingredient.pk, str(ingredient), True, 0)], 0)]
+
+
+class IngredientRecipeFormSet(BaseInlineFormSet):
+    """Передаёт виджету ингредиента уже загруженный ингредиент строки."""
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        widget = form.fields['ingredient'].widget
+        # В админке виджет обёрнут RelatedFieldWidgetWrapper.
+        widget = getattr(widget, 'widget', widget)
+        if form.instance.ingredient_id is not None:
+            widget.ingredient = form.instance.ingredient
+        return form
 
 
 class IngredientRecipeInline(admin.TabularInline):
@@ -9,7 +45,20 @@ class IngredientRecipeInline(admin.TabularInline):
     ингредиенты к рецепту (через модель IngredientRecipe).
     """
     model = models.IngredientRecipe
+    formset = IngredientRecipeFormSet
     extra = 1
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        """Строки с рецептом и ингредиентом для __str__ и виджета."""
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = IngredientAutocomplete(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(models.Tag)
@@ -35,13 +84,46 @@ class RecipeAdmin(admin.ModelAdmin):
     Потом вернуться к идее с выпадающим списком по единицам измерения.
     """
     list_display = ('name', 'author', 'favorited_counts')
+    list_select_related = ('author',)
     search_fields = ('name', 'author__username')
     list_filter = ('tags',)
     filter_horizontal = ('tags',)
+    autocomplete_fields = ('author',)
     inlines = [IngredientRecipeInline]
     readonly_fields = ('short_link',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """
+        Число добавлений в избранное считается подзапросом
+        только для строк текущей страницы.
+        """
+        favorites = (models.Favorite.objects
+                     .filter(recipe=OuterRef('pk'))
+                     .order_by()
+                     .values('recipe')
+                     .annotate(count=Count('pk'))
+                     .values('count'))
+        return super().get_queryset(request).annotate(
+            favorited_count=Coalesce(Subquery(favorites), 0))
+
+    def save_related(self, request, form, formsets, change):
+        """
+        После сохранения inline-ингредиентов обновляет производные
+        данные рецепта (списки покупок, поисковые индексы).
+        """
+        old_ingredient_ids = []
+        if change:
+            old_ingredient_ids = list(form.instance.ingredient_recipe
+                                      .values_list('ingredient', flat=True))
+        super().save_related(request, form, formsets, change)
+        recipe_ingredients_changed.send(
+            sender=models.Recipe, recipe=form.instance,
+            old_ingredient_ids=old_ingredient_ids)
 
-    @admin.display(description='Добавлений в избранное')
+    @admin.display(description='Добавлений в избранное',
+                   ordering='favorited_count')
     def favorited_counts(self, obj):
         """Подсчёт, сколько раз рецепт добавляли в избранное."""
-        return obj.favorite_recipes.count()
+        return obj.favorited_count
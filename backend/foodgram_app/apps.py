@@ -5,3 +5,7 @@ class FoodgramAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'foodgram_app'
     verbose_name = 'Модели сайта'
+
+    def ready(self):
+        """Подключает сигналы поддержки списка покупок."""
+        from . import signals  # noqa: F401
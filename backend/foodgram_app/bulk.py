@@ -0,0 +1,63 @@
+"""
+Массовые вставка и удаление строк запросами SQL без объектов моделей.
+
+bulk_create создаёт объект модели на строку, а QuerySet.delete()
+загружает строки в память, если у модели есть сигналы или зависимые
+таблицы. Для связующих таблиц и журналов, где строк в разы больше,
+чем рецептов, это основная часть времени массовых операций.
+Сигналы при этом не отправляются: вызывающий код сам обновляет
+производные данные (см. foodgram_api.bulk_import,
+foodgram_app.deletion).
+"""
+from django.db import connections, router
+
+DELETE_BATCH_SIZE = 1000
+
+
+def insert_rows(model, field_names, rows, **constants):
+    """
+    Вставляет строки rows (кортежи значений полей field_names)
+    многострочными INSERT. constants — значения остальных полей,
+    общие для всех строк; они подготавливаются один раз.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(name) for name in field_names]
+    constant_fields = [model._meta.get_field(name) for name in constants]
+    suffix = tuple(
+        field.get_db_prep_save(constants[field.name], connection)
+        for field in constant_fields)
+    fields += constant_fields
+    batch_size = connection.ops.bulk_batch_size(fields, rows)
+    quote = connection.ops.quote_name
+    prefix = 'INSERT INTO {} ({}) VALUES '.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields))
+    placeholder = '({})'.format(', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                prefix + ', '.join([placeholder] * len(batch)),
+                [value for row in batch for value in tuple(row) + suffix])
+
+
+def delete_rows(model, field_name, values):
+    """
+    Удаляет строки model, у которых field_name входит в values,
+    запросами DELETE без загрузки строк.
+    """
+    values = list(values)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    column = model._meta.get_field(field_name).column
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), DELETE_BATCH_SIZE):
+            batch = values[start:start + DELETE_BATCH_SIZE]
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    quote(model._meta.db_table), quote(column),
+                    ', '.join(['%s'] * len(batch))),
+                batch)
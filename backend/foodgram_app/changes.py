@@ -0,0 +1,165 @@
+"""
+Лента изменений рецептов (api/recipes/changes/).
+
+Каждое изменение рецепта, его ингредиентов и тегов добавляет строку
+RecipeChange в той же транзакции (см. foodgram_app.signals).
+Изменение тега, ингредиента или автора пишется одной строкой с его
+id, а рецепты по ней находит читатель: changes_since — постранично,
+changed_recipes — условием для выборки. Потребитель хранит
+непрозрачный токен и запрашивает порции не больше MAX_LIMIT рецептов:
+работа пропорциональна числу изменений, а не размеру каталога.
+
+id строк выдаются при вставке, а видны после коммита, поэтому строка
+с меньшим id может появиться позже строки с большим. На PostgreSQL
+строка хранит xid записавшей её транзакции, и курсор идёт
+по (xid, id): отдаются только строки транзакций с xid меньше
+pg_snapshot_xmin — все такие транзакции уже завершены, а строки,
+которые станут видны позже, получат курсор больше выданных.
+Долгая транзакция задерживает ленту, но изменения не теряются.
+На SQLite пишущие транзакции идут по очереди, и id совпадает
+с порядком коммитов.
+"""
+import base64
+import binascii
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .bulk import insert_rows
+from .models import Recipe, RecipeChange
+
+TOKEN_PREFIX = 'rc2:'
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+# Вид строки журнала -> поиск рецептов по id объекта.
+RELATED_LOOKUPS = {
+    RecipeChange.TAG: 'tags',
+    RecipeChange.INGREDIENT: 'ingredients',
+    RecipeChange.AUTHOR: 'author',
+}
+
+
+class InvalidToken(ValueError):
+    """Токен ленты не получен от api/recipes/changes/."""
+
+
+def encode_token(position):
+    """
+    position — (xid, id, recipe_id) последней прочитанной строки;
+    recipe_id > 0 — строка тега, ингредиента или автора прочитана
+    до рецепта recipe_id включительно.
+    """
+    value = TOKEN_PREFIX + ':'.join(map(str, position))
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Позиция encode_token; пустой токен — начало ленты."""
+    if not token:
+        return 0, 0, 0
+    try:
+        value = base64.urlsafe_b64decode(
+            token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidToken(token)
+    parts = value[len(TOKEN_PREFIX):].split(':')
+    if (not value.startswith(TOKEN_PREFIX) or len(parts) != 3
+            or not all(part.isdigit() for part in parts)):
+        raise InvalidToken(token)
+    return tuple(map(int, parts))
+
+
+def record_changes(object_ids, deleted=False, kind=RecipeChange.RECIPE):
+    """Добавляет в журнал изменения рецептов (или тегов и т. д.)."""
+    insert_rows(RecipeChange, ('object_id',),
+                [(object_id,) for object_id in object_ids],
+                kind=kind, deleted=deleted, created_at=timezone.now())
+
+
+def snapshot_xmin():
+    """
+    Наименьший xid незавершённых транзакций (PostgreSQL);
+    None — курсор идёт только по id.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+        return cursor.fetchone()[0]
+
+
+def pending_changes(position):
+    """Строки журнала с позиции position в порядке курсора."""
+    xid, change_id, recipe_id = position
+    # Строка, прочитанная не до конца, читается снова.
+    after = Q(id__gte=change_id) if recipe_id else Q(id__gt=change_id)
+    xmin = snapshot_xmin()
+    if xmin is None:
+        return RecipeChange.objects.filter(after).order_by('id')
+    return RecipeChange.objects.filter(
+        Q(xid__gt=xid) | Q(after, xid=xid), xid__lt=xmin,
+    ).order_by('xid', 'id')
+
+
+def related_recipe_ids(kind, object_id, after, limit):
+    """До limit id рецептов тега, ингредиента или автора после after."""
+    return list(Recipe.objects.filter(
+        **{RELATED_LOOKUPS[kind]: object_id}, pk__gt=after,
+    ).order_by('pk').values_list('pk', flat=True)[:limit])
+
+
+def changes_since(token, limit=DEFAULT_LIMIT):
+    """
+    Следующая порция ленты после token: не больше limit id изменённых
+    рецептов в порядке последнего изменения, следующий токен
+    и признак того, что в журнале есть ещё записи.
+    """
+    position = decode_token(token)
+    rows = list(pending_changes(position).values_list(
+        'xid', 'id', 'kind', 'object_id')[:limit + 1])
+    recipe_ids = []
+    has_more = len(rows) > limit
+    for xid, change_id, kind, object_id in rows:
+        if len(recipe_ids) == limit:
+            has_more = True
+            break
+        xid = xid or 0
+        if kind == RecipeChange.RECIPE:
+            recipe_ids.append(object_id)
+            position = xid, change_id, 0
+            continue
+        after = position[2] if position[:2] == (xid, change_id) else 0
+        free = limit - len(recipe_ids)
+        related = related_recipe_ids(kind, object_id, after, free + 1)
+        recipe_ids.extend(related[:free])
+        if len(related) > free:
+            position = xid, change_id, related[free - 1]
+            has_more = True
+            break
+        position = xid, change_id, 0
+    return latest_first(recipe_ids), encode_token(position), has_more
+
+
+def latest_first(recipe_ids):
+    """id без повторов, каждый — на месте последнего изменения."""
+    latest = {}
+    for recipe_id in recipe_ids:
+        latest.pop(recipe_id, None)
+        latest[recipe_id] = None
+    return list(latest)
+
+
+def changed_recipes(changes):
+    """
+    Условие на рецепты, затронутые строками журнала changes,
+    с учётом изменённых тегов, ингредиентов и авторов.
+    """
+    condition = Q(pk__in=changes.filter(
+        kind=RecipeChange.RECIPE).values('object_id'))
+    for kind, lookup in RELATED_LOOKUPS.items():
+        condition |= Q(pk__in=Recipe.objects.filter(**{
+            f'{lookup}__in': changes.filter(kind=kind).values('object_id'),
+        }).values('pk'))
+    return condition
@@ -0,0 +1,150 @@
+"""
+Удаление пользователей и рецептов без Collector.
+
+Model.delete() загружает в память каждую связанную строку (рецепты,
+ингредиенты рецептов, избранное, корзины, подписки), чтобы
+эмулировать CASCADE и отправить сигналы. Здесь связанные строки
+удаляются запросами DELETE ... WHERE ... IN по порциям id,
+а производные данные, которые обычно обновляют сигналы
+(foodgram_app.signals), обновляются один раз на порцию: журналы
+изменений, списки покупок, снимки взаимодействий, поисковый индекс,
+ссылки на медиафайлы и кеши. Из памяти читаются только id.
+
+Пользователь, у которого больше INLINE_RECIPES рецептов, удаляется
+в фоне: request_user_deletion деактивирует его и ставит в очередь
+UserDeletion, а команда process_user_deletions (cron) удаляет
+рецепты порциями по CHUNK_SIZE, каждую в своей транзакции,
+и затем самого пользователя. Файлы без ссылок удаляются с диска
+после коммита (см. foodgram_app.storage).
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from foodgram_users.models import Follow
+
+from . import interactions
+from .bulk import delete_rows
+from .changes import record_changes
+from .invalidation import publish
+from .models import (
+    Favorite,
+    IngredientRecipe,
+    InteractionChange,
+    Recipe,
+    ShoppingCart,
+    ShoppingListItem,
+    SimilarRecipe,
+    UserDeletion,
+)
+from .search import remove_from_search_indexes
+from .shopping_list import refresh_shopping_list
+
+User = get_user_model()
+
+RecipeTag = Recipe.tags.through
+
+CHUNK_SIZE = 1000
+INLINE_RECIPES = 1000
+
+
+def release_images(names):
+    """Снимает ссылки удалённых рецептов на их изображения."""
+    storage = Recipe._meta.get_field('image').storage
+    if not hasattr(storage, 'remove_references'):
+        return
+    for name, count in Counter(name for name in names if name).items():
+        storage.remove_references(name, count)
+
+
+@transaction.atomic
+def delete_recipes(recipe_ids):
+    """
+    Удаляет рецепты со всеми связанными строками за фиксированное
+    число запросов на порцию.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    images = list(Recipe.objects.filter(
+        pk__in=recipe_ids).values_list('image', flat=True))
+    favorites = list(Favorite.objects.filter(
+        recipe__in=recipe_ids).values_list('user', 'recipe'))
+    carts = list(ShoppingCart.objects.filter(
+        recipe__in=recipe_ids).values_list('user', 'recipe'))
+    cart_ingredient_ids = set(IngredientRecipe.objects.filter(
+        recipe__in={recipe_id for _, recipe_id in carts}
+    ).values_list('ingredient', flat=True))
+
+    for model, field in ((Favorite, 'recipe'), (ShoppingCart, 'recipe'),
+                         (RecipeTag, 'recipe'), (IngredientRecipe, 'recipe'),
+                         (SimilarRecipe, 'recipe'),
+                         (SimilarRecipe, 'similar'), (Recipe, 'id')):
+        delete_rows(model, field, recipe_ids)
+
+    interactions.record_removals(Favorite, favorites)
+    interactions.record_removals(ShoppingCart, carts)
+    refresh_shopping_list({user_id for user_id, _ in carts},
+                          cart_ingredient_ids)
+    interactions.invalidate_many(
+        user_id for user_id, _ in favorites + carts)
+    record_changes(recipe_ids, deleted=True)
+    remove_from_search_indexes(recipe_ids)
+    release_images(images)
+    publish(Recipe, None)
+
+
+def delete_user(user, chunk_size=CHUNK_SIZE):
+    """
+    Удаляет пользователя: рецепты — порциями в отдельных
+    транзакциях, затем подписки, избранное, корзину и саму строку.
+    """
+    recipes = Recipe.objects.filter(author=user).order_by('pk')
+    while True:
+        recipe_ids = list(recipes.values_list('pk', flat=True)[:chunk_size])
+        if not recipe_ids:
+            break
+        delete_recipes(recipe_ids)
+    with transaction.atomic():
+        followers = list(Follow.objects.filter(
+            author=user).values_list('user', 'author'))
+        for model, field in ((Follow, 'author'), (Follow, 'user'),
+                             (Favorite, 'user'), (ShoppingCart, 'user'),
+                             (ShoppingListItem, 'user'),
+                             (InteractionChange, 'user')):
+            delete_rows(model, field, [user.pk])
+        interactions.record_removals(Follow, followers)
+        interactions.invalidate_many(
+            follower_id for follower_id, _ in followers)
+        # Связанных строк почти не осталось: Collector удалит токен,
+        # записи журнала админки и очередь, а сигнал снимет ссылку
+        # на аватар.
+        user.delete()
+
+
+def request_user_deletion(user):
+    """
+    Удаляет пользователя сразу или, если рецептов больше
+    INLINE_RECIPES, деактивирует и ставит в очередь.
+    Возвращает True, если пользователь удалён сразу.
+    """
+    if not Recipe.objects.filter(author=user)[INLINE_RECIPES:].exists():
+        delete_user(user)
+        return True
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        UserDeletion.objects.get_or_create(user=user)
+    return False
+
+
+def process_user_deletions(limit=None):
+    """Удаляет пользователей из очереди; возвращает их число."""
+    deletions = UserDeletion.objects.select_related('user')
+    if limit is not None:
+        deletions = deletions[:limit]
+    deleted = 0
+    for deletion in deletions:
+        delete_user(deletion.user)
+        deleted += 1
+    return deleted
@@ -0,0 +1,310 @@
+"""
+Обратный индекс «ингредиент -> рецепты» для поиска рецептов
+по имеющимся продуктам (api/recipes/by-ingredients/).
+
+Индекс строится в памяти процесса одним проходом по IngredientRecipe.
+Для каждого ингредиента хранится множество id рецептов: у частых
+ингредиентов — битовая карта (int, бит на id рецепта), у редких —
+отсортированный массив, смотря что занимает меньше памяти. Рецепты
+также разложены по битовым картам «рецепты из N ингредиентов».
+Подсчёт совпадений — побитовое сложение карт запрошенных
+ингредиентов (двоичный счётчик из карт-разрядов): каждая операция
+идёт по машинным словам, без цикла по рецептам в Python и без SQL
+GROUP BY. Выдача разбита на группы (совпало, всего ингредиентов),
+группы упорядочены по ключу сортировки, и рецепты извлекаются только
+до конца запрошенной страницы.
+
+Шина инвалидации (foodgram_app.invalidation) вызывает invalidate(pk)
+при изменении рецепта в любом процессе: ингредиенты рецепта
+перечитываются из базы и индекс обновляется точечно, а pk=None
+сбрасывает индекс целиком. Раз в INDEX_TTL секунд индекс
+перестраивается на случай пропущенного события.
+"""
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from heapq import merge
+from itertools import groupby, islice
+
+from . import invalidation
+from .models import IngredientRecipe
+
+INDEX_TTL = 300
+BUILD_CHUNK_SIZE = 10000
+# Массив тратит 64 бита на рецепт, битовая карта — бит на каждый id
+# до наибольшего: карта выгоднее, если рецептов больше max_id / 64.
+BITMAP_DENSITY = 64
+
+
+def to_bitmap(recipe_ids):
+    """Битовая карта (int) из id рецептов."""
+    if not recipe_ids:
+        return 0
+    bits = bytearray(max(recipe_ids) // 8 + 1)
+    for recipe_id in recipe_ids:
+        bits[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def compact(recipe_ids):
+    """Битовая карта или отсортированный массив id — что меньше."""
+    if len(recipe_ids) * BITMAP_DENSITY > recipe_ids[-1]:
+        return to_bitmap(recipe_ids)
+    return recipe_ids
+
+
+def as_bitmap(posting):
+    """Множество рецептов ингредиента в виде битовой карты."""
+    return posting if isinstance(posting, int) else to_bitmap(posting)
+
+
+def contains(posting, recipe_id):
+    """Есть ли рецепт в множестве рецептов ингредиента."""
+    if isinstance(posting, int):
+        return bool(posting >> recipe_id & 1)
+    position = bisect_left(posting, recipe_id)
+    return position < len(posting) and posting[position] == recipe_id
+
+
+def with_recipe(posting, recipe_id, present):
+    """Копия множества с добавленным (present) или удалённым рецептом."""
+    if isinstance(posting, int):
+        if present:
+            return posting | 1 << recipe_id
+        return posting & ~(1 << recipe_id)
+    recipe_ids = array('q', posting)
+    position = bisect_left(recipe_ids, recipe_id)
+    if present:
+        recipe_ids.insert(position, recipe_id)
+    else:
+        del recipe_ids[position]
+    return recipe_ids
+
+
+def popcount(bitmap):
+    """Число единичных битов (int.bit_count появился в Python 3.10)."""
+    return bin(bitmap).count('1')
+
+
+def iter_bits(bitmap):
+    """id рецептов битовой карты по убыванию, по 64-битным словам."""
+    count = (bitmap.bit_length() + 63) // 64
+    # Порядок байтов задан явно: результат не зависит от платформы.
+    words = struct.unpack(f'<{count}Q', bitmap.to_bytes(count * 8, 'little'))
+    for position in range(len(words) - 1, -1, -1):
+        word = words[position]
+        while word:
+            bit = word.bit_length() - 1
+            yield position * 64 + bit
+            word ^= 1 << bit
+
+
+def group_recipes(bitmap, matched, size):
+    """Элементы выдачи группы по убыванию id рецепта."""
+    for recipe_id in iter_bits(bitmap):
+        yield recipe_id, matched, size - matched
+
+
+def group_key(group):
+    """
+    Ключ сортировки группы (совпало, всего ингредиентов): сначала
+    меньше недостающих, затем больше доля совпадений.
+    """
+    matched, size = group
+    return size - matched, -matched / size
+
+
+class Matches:
+    """
+    Ленивая выдача IngredientIndex.match: len() — число рецептов,
+    срез — элементы (recipe_id, совпало, не хватает). Подходит
+    для пагинатора: считаются только группы до конца среза.
+    """
+
+    def __init__(self, index, ingredient_ids):
+        self.size_bitmaps = index.size_bitmaps
+        self.union = 0
+        # Разряды двоичного счётчика: бит рецепта в layers[level] —
+        # бит level числа совпавших у рецепта ингредиентов.
+        self.layers = []
+        self.most_matched = 0
+        for ingredient_id in ingredient_ids:
+            posting = index.postings.get(ingredient_id)
+            if not posting:
+                continue
+            carry = as_bitmap(posting)
+            self.union |= carry
+            self.most_matched += 1
+            for level, layer in enumerate(self.layers):
+                self.layers[level], carry = layer ^ carry, layer & carry
+                if not carry:
+                    break
+            else:
+                self.layers.append(carry)
+        self.count = popcount(self.union)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('Matches поддерживает только срезы.')
+        start, stop, step = key.indices(self.count)
+        return list(islice(self.iter_from(start),
+                           max(stop - start, 0)))[::step]
+
+    def __iter__(self):
+        return self.iter_from()
+
+    def iter_from(self, start=0):
+        """
+        Рецепты в порядке выдачи, начиная с позиции start: группы
+        целиком до неё пропускаются по числу рецептов в них.
+        """
+        matched_bitmaps = {}
+        for _, groups in groupby(self.groups(), key=group_key):
+            bitmaps = []
+            for matched, size in groups:
+                if matched not in matched_bitmaps:
+                    matched_bitmaps[matched] = self.matched_bitmap(matched)
+                group = matched_bitmaps[matched] & self.size_bitmaps[size]
+                if group:
+                    bitmaps.append((group, matched, size))
+            if start:
+                count = sum(popcount(group) for group, _, _ in bitmaps)
+                if start >= count:
+                    start -= count
+                    continue
+            # Группы с равным ключом (например, все без недостающих)
+            # сливаются по убыванию id.
+            recipes = merge(*(group_recipes(*bitmap) for bitmap in bitmaps),
+                            reverse=True)
+            yield from islice(recipes, start, None)
+            start = 0
+
+    def groups(self):
+        """Пары (совпало, всего ингредиентов) в порядке выдачи."""
+        return sorted(
+            ((matched, size)
+             for matched in range(1, self.most_matched + 1)
+             for size in self.size_bitmaps if size >= matched),
+            key=group_key)
+
+    def matched_bitmap(self, matched):
+        """Рецепты, у которых совпало ровно matched ингредиентов."""
+        bitmap = self.union
+        for level, layer in enumerate(self.layers):
+            bitmap &= layer if matched >> level & 1 else ~layer
+        return bitmap
+
+
+class IngredientIndex:
+    """Неизменяемый снимок обратного индекса."""
+
+    def __init__(self, postings, size_bitmaps, built_at=None):
+        self.postings = postings
+        self.size_bitmaps = size_bitmaps
+        self.built_at = (time.monotonic() if built_at is None
+                         else built_at)
+
+    @classmethod
+    def build(cls):
+        """Строит индекс по текущему содержимому IngredientRecipe."""
+        postings = {}
+        recipe_sizes = Counter()
+        rows = (IngredientRecipe.objects
+                .order_by('ingredient', 'recipe')
+                .values_list('ingredient', 'recipe')
+                .iterator(chunk_size=BUILD_CHUNK_SIZE))
+        for ingredient_id, recipe_id in rows:
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array('q')
+            postings[ingredient_id].append(recipe_id)
+            recipe_sizes[recipe_id] += 1
+        by_size = defaultdict(list)
+        for recipe_id, size in recipe_sizes.items():
+            by_size[size].append(recipe_id)
+        return cls(
+            {ingredient_id: compact(recipe_ids)
+             for ingredient_id, recipe_ids in postings.items()},
+            {size: to_bitmap(recipe_ids)
+             for size, recipe_ids in by_size.items()})
+
+    def match(self, ingredient_ids):
+        """
+        Ранжирует рецепты, в которых есть хотя бы один из ингредиентов.
+        Возвращает Matches с элементами (recipe_id, совпало,
+        не хватает): сначала рецепты с меньшим числом недостающих
+        ингредиентов, затем с большей долей совпадений, затем более
+        новые.
+        """
+        return Matches(self, set(ingredient_ids))
+
+    def updated(self, recipe_id, ingredient_ids):
+        """
+        Копия индекса, в которой рецепт recipe_id состоит
+        из ingredient_ids (пустой список — рецепт удалён).
+        Неизменённые множества рецептов общие с исходным индексом.
+        """
+        new = set(ingredient_ids)
+        old = {ingredient_id
+               for ingredient_id, posting in self.postings.items()
+               if contains(posting, recipe_id)}
+        postings = dict(self.postings)
+        for ingredient_id in old - new:
+            posting = with_recipe(postings[ingredient_id], recipe_id, False)
+            if posting:
+                postings[ingredient_id] = posting
+            else:
+                del postings[ingredient_id]
+        for ingredient_id in new - old:
+            postings[ingredient_id] = with_recipe(
+                postings.get(ingredient_id, array('q')), recipe_id, True)
+        size_bitmaps = dict(self.size_bitmaps)
+        if len(old) != len(new):
+            if old:
+                bitmap = with_recipe(size_bitmaps[len(old)], recipe_id, False)
+                if bitmap:
+                    size_bitmaps[len(old)] = bitmap
+                else:
+                    del size_bitmaps[len(old)]
+            if new:
+                size_bitmaps[len(new)] = with_recipe(
+                    size_bitmaps.get(len(new), 0), recipe_id, True)
+        return IngredientIndex(postings, size_bitmaps, self.built_at)
+
+
+_index = None
+# Сборку и обновления из потока шины выполняем по очереди: иначе
+# обновление, пришедшее во время сборки, потерялось бы.
+_lock = threading.Lock()
+
+
+def get_index():
+    """Текущий индекс процесса, при необходимости перестраивается."""
+    global _index
+    with _lock:
+        if (_index is None
+                or time.monotonic() - _index.built_at > INDEX_TTL):
+            _index = IngredientIndex.build()
+        return _index
+
+
+def invalidate(pk=None):
+    """
+    Обновляет индекс процесса после изменения рецепта pk;
+    pk=None — сбрасывает индекс целиком.
+    """
+    global _index
+    with _lock:
+        if pk is None or _index is None:
+            _index = None
+            return
+        _index = _index.updated(pk, IngredientRecipe.objects.filter(
+            recipe=pk).values_list('ingredient', flat=True))
+
+
+invalidation.register('foodgram_app.Recipe', invalidate)
@@ -0,0 +1,220 @@
+"""
+Снимок взаимодействий пользователя с рецептами и авторами:
+id рецептов в избранном и в корзине и id авторов, на которых
+он подписан.
+
+Поля is_favorited, is_in_shopping_cart и is_subscribed проверяют
+принадлежность id снимку вместо запроса exists() на каждый объект.
+Снимок загружается тремя запросами один раз за запрос
+(interactions_for) и хранится в кеше между запросами. Ключ кеша
+содержит версию пользователя. После коммита любой записи Favorite,
+ShoppingCart или Follow этого пользователя (см. foodgram_app.signals)
+invalidate() отправляет id пользователя в шину инвалидации
+(foodgram_app.invalidation), и каждый процесс удаляет версию
+из своего кеша (кеш по умолчанию — в памяти процесса), поэтому
+устаревший снимок не читается ни одним рабочим процессом. Событие
+без id (много пользователей, переподключение к шине) меняет
+поколение ключей процесса — сбрасывает все его снимки.
+
+Те же записи попадают в журнал InteractionChange, по которому клиент
+синхронизирует своё состояние (user_state, api/users/me/state/):
+без ?since= — полный снимок, с ?since=<курсор> — только изменения.
+id строк выдаются при вставке, а видны после коммита, поэтому
+на PostgreSQL курсор — pg_snapshot_xmin на момент чтения (как в ленте
+foodgram_app.changes): все транзакции с меньшим xid уже завершены,
+и клиенту отдаются строки с xid не меньше его курсора. Строки
+транзакций, завершившихся до чтения, могут прийти повторно —
+повторное применение безопасно, клиент получает итоговое состояние
+каждого объекта. На SQLite пишущие транзакции идут по очереди,
+и курсор — последний id.
+"""
+import uuid
+
+from django.core.cache import caches
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from foodgram_main.metrics import count_cache
+from foodgram_users.models import Follow
+
+from . import invalidation
+from .bulk import insert_rows
+from .changes import snapshot_xmin
+from .models import Favorite, InteractionChange, ShoppingCart
+
+CACHE_ALIAS = 'default'
+CACHE_TIMEOUT = 10 * 60
+INVALIDATION_LABEL = 'foodgram_app.interactions'
+# Модель -> (вид изменения в журнале, поле с id объекта).
+CHANGE_KINDS = {
+    Favorite: (InteractionChange.FAVORITE, 'recipe_id'),
+    ShoppingCart: (InteractionChange.SHOPPING_CART, 'recipe_id'),
+    Follow: (InteractionChange.SUBSCRIPTION, 'author_id'),
+}
+# Вид изменения -> ключ в ответе user_state, в порядке снимка load().
+STATE_KEYS = {
+    InteractionChange.FAVORITE: 'favorites',
+    InteractionChange.SHOPPING_CART: 'shopping_cart',
+    InteractionChange.SUBSCRIPTION: 'subscriptions',
+}
+
+
+class UserInteractions:
+    """Множества id, с которыми взаимодействовал пользователь."""
+
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+        self.following = frozenset(following)
+
+    def is_favorited(self, recipe_id):
+        return recipe_id in self.favorites
+
+    def is_in_shopping_cart(self, recipe_id):
+        return recipe_id in self.cart
+
+    def is_subscribed(self, author_id):
+        return author_id in self.following
+
+
+EMPTY = UserInteractions()
+# Поколение ключей процесса: меняется при сбросе всех снимков.
+_generation = uuid.uuid4().hex
+
+
+def version_key(user_id):
+    return f'interactions:{_generation}:{user_id}:version'
+
+
+def load(user_id):
+    """Отсортированные кортежи id из базы."""
+    return tuple(
+        tuple(model.objects.filter(user=user_id).order_by(field)
+              .values_list(field, flat=True))
+        for model, field in ((Favorite, 'recipe'),
+                             (ShoppingCart, 'recipe'),
+                             (Follow, 'author'))
+    )
+
+
+def get_interactions(user):
+    """Снимок пользователя из кеша или из базы."""
+    if user is None or user.is_anonymous:
+        return EMPTY
+    cache = caches[CACHE_ALIAS]
+    # Версия — случайная строка: после вытеснения ключа версии
+    # старый снимок не может совпасть с новой версией.
+    version = cache.get_or_set(version_key(user.pk), uuid.uuid4().hex,
+                               None)
+    key = f'interactions:{user.pk}:{version}'
+    data = cache.get(key)
+    count_cache('interactions', data is not None)
+    if data is None:
+        data = load(user.pk)
+        cache.set(key, data, CACHE_TIMEOUT)
+    return UserInteractions(*data)
+
+
+def interactions_for(request):
+    """Снимок пользователя запроса, один на запрос."""
+    if request is None:
+        return EMPTY
+    if not hasattr(request, '_interactions'):
+        request._interactions = get_interactions(request.user)
+    return request._interactions
+
+
+def invalidate(user_id):
+    """Сбрасывает снимок пользователя во всех процессах после коммита."""
+    invalidation.publish(INVALIDATION_LABEL, user_id)
+
+
+def invalidate_many(user_ids):
+    """Сбрасывает снимки пользователей во всех процессах после коммита."""
+    for user_id in set(user_ids):
+        invalidation.publish(INVALIDATION_LABEL, user_id)
+
+
+def forget(user_id=None):
+    """
+    Обработчик шины: удаляет версию пользователя из кеша процесса,
+    user_id=None — сбрасывает снимки всех пользователей.
+    """
+    global _generation
+    if user_id is None:
+        _generation = uuid.uuid4().hex
+    else:
+        caches[CACHE_ALIAS].delete(version_key(user_id))
+
+
+def record_change(instance, added):
+    """Записывает добавление или удаление instance в журнал."""
+    kind, field = CHANGE_KINDS[type(instance)]
+    # Без объекта модели: xid заполняет значение по умолчанию в базе.
+    insert_rows(InteractionChange, ('user', 'object_id'),
+                [(instance.user_id, getattr(instance, field))],
+                kind=kind, added=added, created_at=timezone.now())
+
+
+def record_removals(model, rows):
+    """
+    Записывает в журнал удаление строк model, удалённых
+    без сигналов; rows — пары (user_id, id объекта).
+    """
+    insert_rows(InteractionChange, ('user', 'object_id'), rows,
+                kind=CHANGE_KINDS[model][0], added=False,
+                created_at=timezone.now())
+
+
+def user_state(user, since=None):
+    """
+    Состояние пользователя для клиента: {'cursor', 'full', 'favorites',
+    'shopping_cart', 'subscriptions'}, для каждого вида — списки
+    added и removed. full=True — полный снимок (added заменяет
+    состояние клиента): без since или если журнал после since
+    уже очищен.
+    """
+    xmin = snapshot_xmin()
+    if xmin is None:
+        bounds = InteractionChange.objects.aggregate(
+            first=Min('id'), last=Max('id'))
+        cursor = bounds['last'] or 0
+        # Курсор first - 1 указывает перед первой строкой журнала.
+        oldest = bounds['first'] and bounds['first'] - 1
+        after = {'id__gt': since, 'id__lte': cursor}
+    else:
+        cursor = xmin
+        oldest = InteractionChange.objects.aggregate(
+            first=Min('xid'))['first']
+        after = {'xid__gte': since}
+    full = (since is None or since > cursor
+            or oldest is not None and since < oldest)
+    state = {key: {'added': [], 'removed': []}
+             for key in STATE_KEYS.values()}
+    if full:
+        for key, ids in zip(STATE_KEYS.values(), load(user.pk)):
+            state[key]['added'] = list(ids)
+    else:
+        latest = {}
+        for kind, object_id, added in InteractionChange.objects.filter(
+                user=user, **after,
+        ).order_by('id').values_list('kind', 'object_id', 'added'):
+            latest[kind, object_id] = added
+        for (kind, object_id), added in sorted(latest.items()):
+            state[STATE_KEYS[kind]]['added' if added else 'removed'].append(
+                object_id)
+    return {'cursor': str(cursor), 'full': full, **state}
+
+
+def prune_changes(before):
+    """
+    Удаляет записи журнала старше before, кроме последней:
+    по ней user_state отличает очищенный журнал от пустого.
+    Клиенты с более старым курсором получат полный снимок.
+    """
+    last = InteractionChange.objects.aggregate(last=Max('id'))['last']
+    return InteractionChange.objects.filter(
+        created_at__lt=before, id__lt=last or 0).delete()[0]
+
+
+invalidation.register(INVALIDATION_LABEL, forget)
@@ -0,0 +1,217 @@
+"""
+Шина инвалидации кешей процессов.
+
+Кеши в памяти процесса (например, обратный индекс ингредиентов)
+регистрируют обработчик для модели: register('foodgram_app.Recipe',
+handler), или для своей метки (снимки foodgram_app.interactions).
+publish(model, pk) внутри транзакции только запоминает изменённую
+строку; после коммита все изменения транзакции рассылаются одним
+событием {"models": {модель: [pk, ...]}}:
+обработчики своего процесса вызываются как handler(pk), а
+остальным процессам событие уходит:
+    * на PostgreSQL — через NOTIFY в канал CHANNEL; фоновый поток
+      Listener каждого процесса слушает канал (LISTEN);
+    * на SQLite NOTIFY нет, поэтому после коммита увеличивается
+      версия модели в CacheVersion, а Listener раз в POLL_INTERVAL
+      секунд сравнивает версии и при изменении вызывает
+      handler(None) — сбросить кеш модели целиком.
+Запись идёт после коммита и вне транзакции вызывающего кода:
+изменения модели не ждут друг друга на общей строке счётчика.
+Если строк модели в событии больше MAX_EVENT_PKS, вместо списка
+отправляется null — сбросить кеш модели целиком (размер сообщения
+NOTIFY ограничен).
+После переподключения к PostgreSQL события могли быть пропущены,
+поэтому все зарегистрированные кеши сбрасываются целиком.
+Listener запускается start_listener() в каждом рабочем процессе
+(см. foodgram_main/wsgi.py).
+"""
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from collections import defaultdict
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+
+from .models import CacheVersion
+
+CHANNEL = 'foodgram_cache'
+POLL_INTERVAL = 1.0
+MAX_EVENT_PKS = 200
+RECONNECT_DELAY = 5.0
+# Отличает события своего процесса, уже обработанные локально.
+ORIGIN = uuid.uuid4().hex
+
+logger = logging.getLogger(__name__)
+
+_handlers = defaultdict(list)
+# Версии моделей на прошлом опросе (None — опроса ещё не было).
+_versions = None
+# Изменения текущей транзакции потока: {модель: множество pk}.
+_pending = threading.local()
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def register(label, handler):
+    """Подписывает handler(pk) на изменения модели label."""
+    _handlers[label].append(handler)
+
+
+def dispatch(label, pk=None):
+    """Вызывает обработчики модели; pk=None — сбросить всё."""
+    for handler in _handlers.get(label, ()):
+        try:
+            handler(pk)
+        except Exception:
+            logger.exception('Ошибка обработчика инвалидации %s', label)
+
+
+def dispatch_all():
+    """Сбрасывает все зарегистрированные кеши."""
+    for label in list(_handlers):
+        dispatch(label)
+
+
+def next_version(label):
+    """Увеличивает и возвращает версию модели (опрос на SQLite)."""
+    CacheVersion.objects.get_or_create(label=label)
+    CacheVersion.objects.filter(label=label).update(
+        version=F('version') + 1)
+    return CacheVersion.objects.filter(label=label).values_list(
+        'version', flat=True).get()
+
+
+def publish(model, pk):
+    """
+    Сообщает всем процессам об изменении строки pk модели model
+    (pk=None — изменено много строк). Вместо модели можно передать
+    метку кеша, не привязанного к одной модели. Событие уходит после
+    коммита, одно на транзакцию.
+    """
+    changes = getattr(_pending, 'changes', None)
+    if changes is None:
+        changes = _pending.changes = defaultdict(set)
+    label = model if isinstance(model, str) else model._meta.label
+    changes[label].add(pk)
+    # Колбэк регистрируется на каждый вызов: после отката точки
+    # сохранения Django выбрасывает её колбэки, и событие уйдёт
+    # с первым оставшимся, остальные ничего не делают. Изменения
+    # откаченной транзакции уйдут со следующим событием потока —
+    # лишний сброс кеша безвреден.
+    transaction.on_commit(send_pending)
+
+
+def event_pks(pks):
+    """Список pk для события или None — сбросить модель целиком."""
+    if None in pks or len(pks) > MAX_EVENT_PKS:
+        return None
+    return sorted(pks)
+
+
+def send_pending():
+    """Рассылает накопленные изменения: после коммита транзакции."""
+    changes = getattr(_pending, 'changes', None)
+    if not changes:
+        return
+    _pending.changes = None
+    models = {label: event_pks(pks) for label, pks in changes.items()}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [
+                CHANNEL, json.dumps({'models': models, 'origin': ORIGIN})])
+    else:
+        for label in models:
+            with transaction.atomic():
+                next_version(label)
+    dispatch_event(models)
+
+
+def dispatch_event(models):
+    """Вызывает обработчики по событию {модель: [pk, ...] или None}."""
+    for label, pks in models.items():
+        for pk in (None,) if pks is None else pks:
+            dispatch(label, pk)
+
+
+def handle_notification(payload):
+    """Обрабатывает событие, полученное через LISTEN."""
+    event = json.loads(payload)
+    if event.get('origin') != ORIGIN:
+        dispatch_event(event['models'])
+
+
+def poll_once():
+    """
+    Сбрасывает кеши моделей, версия которых изменилась с прошлого
+    опроса. Строка версии создаётся при первом изменении модели,
+    поэтому новая строка — тоже изменение.
+    """
+    global _versions
+    versions = dict(CacheVersion.objects.values_list('label', 'version'))
+    if _versions is not None:
+        for label, version in versions.items():
+            if _versions.get(label, 0) != version:
+                dispatch(label)
+    _versions = versions
+
+
+class Listener(threading.Thread):
+    """Фоновый поток процесса, получающий события других процессов."""
+
+    def __init__(self):
+        super().__init__(name='cache-invalidation', daemon=True)
+        self.stopped = threading.Event()
+        self.pid = os.getpid()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                if connection.vendor == 'postgresql':
+                    self.listen()
+                else:
+                    poll_once()
+                    self.stopped.wait(POLL_INTERVAL)
+            except Exception:
+                # Поток не должен умирать: пробуем переподключиться.
+                logger.exception('Шина инвалидации: ошибка базы')
+                connection.close()
+                self.stopped.wait(RECONNECT_DELAY)
+        connection.close()
+
+    def listen(self):
+        """LISTEN на отдельном соединении до остановки или ошибки."""
+        database = connections['default']
+        raw = database.get_new_connection(database.get_connection_params())
+        try:
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            dispatch_all()
+            while not self.stopped.is_set():
+                if select.select([raw], [], [], POLL_INTERVAL)[0]:
+                    raw.poll()
+                    while raw.notifies:
+                        handle_notification(raw.notifies.pop(0).payload)
+        finally:
+            raw.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_listener():
+    """
+    Запускает Listener в текущем процессе, если он ещё не запущен
+    (после fork поток родителя в дочернем процессе не работает).
+    """
+    global _listener
+    with _listener_lock:
+        if (_listener is None or not _listener.is_alive()
+                or _listener.pid != os.getpid()):
+            _listener = Listener()
+            _listener.start()
+    return _listener
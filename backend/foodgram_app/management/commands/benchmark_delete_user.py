@@ -0,0 +1,106 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from foodgram_app.deletion import delete_user
+from foodgram_app.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+)
+
+User = get_user_model()
+
+RecipeTag = Recipe.tags.through
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными."""
+
+
+class Command(BaseCommand):
+    """
+    Сравнение удаления автора с --recipes рецептами через
+    foodgram_app.deletion и через стандартный Model.delete():
+    время и пиковая память (tracemalloc). Данные создаются
+    во временной транзакции и откатываются после замера.
+    """
+    help = 'Измеряет скорость удаления пользователя с рецептами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Число рецептов автора.')
+        parser.add_argument('--ingredients', type=int, default=5,
+                            help='Ингредиентов в рецепте.')
+        parser.add_argument('--favorites', type=int, default=3,
+                            help='Добавлений в избранное на рецепт.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                author = self.create_data(options)
+                for title, delete in (
+                        ('foodgram_app.deletion', delete_user),
+                        ('Model.delete()', lambda user: user.delete())):
+                    savepoint = transaction.savepoint()
+                    self.measure(title, delete, author)
+                    transaction.savepoint_rollback(savepoint)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_data(self, options):
+        author = User.objects.create_user(
+            username='benchmark_author', email='bench@example.com',
+            password='benchmark')
+        readers = [
+            User.objects.create_user(
+                username=f'benchmark_reader{number}',
+                email=f'reader{number}@example.com', password='benchmark')
+            for number in range(options['favorites'])
+        ]
+        tag = Tag.objects.create(name='benchmark', slug='benchmark')
+        ingredients = [
+            Ingredient.objects.create(name=f'benchmark {number}',
+                                      measurement_unit='г')
+            for number in range(options['ingredients'])
+        ]
+        Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=10,
+                   image='foodgram_app/images/benchmark.png',
+                   short_link=f'benchmark-{number}')
+            for number in range(options['recipes'])
+        ], batch_size=1000)
+        recipe_ids = list(Recipe.objects.filter(
+            author=author).values_list('pk', flat=True))
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe_id=recipe_id, tag=tag)
+            for recipe_id in recipe_ids
+        ], batch_size=1000)
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe_id=recipe_id, ingredient=ingredient,
+                             amount=1)
+            for recipe_id in recipe_ids for ingredient in ingredients
+        ], batch_size=1000)
+        Favorite.objects.bulk_create([
+            Favorite(user=reader, recipe_id=recipe_id)
+            for recipe_id in recipe_ids for reader in readers
+        ], batch_size=1000)
+        return author
+
+    def measure(self, title, delete, author):
+        author = User.objects.get(pk=author.pk)
+        tracemalloc.start()
+        started = time.monotonic()
+        delete(author)
+        elapsed = time.monotonic() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(f'{title}: {elapsed:.1f} s, '
+                          f'пиковая память {peak / 2 ** 20:.1f} MB')
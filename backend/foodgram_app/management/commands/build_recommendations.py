@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+
+from foodgram_app.recommendations import (
+    compute_similarities,
+    save_similarities,
+)
+
+
+class Command(BaseCommand):
+    """
+    Пересчёт похожих рецептов (SimilarRecipe) по избранному.
+    Запускается по расписанию; с --recipe пересчитывает
+    только указанные рецепты.
+    """
+    help = 'Пересчитывает похожие рецепты по избранному.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe', type=int, action='append', dest='recipes',
+            help='id рецепта для пересчёта, можно указать несколько раз.')
+
+    def handle(self, *args, **options):
+        recipe_ids = options['recipes']
+        neighbours = compute_similarities(recipe_ids)
+        changed = save_similarities(neighbours, recipe_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны, изменилось: {changed}.'))
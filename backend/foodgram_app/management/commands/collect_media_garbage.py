@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import BaseCommand
+
+from foodgram_app.media_gc import BATCH_SIZE, MIN_AGE, collect_garbage
+
+
+class Command(BaseCommand):
+    """
+    Удаление медиафайлов, на которые не ссылается ни один рецепт
+    или пользователь (см. foodgram_app.media_gc). Запускается
+    по cron или, с --every, как постоянный фоновый процесс.
+    """
+    help = 'Удаляет или переносит в карантин медиафайлы без ссылок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только найти файлы, ничего не удалять.')
+        parser.add_argument('--quarantine',
+                            help='Переносить файлы в этот каталог.')
+        parser.add_argument('--min-age', type=int, default=MIN_AGE,
+                            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='Файлов в одной порции.')
+        parser.add_argument('--every', type=int,
+                            help='Повторять раз в столько секунд.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.collect(options)
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def collect(self, options):
+        report = None
+        if options['verbosity'] > 1:
+            def report(name, size):
+                self.stdout.write(f'{name} ({size} B)')
+        stats = collect_garbage(
+            dry_run=options['dry_run'], quarantine=options['quarantine'],
+            min_age=options['min_age'], batch_size=options['batch_size'],
+            report=report)
+        if options['dry_run']:
+            action = 'найдено'
+        elif options['quarantine']:
+            action = 'перенесено в карантин'
+        else:
+            action = 'удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {stats.scanned} за {stats.elapsed:.1f} s '
+            f'({stats.files_per_second:.0f} файлов/с), без ссылок '
+            f'{action}: {stats.orphaned} '
+            f'({stats.orphaned_bytes / 2 ** 20:.1f} MB).'))
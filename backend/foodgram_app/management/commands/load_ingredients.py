@@ -3,6 +3,7 @@ import csv
 from django.core.management import BaseCommand
 
 from foodgram_app.models import Ingredient
+from foodgram_app.units import normalize_unit
 
 
 class Command(BaseCommand):
@@ -17,7 +18,7 @@ class Command(BaseCommand):
                 ingredients.append(
                     Ingredient(
                         name=row[0].strip(),
-                        measurement_unit=row[1].strip()
+                        measurement_unit=normalize_unit(row[1])
                     )
                 )
         Ingredient.objects.bulk_create(ingredients, ignore_conflicts=True)
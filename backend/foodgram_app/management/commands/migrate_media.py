@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from foodgram_app.storage import migrate_media, recount_references
+
+
+class Command(BaseCommand):
+    """
+    Перенос загруженных ранее медиафайлов в хранилище
+    с адресацией по содержимому: файлы получают хеш-имена
+    (одинаковые сливаются в один), строки моделей обновляются,
+    счётчики ссылок MediaFile пересчитываются по базе.
+    """
+    help = 'Переносит медиафайлы под хеш-имена и пересчитывает ссылки.'
+
+    def handle(self, *args, **options):
+        moved, missing = migrate_media()
+        for name in missing:
+            self.stdout.write(self.style.WARNING(f'Нет файла: {name}'))
+        diff = recount_references()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено файлов: {moved}, '
+            f'исправлено счётчиков ссылок: {len(diff)}.'))
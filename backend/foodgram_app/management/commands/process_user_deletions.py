@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand
+
+from foodgram_app.deletion import process_user_deletions
+
+
+class Command(BaseCommand):
+    """
+    Фоновое удаление пользователей из очереди UserDeletion
+    (запускается по cron). Рецепты удаляются порциями,
+    каждая в своей транзакции.
+    """
+    help = 'Удаляет пользователей, поставленных в очередь на удаление.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int,
+                            help='Не больше стольких пользователей за запуск.')
+
+    def handle(self, *args, **options):
+        deleted = process_user_deletions(options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено пользователей: {deleted}.'))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from foodgram_app.interactions import prune_changes
+
+
+class Command(BaseCommand):
+    """
+    Очистка журнала InteractionChange: клиенты, не синхронизировавшиеся
+    дольше --days дней, получат полный снимок вместо изменений.
+    """
+    help = 'Удаляет старые записи журнала изменений взаимодействий.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Сколько дней хранить журнал.')
+
+    def handle(self, *args, **options):
+        deleted = prune_changes(
+            timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено записей журнала: {deleted}.'))
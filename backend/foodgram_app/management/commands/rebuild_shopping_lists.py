@@ -0,0 +1,31 @@
+from django.core.management import BaseCommand
+
+from foodgram_app.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    """
+    Проверка согласованности таблицы ShoppingListItem:
+    пересчитывает списки покупок с нуля и выводит расхождения.
+    """
+    help = 'Пересобирает списки покупок и выводит расхождения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только показать расхождения, не изменяя таблицу.')
+
+    def handle(self, *args, **options):
+        diff = rebuild_shopping_lists(commit=not options['check'])
+        for (user, ingredient), (actual, expected) in sorted(diff.items()):
+            self.stdout.write(
+                f'user={user} ingredient={ingredient}: '
+                f'{actual} -> {expected}')
+        if not diff:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(
+                f'Найдено расхождений: {len(diff)}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено расхождений: {len(diff)}.'))
@@ -0,0 +1,59 @@
+from django.core.management import BaseCommand
+
+from foodgram_app.models import SlowQuery
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'calls': '-calls',
+    'recent': '-last_seen',
+}
+SQL_WIDTH = 120
+
+
+class Command(BaseCommand):
+    """
+    Сводка журнала медленных запросов (см. foodgram_app.query_log):
+    отпечатки SQL по вьюхам с числом медленных выполнений, средним
+    и максимальным временем и, с --plans, снятыми планами.
+    """
+    help = 'Выводит статистику медленных запросов к базе.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', choices=ORDERINGS, default='total',
+                            help='Сортировка: суммарное время, максимум, '
+                                 'число выполнений или последние.')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Сколько отпечатков вывести.')
+        parser.add_argument('--view',
+                            help='Только вьюхи, содержащие эту строку.')
+        parser.add_argument('--plans', action='store_true',
+                            help='Вывести планы выполнения.')
+        parser.add_argument('--reset', action='store_true',
+                            help='Очистить журнал.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено записей: {deleted}.'))
+            return
+        queries = SlowQuery.objects.order_by(ORDERINGS[options['order']])
+        if options['view']:
+            queries = queries.filter(view__icontains=options['view'])
+        for query in queries[:options['limit']]:
+            sql = query.sql
+            if options['verbosity'] < 2 and len(sql) > SQL_WIDTH:
+                sql = sql[:SQL_WIDTH - 1] + '…'
+            self.stdout.write(
+                f'{query.calls:>7} × {query.total_ms / query.calls:>9.1f} ms '
+                f'(макс. {query.max_ms:.1f} ms, всего '
+                f'{query.total_ms / 1000:.1f} s)  {query.view}  '
+                f'[{query.fingerprint[:8]}]')
+            self.stdout.write(f'    {sql}')
+            if options['plans'] and query.plan:
+                self.stdout.write(
+                    f'    План ({query.explained_at:%Y-%m-%d %H:%M}, '
+                    f'{query.plan_ms:.1f} ms):')
+                for line in query.plan.splitlines():
+                    self.stdout.write(f'      {line}')
@@ -0,0 +1,168 @@
+"""
+Сборка мусора в медиахранилище: удаление файлов, на которые
+не ссылается ни одна строка полей MEDIA_FIELDS.
+
+Счётчики MediaFile снимают ссылки при удалении и замене файлов
+(см. foodgram_app.storage), но на диске остаются файлы, загруженные
+до перехода на хранилище, брошенные прерванными загрузками
+и удалённые в обход сигналов. collect_garbage читает из базы
+множество имён файлов (потоково, через iterator()), обходит
+каталог хранилища через os.scandir и удаляет или переносит
+в карантин файлы без ссылок порциями по batch_size.
+
+Файлы моложе min_age не трогаются: строка, которая ссылается
+на только что загруженный файл, может быть ещё не закоммичена
+(повторная загрузка того же содержимого обновляет время изменения
+файла). Сама проверка перед удалением идёт под той же блокировкой
+строк MediaFile, которую берёт загрузка (см. foodgram_app.storage):
+для файлов порции создаются недостающие строки с references = 0,
+строки блокируются, и удаляются только файлы, у которых под
+блокировкой references = 0 и нет ссылающихся строк. Загрузка,
+которая уже взяла ссылку, либо закоммитится раньше и файл
+останется, либо дождётся сборщика и запишет файл заново.
+Файлы, у которых счётчик ссылок расходится с базой, сборщик
+не трогает: их исправляет migrate_media (пересчёт ссылок).
+"""
+import os
+import shutil
+import time
+
+from django.db import transaction
+
+from .models import MediaFile, Recipe
+from .storage import media_fields
+
+BATCH_SIZE = 1000
+MIN_AGE = 60 * 60
+
+
+class GarbageStats:
+    """Итог сборки: просмотренные и найденные файлы, время."""
+
+    def __init__(self):
+        self.scanned = 0
+        self.orphaned = 0
+        self.orphaned_bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def files_per_second(self):
+        return self.scanned / self.elapsed if self.elapsed else 0.0
+
+
+def referenced_names(names=None):
+    """
+    Имена файлов, на которые ссылаются строки MEDIA_FIELDS.
+    names ограничивает проверку этими именами.
+    """
+    referenced = set()
+    for model, field in media_fields():
+        queryset = model.objects.exclude(
+            **{f'{field}__isnull': True}).exclude(**{field: ''})
+        if names is not None:
+            queryset = queryset.filter(**{f'{field}__in': names})
+        referenced.update(queryset.values_list(
+            field, flat=True).iterator(chunk_size=10000))
+    return referenced
+
+
+def media_files(root, skip=None):
+    """
+    Файлы под root: имя относительно root, размер и время изменения.
+    Каталог skip (карантин) не обходится, ссылки не разыменовываются.
+    """
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path != skip:
+                        directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    name = os.path.relpath(entry.path, root)
+                    yield (name.replace(os.sep, '/'), stat.st_size,
+                           stat.st_mtime)
+
+
+def remove_files(root, names, quarantine=None):
+    """Удаляет файлы или переносит их в quarantine с тем же путём."""
+    for name in names:
+        path = os.path.join(root, name)
+        try:
+            if quarantine is None:
+                os.remove(path)
+            else:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+        except FileNotFoundError:
+            pass
+
+
+def collect_garbage(dry_run=False, quarantine=None, min_age=MIN_AGE,
+                    batch_size=BATCH_SIZE, root=None, report=None):
+    """
+    Удаляет (или с quarantine переносит) файлы хранилища без ссылок.
+    С dry_run только считает их. report(name, size) вызывается
+    для каждого найденного файла. Возвращает GarbageStats.
+    """
+    root = os.path.abspath(
+        root or Recipe._meta.get_field('image').storage.location)
+    if quarantine is not None:
+        quarantine = os.path.abspath(quarantine)
+    stats = GarbageStats()
+    started = time.monotonic()
+    cutoff = time.time() - min_age
+    referenced = referenced_names()
+
+    def found(orphans):
+        stats.orphaned += len(orphans)
+        stats.orphaned_bytes += sum(size for _, size in orphans)
+        if report is not None:
+            for name, size in orphans:
+                report(name, size)
+
+    def flush(batch):
+        batch = sorted(batch)
+        names = [name for name, _ in batch]
+        if dry_run:
+            unreferenced = set(names) - referenced_names(names) - set(
+                MediaFile.objects.filter(
+                    name__in=names, references__gt=0).values_list(
+                    'name', flat=True))
+            found([item for item in batch if item[0] in unreferenced])
+            return
+        with transaction.atomic():
+            existing = set(MediaFile.objects.filter(
+                name__in=names).values_list('name', flat=True))
+            MediaFile.objects.bulk_create(
+                [MediaFile(name=name) for name in names
+                 if name not in existing],
+                ignore_conflicts=True)
+            locked = set(MediaFile.objects.select_for_update().filter(
+                name__in=names, references=0).order_by('name').values_list(
+                'name', flat=True))
+            unreferenced = locked - referenced_names(locked)
+            found([item for item in batch if item[0] in unreferenced])
+            # Вместе со строками файлов удаляются и созданные выше
+            # строки файлов, которые остаются.
+            MediaFile.objects.filter(
+                name__in=unreferenced | (set(names) - existing),
+                references=0).delete()
+            remove_files(root, sorted(unreferenced), quarantine)
+
+    batch = []
+    if os.path.isdir(root):
+        for name, size, modified in media_files(root, skip=quarantine):
+            stats.scanned += 1
+            if name in referenced or modified > cutoff:
+                continue
+            batch.append((name, size))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+    stats.elapsed = time.monotonic() - started
+    return stats
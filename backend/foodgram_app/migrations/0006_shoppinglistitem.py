@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    """Заполняет списки покупок по уже существующим корзинам."""
+    IngredientRecipe = apps.get_model('foodgram_app', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('foodgram_app', 'ShoppingListItem')
+    user_field = 'recipe__shoppingcart_recipes__user'
+    rows = (IngredientRecipe.objects
+            .filter(**{f'{user_field}__isnull': False})
+            .values(user_field, 'ingredient')
+            .annotate(total_amount=Sum('amount'))
+            .order_by()
+            .values_list(user_field, 'ingredient', 'total_amount'))
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                         total_amount=total)
+        for user, ingredient, total in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram_app', '0005_alter_favorite_recipe_alter_favorite_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Общее количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='foodgram_app.ingredient', verbose_name='Ингридиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='foodgram_app_shoppinglistitem_unique'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:30
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import foodgram_app.models
+
+POSTGRES_FORWARD = """
+UPDATE foodgram_app_recipe r SET search_vector =
+    setweight(to_tsvector('russian', coalesce(r.name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(r.text, '')), 'B')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM foodgram_app_ingredientrecipe ir
+        JOIN foodgram_app_ingredient i ON i.id = ir.ingredient_id
+        WHERE ir.recipe_id = r.id), '')), 'C');
+"""
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE foodgram_app_recipe_fts USING fts5(
+        name, text, ingredients,
+        tokenize = 'unicode61 remove_diacritics 2');
+    """,
+    # FTS5 не считает «ё» вариантом «е», см. foodgram_app.search.fold_yo.
+    """
+    INSERT INTO foodgram_app_recipe_fts (rowid, name, text, ingredients)
+    SELECT r.id,
+        replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'),
+        replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е'),
+        replace(replace(coalesce((
+            SELECT group_concat(i.name, ' ')
+            FROM foodgram_app_ingredientrecipe ir
+            JOIN foodgram_app_ingredient i ON i.id = ir.ingredient_id
+            WHERE ir.recipe_id = r.id), ''), 'ё', 'е'), 'Ё', 'Е')
+    FROM foodgram_app_recipe r;
+    """,
+]
+SQLITE_BACKWARD = ['DROP TABLE IF EXISTS foodgram_app_recipe_fts;']
+
+
+def create_search_index(apps, schema_editor):
+    """Заполнение векторов на PostgreSQL, FTS5 на SQLite."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0006_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=foodgram_app.models.SearchVectorIndex(fields=['search_vector'], name='recipe_search_vector_gin'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram_app', '0010_cacheversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('favorite', 'Избранное'), ('shopping_cart', 'Корзина'), ('subscription', 'Подписка')], max_length=16, verbose_name='Вид')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='id рецепта или автора')),
+                ('added', models.BooleanField(verbose_name='Добавлено')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Изменение взаимодействий',
+                'verbose_name_plural': 'Изменения взаимодействий',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='interactionchange',
+            index=models.Index(fields=['user', 'id'], name='foodgram_ap_user_id_90a777_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.16 on 2026-10-19 07:54
+
+from django.db import migrations, models
+
+
+def fill_recipe_changes(apps, schema_editor):
+    """Одна запись на каждый существующий рецепт — начало ленты."""
+    Recipe = apps.get_model('foodgram_app', 'Recipe')
+    RecipeChange = apps.get_model('foodgram_app', 'RecipeChange')
+    RecipeChange.objects.bulk_create([
+        RecipeChange(recipe_id=recipe_id)
+        for recipe_id in Recipe.objects.order_by('pk').values_list(
+            'pk', flat=True)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0011_interactionchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(verbose_name='id рецепта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Рецепт удалён')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'Изменение рецепта',
+                'verbose_name_plural': 'Изменения рецептов',
+                'ordering': ('id',),
+            },
+        ),
+        migrations.RunPython(fill_recipe_changes, migrations.RunPython.noop),
+    ]
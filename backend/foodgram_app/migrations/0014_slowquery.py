@@ -0,0 +1,39 @@
+# Generated by Django 3.2.16 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0013_userdeletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32, verbose_name='Отпечаток')),
+                ('view', models.CharField(max_length=200, verbose_name='Вьюха и действие')),
+                ('sql', models.TextField(verbose_name='Нормализованный SQL')),
+                ('calls', models.PositiveBigIntegerField(default=0, verbose_name='Медленных выполнений')),
+                ('total_ms', models.FloatField(default=0, verbose_name='Суммарное время, мс')),
+                ('max_ms', models.FloatField(default=0, verbose_name='Максимальное время, мс')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='Впервые')),
+                ('last_seen', models.DateTimeField(verbose_name='Последний раз')),
+                ('plan', models.TextField(blank=True, verbose_name='План выполнения')),
+                ('plan_ms', models.FloatField(blank=True, null=True, verbose_name='Время запроса с планом, мс')),
+                ('explained_at', models.DateTimeField(blank=True, null=True, verbose_name='План снят')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ('-total_ms',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='slowquery',
+            constraint=models.UniqueConstraint(fields=('fingerprint', 'view'), name='foodgram_app_slowquery_unique'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:40
+
+from django.db import migrations, models
+
+# Номер транзакции, записавшей строку: курсор ленты идёт по (xid, id).
+# Строки до миграции получают xid = 0 и остаются в начале ленты.
+POSTGRES_FORWARD = """
+ALTER TABLE foodgram_app_recipechange ALTER COLUMN xid
+    SET DEFAULT pg_current_xact_id()::text::bigint;
+UPDATE foodgram_app_recipechange SET xid = 0 WHERE xid IS NULL;
+"""
+POSTGRES_BACKWARD = """
+ALTER TABLE foodgram_app_recipechange ALTER COLUMN xid DROP DEFAULT;
+"""
+
+
+def set_xid_default(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_FORWARD)
+
+
+def drop_xid_default(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0014_slowquery'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='recipechange',
+            old_name='recipe_id',
+            new_name='object_id',
+        ),
+        migrations.AlterField(
+            model_name='recipechange',
+            name='object_id',
+            field=models.PositiveBigIntegerField(verbose_name='id рецепта, тега, ингредиента или автора'),
+        ),
+        migrations.AddField(
+            model_name='recipechange',
+            name='kind',
+            field=models.CharField(choices=[('recipe', 'Рецепт'), ('tag', 'Тег'), ('ingredient', 'Ингредиент'), ('author', 'Автор')], default='recipe', max_length=16, verbose_name='Вид'),
+        ),
+        migrations.AddField(
+            model_name='recipechange',
+            name='xid',
+            field=models.PositiveBigIntegerField(editable=False, null=True, verbose_name='Транзакция'),
+        ),
+        migrations.AddIndex(
+            model_name='recipechange',
+            index=models.Index(fields=['xid', 'id'], name='foodgram_ap_xid_af13ab_idx'),
+        ),
+        migrations.RunPython(set_xid_default, drop_xid_default),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.16 on 2026-10-19 10:20
+
+from django.db import migrations
+
+# Раньше 0007 создавала GIN-индекс сырым SQL под другим именем;
+# в базах, где она уже применена, индекс переименовывается под
+# объявленный в Recipe.Meta.indexes.
+POSTGRES_FORWARD = """
+ALTER INDEX IF EXISTS foodgram_app_recipe_search_vector_gin
+    RENAME TO recipe_search_vector_gin;
+"""
+
+
+def rename_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_FORWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0016_alter_recipe_author'),
+    ]
+
+    operations = [
+        migrations.RunPython(rename_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.16 on 2026-10-19 09:29
+
+from django.db import migrations, models
+
+# Номер транзакции, записавшей строку: курсор user_state идёт по xid.
+# Строки до миграции получают xid = 0: клиенты со старым курсором
+# получают их повторно, а не теряют.
+POSTGRES_FORWARD = """
+ALTER TABLE foodgram_app_interactionchange ALTER COLUMN xid
+    SET DEFAULT pg_current_xact_id()::text::bigint;
+UPDATE foodgram_app_interactionchange SET xid = 0 WHERE xid IS NULL;
+"""
+POSTGRES_BACKWARD = """
+ALTER TABLE foodgram_app_interactionchange ALTER COLUMN xid DROP DEFAULT;
+"""
+
+
+def set_xid_default(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_FORWARD)
+
+
+def drop_xid_default(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_app', '0017_rename_search_vector_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='interactionchange',
+            name='xid',
+            field=models.PositiveBigIntegerField(editable=False, null=True, verbose_name='Транзакция'),
+        ),
+        migrations.AddIndex(
+            model_name='interactionchange',
+            index=models.Index(fields=['user', 'xid'], name='foodgram_ap_user_id_0c133e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interactionchange',
+            index=models.Index(fields=['xid'], name='foodgram_ap_xid_af5134_idx'),
+        ),
+        migrations.RunPython(set_xid_default, drop_xid_default),
+    ]
@@ -3,6 +3,8 @@ import string
 
 from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
@@ -60,6 +62,22 @@ class Ingredient(models.Model):
         return self.name
 
 
+class SearchVectorIndex(GinIndex):
+    """
+    GIN-индекс поискового вектора на PostgreSQL. На SQLite вектор
+    не заполняется (поиск идёт через FTS5, см. foodgram_app.search),
+    и вместо GIN создаётся обычный индекс: миграции и пересоздание
+    таблицы рецептов работают на обеих базах.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using,
+                                      **kwargs)
+        return models.Index.create_sql(self, model, schema_editor, using,
+                                       **kwargs)
+
+
 class Recipe(models.Model):
     """Модель для отображения рецепта."""
     tags = models.ManyToManyField(
@@ -101,11 +119,18 @@ class Recipe(models.Model):
         verbose_name='Короткая ссылка',
         unique=True
     )
+    # Обновляется в foodgram_app.search.
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [SearchVectorIndex(fields=['search_vector'],
+                                     name='recipe_search_vector_gin')]
 
     @staticmethod
     def generate_short_code(length=3):
@@ -220,3 +245,289 @@ class ShoppingCart(UserRecipeRelation):
         default_related_name = 'shoppingcart_recipes'
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Готовый список покупок пользователя: сумма каждого ингредиента
+    по всем рецептам из корзины. Поддерживается инкрементально
+    (см. foodgram_app.shopping_list), чтобы выгрузка списка была
+    простым чтением по индексу, а не агрегацией по корзине.
+    """
+    user = models.ForeignKey(
+        'foodgram_users.User', on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингридиент')
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='%(app_label)s_%(class)s_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.ingredient} - {self.total_amount}'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Похожие рецепты: top-K соседей рецепта по совместному добавлению
+    в избранное. Заполняется командой build_recommendations
+    (см. foodgram_app.recommendations).
+    """
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт')
+    similar = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='neighbour_of',
+        verbose_name='Похожий рецепт')
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        ordering = ('recipe', '-score')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='%(app_label)s_%(class)s_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar} ({self.score:.2f})'
+
+
+class MediaFile(models.Model):
+    """
+    Файл медиа-хранилища с именем по хешу содержимого и числом
+    ссылающихся на него строк (см. foodgram_app.storage).
+    Файл удаляется с диска, когда ссылок не остаётся.
+    """
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла')
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число ссылок')
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+        ordering = ('name',)
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class CacheVersion(models.Model):
+    """
+    Версия данных модели для шины инвалидации кешей
+    (см. foodgram_app.invalidation): увеличивается при каждом
+    изменении строк модели.
+    """
+    label = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Модель')
+    version = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия кеша'
+        verbose_name_plural = 'Версии кешей'
+        ordering = ('label',)
+
+    def __str__(self):
+        return f'{self.label}: {self.version}'
+
+
+class InteractionChange(models.Model):
+    """
+    Журнал изменений избранного, корзины и подписок для синхронизации
+    клиента по ?since= (api/users/me/state/). xid — транзакция
+    PostgreSQL, записавшая строку (значение по умолчанию в базе):
+    курсор идёт по xid, на SQLite — по id, см. foodgram_app.interactions.
+    Пользователь хранится без ограничения внешнего ключа: записи
+    журнала появляются и при каскадном удалении самого пользователя.
+    """
+    FAVORITE = 'favorite'
+    SHOPPING_CART = 'shopping_cart'
+    SUBSCRIPTION = 'subscription'
+    KINDS = (
+        (FAVORITE, 'Избранное'),
+        (SHOPPING_CART, 'Корзина'),
+        (SUBSCRIPTION, 'Подписка'),
+    )
+    user = models.ForeignKey(
+        'foodgram_users.User', on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        verbose_name='Пользователь')
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS,
+        verbose_name='Вид')
+    object_id = models.PositiveBigIntegerField(
+        verbose_name='id рецепта или автора')
+    added = models.BooleanField(verbose_name='Добавлено')
+    xid = models.PositiveBigIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Транзакция')
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name = 'Изменение взаимодействий'
+        verbose_name_plural = 'Изменения взаимодействий'
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['user', 'id']),
+            models.Index(fields=['user', 'xid']),
+            models.Index(fields=['xid']),
+        ]
+
+    def __str__(self):
+        sign = '+' if self.added else '-'
+        return f'{self.user_id} {self.kind} {sign}{self.object_id}'
+
+
+class RecipeChange(models.Model):
+    """
+    Журнал изменений рецептов для ленты api/recipes/changes/:
+    только добавление строк. Строка пишется в той же транзакции,
+    что и изменение рецепта, его ингредиентов или тегов. Удаление
+    рецепта оставляет строку с deleted=True. Изменение тега,
+    ингредиента или автора записывается одной строкой с его id
+    (kind), а рецепты по ней находит читатель журнала. xid —
+    транзакция PostgreSQL, записавшая строку (значение по умолчанию
+    в базе): курсор ленты идёт по (xid, id), см. foodgram_app.changes.
+    """
+    RECIPE = 'recipe'
+    TAG = 'tag'
+    INGREDIENT = 'ingredient'
+    AUTHOR = 'author'
+    KINDS = (
+        (RECIPE, 'Рецепт'),
+        (TAG, 'Тег'),
+        (INGREDIENT, 'Ингредиент'),
+        (AUTHOR, 'Автор'),
+    )
+    kind = models.CharField(
+        max_length=16,
+        choices=KINDS,
+        default=RECIPE,
+        verbose_name='Вид')
+    object_id = models.PositiveBigIntegerField(
+        verbose_name='id рецепта, тега, ингредиента или автора')
+    deleted = models.BooleanField(
+        default=False,
+        verbose_name='Рецепт удалён')
+    xid = models.PositiveBigIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Транзакция')
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Время изменения')
+
+    class Meta:
+        verbose_name = 'Изменение рецепта'
+        verbose_name_plural = 'Изменения рецептов'
+        ordering = ('id',)
+        indexes = [models.Index(fields=['xid', 'id'])]
+
+    def __str__(self):
+        if self.kind != self.RECIPE:
+            return f'{self.get_kind_display()} {self.object_id}'
+        return f'{self.object_id}{" (удалён)" if self.deleted else ""}'
+
+
+class UserDeletion(models.Model):
+    """
+    Очередь удаления пользователей с большим числом рецептов:
+    пользователь деактивирован и удаляется по частям командой
+    process_user_deletions (см. foodgram_app.deletion).
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пользователь')
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Поставлен в очередь')
+
+    class Meta:
+        verbose_name = 'Удаление пользователя'
+        verbose_name_plural = 'Удаления пользователей'
+        ordering = ('created_at',)
+
+    def __str__(self):
+        return f'{self.user_id} ({self.created_at:%Y-%m-%d %H:%M})'
+
+
+class SlowQuery(models.Model):
+    """
+    Сводка медленных запросов к базе по отпечатку SQL и вьюхе
+    (см. foodgram_app.query_log). plan — последний снятый план
+    самого медленного выполнения.
+    """
+    fingerprint = models.CharField(
+        max_length=32,
+        verbose_name='Отпечаток')
+    view = models.CharField(
+        max_length=200,
+        verbose_name='Вьюха и действие')
+    sql = models.TextField(verbose_name='Нормализованный SQL')
+    calls = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Медленных выполнений')
+    total_ms = models.FloatField(
+        default=0,
+        verbose_name='Суммарное время, мс')
+    max_ms = models.FloatField(
+        default=0,
+        verbose_name='Максимальное время, мс')
+    first_seen = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Впервые')
+    last_seen = models.DateTimeField(verbose_name='Последний раз')
+    plan = models.TextField(
+        blank=True,
+        verbose_name='План выполнения')
+    plan_ms = models.FloatField(
+        null=True, blank=True,
+        verbose_name='Время запроса с планом, мс')
+    explained_at = models.DateTimeField(
+        null=True, blank=True,
+        verbose_name='План снят')
+
+    class Meta:
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+        ordering = ('-total_ms',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fingerprint', 'view'],
+                name='%(app_label)s_%(class)s_unique'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.view}: {self.sql[:80]}'
@@ -0,0 +1,43 @@
+"""
+Пагинатор для админки больших таблиц.
+
+Стандартный Paginator на каждой странице выполняет SELECT COUNT(*),
+что на PostgreSQL для десятков тысяч строк означает полный проход
+по таблице. Для списка без фильтров берётся оценка из статистики
+pg_class.reltuples; точный подсчёт выполняется, только если таблица
+маленькая, список отфильтрован или база не PostgreSQL.
+"""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+EXACT_COUNT_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator с оценочным count для больших неотфильтрованных таблиц."""
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is None or estimate < EXACT_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+    def estimate(self):
+        """Оценка числа строк из статистики или None."""
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is None or query.where:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None
+        return int(row[0])
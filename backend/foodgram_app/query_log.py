@@ -0,0 +1,220 @@
+"""
+Журнал медленных запросов к базе с планами выполнения.
+
+SlowQueryMiddleware на время запроса ставит обёртку
+connection.execute_wrapper на все подключения и запоминает
+запросы дольше SLOW_QUERY_THRESHOLD_MS миллисекунд. После ответа
+они сводятся по отпечатку — SQL, в котором литералы и параметры
+заменены на «?», а списки IN — на IN (...), — и по вьюхе с действием
+(например, RecipeViewSet.list) в таблицу SlowQuery: число
+медленных выполнений, суммарное и максимальное время.
+
+Планы снимаются только в случайной выборке HTTP-запросов с долей
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE (0 — выключены): EXPLAIN ANALYZE
+повторно выполняет запрос, и остальные запросы его не ждут.
+В выборке для самых медленных SELECT (не больше
+SLOW_QUERY_EXPLAINS_PER_REQUEST) снимается план: на PostgreSQL —
+EXPLAIN (ANALYZE, BUFFERS) с теми же параметрами и ограничением
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS в транзакции, которая затем
+откатывается, на SQLite — EXPLAIN QUERY PLAN. План отпечатка
+обновляется не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд или
+когда запрос стал вдвое медленнее, чем при прошлом снятии. Сводку
+выводит команда slow_queries.
+
+Запросы вне middleware (команды, тело потоковых ответов)
+не записываются.
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    DatabaseError,
+    IntegrityError,
+    connections,
+    transaction,
+)
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(
+    r"'(?:[^']|'')*'|%s|\$\d+|(?<![\w\"])-?\d+(?:\.\d+)?(?![\w\"])")
+LISTS = re.compile(r'\bIN \(\?(?:, \?)*\)', re.IGNORECASE)
+REPEATED_ROWS = re.compile(r'(\([?, ]+\))(?:, \1)+')
+SPACES = re.compile(r'\s+')
+PLANNED_STATEMENTS = ('select', 'with')
+
+
+def normalize(sql):
+    """SQL без литералов и параметров: одинаков для всех значений."""
+    sql = SPACES.sub(' ', sql.strip())
+    sql = LITERALS.sub('?', sql)
+    sql = SPACES.sub(' ', sql.replace('( ', '(').replace(' )', ')'))
+    sql = LISTS.sub('IN (...)', sql)
+    return REPEATED_ROWS.sub(r'\1, ...', sql)
+
+
+def fingerprint(normalized):
+    return hashlib.blake2b(normalized.encode(),
+                           digest_size=16).hexdigest()
+
+
+def view_name(request):
+    """Вьюха и действие DRF, обработавшие запрос, например TagViewSet.list."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '-'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match._func_path
+    action = (getattr(match.func, 'actions', None) or {}).get(
+        request.method.lower())
+    return (f'{view_class.__name__}.{action}' if action
+            else view_class.__name__)
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper: запоминает запросы дольше threshold мс."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= self.threshold:
+                self.slow.append((context['connection'].alias, sql,
+                                  params, many, duration))
+
+
+def explain(alias, sql, params):
+    """План запроса или пустая строка, если СУБД не поддерживается."""
+    connection = connections[alias]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return ''
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        else:
+            cursor.execute('SET LOCAL statement_timeout = %s',
+                           [int(settings.SLOW_QUERY_EXPLAIN_TIMEOUT_MS)])
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        # ANALYZE выполняет запрос: его побочные эффекты (pg_notify,
+        # записи в функциях) откатываются вместе с транзакцией.
+        transaction.set_rollback(True, using=alias)
+    return plan
+
+
+def needs_plan(stat, existing, now):
+    """Нужно ли снять план для отпечатка со статистикой stat."""
+    if stat['many'] or not stat['sql'].lstrip().lower().startswith(
+            PLANNED_STATEMENTS):
+        return False
+    if existing is None or existing['explained_at'] is None:
+        return True
+    return (now - existing['explained_at'] >= timedelta(
+        seconds=settings.SLOW_QUERY_EXPLAIN_INTERVAL)
+        or stat['max_ms'] >= 2 * (existing['plan_ms'] or 0))
+
+
+def record_slow_queries(slow, view):
+    """Сводит медленные запросы одного HTTP-запроса в SlowQuery."""
+    stats = defaultdict(lambda: {'calls': 0, 'total_ms': 0.0,
+                                 'max_ms': 0.0})
+    for alias, sql, params, many, duration in slow:
+        normalized = normalize(sql)
+        stat = stats[fingerprint(normalized)]
+        stat['normalized'] = normalized
+        stat['calls'] += 1
+        stat['total_ms'] += duration
+        if duration >= stat['max_ms']:
+            stat.update(max_ms=duration, alias=alias, sql=sql,
+                        params=params, many=many)
+    now = timezone.now()
+    queryset = SlowQuery.objects.using(DEFAULT_DB_ALIAS).filter(view=view)
+    existing = {
+        row['fingerprint']: row for row in queryset.filter(
+            fingerprint__in=stats).values(
+            'fingerprint', 'explained_at', 'plan_ms')
+    }
+    for key, stat in stats.items():
+        update = {
+            'calls': F('calls') + stat['calls'],
+            'total_ms': F('total_ms') + stat['total_ms'],
+            'max_ms': Greatest(F('max_ms'), Value(stat['max_ms'])),
+            'last_seen': now,
+        }
+        if key in existing:
+            queryset.filter(fingerprint=key).update(**update)
+            continue
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                SlowQuery.objects.using(DEFAULT_DB_ALIAS).create(
+                    fingerprint=key, view=view, sql=stat['normalized'],
+                    calls=stat['calls'], total_ms=stat['total_ms'],
+                    max_ms=stat['max_ms'], last_seen=now)
+        except IntegrityError:
+            # Строку уже создал другой воркер.
+            queryset.filter(fingerprint=key).update(**update)
+    rate = settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    if not rate or random.random() >= rate:
+        return
+    slowest = sorted(stats.items(), key=lambda item: -item[1]['max_ms'])
+    planned = 0
+    for key, stat in slowest:
+        if planned >= settings.SLOW_QUERY_EXPLAINS_PER_REQUEST:
+            break
+        if not needs_plan(stat, existing.get(key), now):
+            continue
+        planned += 1
+        try:
+            plan = explain(stat['alias'], stat['sql'], stat['params'])
+        except DatabaseError as error:
+            plan = f'Ошибка EXPLAIN: {error}'
+        queryset.filter(fingerprint=key).update(
+            plan=plan, plan_ms=stat['max_ms'], explained_at=now)
+
+
+class SlowQueryMiddleware:
+    """
+    Записывает медленные запросы к базе, выполненные во время
+    обработки HTTP-запроса. SLOW_QUERY_THRESHOLD_MS = 0 выключает
+    запись.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if not threshold:
+            return self.get_response(request)
+        recorder = QueryRecorder(threshold)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        if recorder.slow:
+            try:
+                record_slow_queries(recorder.slow, view_name(request))
+            except DatabaseError:
+                logger.exception('Журнал медленных запросов: ошибка базы')
+        return response
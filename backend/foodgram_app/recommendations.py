@@ -0,0 +1,111 @@
+"""
+Рекомендации рецептов по совместному добавлению в избранное.
+
+Сходство двух рецептов — косинусная мера по бинарной матрице
+«пользователь x рецепт» из Favorite:
+    score(i, j) = co(i, j) / sqrt(n(i) * n(j)),
+где co — число пользователей, у которых в избранном оба рецепта,
+n — число пользователей, добавивших рецепт. Для каждого рецепта
+хранятся TOP_K соседей в SimilarRecipe, поэтому выдача похожих
+рецептов и подборки «для вас» — одно чтение по индексу.
+"""
+import math
+from collections import Counter, defaultdict
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Favorite, Recipe, SimilarRecipe
+
+TOP_K = 20
+# Пользователи с огромным избранным дают квадратичное число пар
+# и почти не несут сигнала, их избранное не учитывается.
+MAX_USER_FAVORITES = 500
+CHUNK_SIZE = 10000
+
+
+def compute_similarities(recipe_ids=None):
+    """
+    Считает соседей рецептов за один проход по Favorite.
+    recipe_ids ограничивает набор рецептов, для которых нужны соседи.
+    Возвращает {recipe_id: [(similar_id, score), ...]}.
+    """
+    targets = set(recipe_ids) if recipe_ids is not None else None
+    popularity = Counter()
+    co_occurrence = defaultdict(Counter)
+    rows = (Favorite.objects
+            .order_by('user')
+            .values_list('user', 'recipe')
+            .iterator(chunk_size=CHUNK_SIZE))
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        basket = [recipe_id for _, recipe_id in group]
+        if len(basket) > MAX_USER_FAVORITES:
+            continue
+        popularity.update(basket)
+        for recipe_id in basket:
+            if targets is None or recipe_id in targets:
+                co_occurrence[recipe_id].update(basket)
+    neighbours = {}
+    for recipe_id, counts in co_occurrence.items():
+        del counts[recipe_id]
+        scores = [
+            (similar_id, count / math.sqrt(
+                popularity[recipe_id] * popularity[similar_id]))
+            for similar_id, count in counts.items()
+        ]
+        scores.sort(key=lambda item: (-item[1], -item[0]))
+        neighbours[recipe_id] = scores[:TOP_K]
+    return neighbours
+
+
+@transaction.atomic
+def save_similarities(neighbours, recipe_ids=None):
+    """
+    Записывает соседей, перезаписывая только изменившиеся рецепты.
+    recipe_ids — рецепты, которые пересчитывались; без него
+    пересчитанными считаются все, и у рецептов без соседей
+    старые строки удаляются.
+    Возвращает число рецептов, чьи соседи изменились.
+    """
+    stored = SimilarRecipe.objects.all()
+    if recipe_ids is not None:
+        stored = stored.filter(recipe__in=recipe_ids)
+    current = defaultdict(list)
+    for recipe_id, similar_id, score in stored.values_list(
+            'recipe', 'similar', 'score'):
+        current[recipe_id].append((similar_id, score))
+    targets = set(recipe_ids) if recipe_ids is not None else set(current)
+    targets |= set(neighbours)
+    changed = [
+        recipe_id for recipe_id in targets
+        if sorted(current.get(recipe_id, []))
+        != sorted(neighbours.get(recipe_id, []))
+    ]
+    SimilarRecipe.objects.filter(recipe__in=changed).delete()
+    SimilarRecipe.objects.bulk_create([
+        SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                      score=score)
+        for recipe_id in changed
+        for similar_id, score in neighbours.get(recipe_id, [])
+    ], batch_size=CHUNK_SIZE)
+    return len(changed)
+
+
+def similar_recipes(recipe):
+    """Похожие рецепты, от самых близких."""
+    return (Recipe.objects
+            .filter(neighbour_of__recipe=recipe)
+            .order_by('-neighbour_of__score', '-id'))
+
+
+def recipes_for_user(user):
+    """
+    Подборка «для вас»: соседи избранных рецептов пользователя,
+    которых ещё нет в его избранном, по сумме сходства.
+    """
+    return (Recipe.objects
+            .filter(neighbour_of__recipe__favorite_recipes__user=user)
+            .exclude(favorite_recipes__user=user)
+            .annotate(recommendation_score=Sum('neighbour_of__score'))
+            .order_by('-recommendation_score', '-id'))
@@ -0,0 +1,199 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+На PostgreSQL поисковый вектор хранится в Recipe.search_vector
+(индекс GIN, русская морфология) и ранжируется через SearchRank.
+На SQLite используется виртуальная таблица FTS5 RECIPE_FTS_TABLE.
+Индекс обновляется явно после сохранения рецепта вместе
+с ингредиентами (update_search_index), т.к. ингредиенты
+добавляются bulk_create уже после post_save рецепта.
+Переименование или удаление ингредиента пересчитывает векторы
+всех его рецептов (reindex_recipes, сигналы Ingredient). Теги
+в вектор не входят, и их изменение индекс не затрагивает.
+"""
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import (
+    Case,
+    F,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+RECIPE_FTS_TABLE = 'foodgram_app_recipe_fts'
+REINDEX_BATCH_SIZE = 1000
+
+
+def is_postgres():
+    """Используется ли PostgreSQL."""
+    return connection.vendor == 'postgresql'
+
+
+def fold_yo(value):
+    """FTS5 не считает «ё» вариантом «е», приводим вручную."""
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def ingredient_names(recipe_id):
+    """Названия ингредиентов рецепта одной строкой."""
+    return ' '.join(Recipe.objects.filter(pk=recipe_id).values_list(
+        'ingredients__name', flat=True).exclude(ingredients__name=None))
+
+
+def recipe_search_vector(names):
+    """Вектор PostgreSQL: название, описание и названия ингредиентов."""
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(names, weight='C', config=SEARCH_CONFIG))
+
+
+def ingredient_names_subquery():
+    """Названия ингредиентов рецепта OuterRef('pk') одной строкой."""
+    names = (IngredientRecipe.objects
+             .filter(recipe=OuterRef('pk'))
+             .order_by()
+             .values('recipe')
+             .annotate(names=StringAgg('ingredient__name', ' '))
+             .values('names'))
+    return Coalesce(Subquery(names), Value(''))
+
+
+def update_search_index(recipe_id):
+    """Пересчитывает поисковый индекс рецепта."""
+    names = ingredient_names(recipe_id)
+    if is_postgres():
+        Recipe.objects.filter(pk=recipe_id).update(
+            search_vector=recipe_search_vector(Value(names)))
+        return
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'name', 'text').first()
+    if recipe is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {RECIPE_FTS_TABLE} WHERE rowid = %s', [recipe_id])
+        cursor.execute(
+            f'INSERT INTO {RECIPE_FTS_TABLE} '
+            f'(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)',
+            [recipe_id, fold_yo(recipe['name']), fold_yo(recipe['text']),
+             fold_yo(names)])
+
+
+def update_search_indexes(recipe_ids):
+    """
+    Пересчитывает поисковый индекс множества рецептов
+    за фиксированное число запросов (массовый импорт).
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if is_postgres():
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=recipe_search_vector(ingredient_names_subquery()))
+        return
+    names = defaultdict(list)
+    for recipe_id, name in IngredientRecipe.objects.filter(
+            recipe__in=recipe_ids).values_list('recipe', 'ingredient__name'):
+        names[recipe_id].append(name)
+    rows = [
+        (recipe['id'], fold_yo(recipe['name']), fold_yo(recipe['text']),
+         fold_yo(' '.join(names[recipe['id']])))
+        for recipe in Recipe.objects.filter(
+            pk__in=recipe_ids).values('id', 'name', 'text')
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {RECIPE_FTS_TABLE} WHERE rowid = %s',
+            [[row[0]] for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {RECIPE_FTS_TABLE} '
+            f'(rowid, name, text, ingredients) VALUES (%s, %s, %s, %s)',
+            rows)
+
+
+def reindex_recipes(recipes):
+    """
+    Пересчитывает индекс рецептов из queryset recipes, например
+    всех рецептов переименованного ингредиента. На PostgreSQL —
+    один UPDATE, на SQLite — пачками по REINDEX_BATCH_SIZE.
+    """
+    if is_postgres():
+        Recipe.objects.filter(pk__in=recipes.values('pk')).update(
+            search_vector=recipe_search_vector(ingredient_names_subquery()))
+        return
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    for start in range(0, len(recipe_ids), REINDEX_BATCH_SIZE):
+        update_search_indexes(recipe_ids[start:start + REINDEX_BATCH_SIZE])
+
+
+def remove_from_search_index(recipe_id):
+    """
+    Удаляет рецепт из FTS5-таблицы SQLite. На PostgreSQL
+    вектор удаляется вместе со строкой рецепта.
+    """
+    if is_postgres():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {RECIPE_FTS_TABLE} WHERE rowid = %s', [recipe_id])
+
+
+def remove_from_search_indexes(recipe_ids):
+    """Удаляет из FTS5-таблицы множество рецептов (массовое удаление)."""
+    if is_postgres():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {RECIPE_FTS_TABLE} WHERE rowid = %s',
+            [[recipe_id] for recipe_id in recipe_ids])
+
+
+def fts5_query(query):
+    """
+    Строит безопасный запрос FTS5: каждое слово — префиксный терм
+    в кавычках, термы объединяются через AND.
+    """
+    words = re.findall(r'\w+', fold_yo(query))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, query):
+    """Фильтрует queryset по запросу и сортирует по релевантности."""
+    if is_postgres():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        return (queryset
+                .filter(search_vector=search_query)
+                .annotate(rank=SearchRank(F('search_vector'), search_query))
+                .order_by('-rank', '-pub_date'))
+    match = fts5_query(query)
+    if not match:
+        return queryset.none()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {RECIPE_FTS_TABLE} '
+            f'WHERE {RECIPE_FTS_TABLE} MATCH %s ORDER BY rank', [match])
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return queryset.none()
+    return (queryset
+            .filter(pk__in=ids)
+            .order_by(Case(
+                *[When(pk=pk, then=position)
+                  for position, pk in enumerate(ids)],
+                output_field=IntegerField())))
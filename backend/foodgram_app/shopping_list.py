@@ -0,0 +1,105 @@
+"""
+Поддержка таблицы ShoppingListItem — готового списка покупок.
+
+Вместо GROUP BY по всей корзине при каждой выгрузке суммы ингредиентов
+пересчитываются только для затронутых пар (пользователь, ингредиент):
+при добавлении/удалении рецепта из корзины и при изменении
+ингредиентов рецепта, который лежит у кого-то в корзине.
+Пересчёт идемпотентен, поэтому повторный вызов ничего не ломает.
+
+Пересчёт удаляет и заново вставляет строки пар, поэтому два
+параллельных изменения корзины одного пользователя вставили бы
+одни и те же пары и одно упало бы на уникальном ограничении.
+Пересчёты одного пользователя идут по очереди: строки пользователей
+блокируются (FOR NO KEY UPDATE, по возрастанию id — без взаимных
+блокировок), и суммы читаются уже после блокировки.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import IngredientRecipe, ShoppingCart, ShoppingListItem
+
+USER_FIELD = 'recipe__shoppingcart_recipes__user'
+
+
+def calculate_totals(user_ids=None, ingredient_ids=None):
+    """
+    Считает суммы ингредиентов по корзинам из исходных таблиц.
+    Возвращает словарь {(user_id, ingredient_id): total_amount}.
+    None в фильтре означает «без ограничений».
+    """
+    queryset = IngredientRecipe.objects.filter(
+        **{f'{USER_FIELD}__isnull': False})
+    if user_ids is not None:
+        queryset = queryset.filter(**{f'{USER_FIELD}__in': user_ids})
+    if ingredient_ids is not None:
+        queryset = queryset.filter(ingredient__in=ingredient_ids)
+    rows = (queryset
+            .values(USER_FIELD, 'ingredient')
+            .annotate(total_amount=Sum('amount'))
+            .order_by()
+            .values_list(USER_FIELD, 'ingredient', 'total_amount'))
+    return {(user, ingredient): total for user, ingredient, total in rows}
+
+
+@transaction.atomic
+def refresh_shopping_list(user_ids, ingredient_ids):
+    """Пересчитывает позиции списка покупок для указанных пар."""
+    user_ids = list(user_ids)
+    ingredient_ids = list(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    # FOR NO KEY UPDATE не конфликтует с FOR KEY SHARE, которую
+    # ставят вставки в корзину со ссылкой на пользователя.
+    list(get_user_model().objects.select_for_update(no_key=True)
+         .filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    totals = calculate_totals(user_ids, ingredient_ids)
+    ShoppingListItem.objects.filter(
+        user__in=user_ids, ingredient__in=ingredient_ids).delete()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                         total_amount=total)
+        for (user, ingredient), total in totals.items()
+    ])
+
+
+def refresh_for_recipe(recipe, ingredient_ids=()):
+    """
+    Пересчитывает списки всех, у кого рецепт в корзине.
+    ingredient_ids — ингредиенты рецепта до изменения,
+    к ним добавляются текущие ингредиенты.
+    """
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe).values_list('user', flat=True)
+    ingredient_ids = set(ingredient_ids) | set(
+        recipe.ingredient_recipe.values_list('ingredient', flat=True))
+    refresh_shopping_list(user_ids, ingredient_ids)
+
+
+@transaction.atomic
+def rebuild_shopping_lists(commit=True):
+    """
+    Пересчитывает таблицу с нуля и сравнивает с сохранённой.
+    Возвращает расхождения {(user_id, ingredient_id): (было, стало)}.
+    При commit=True таблица перезаписывается, если расхождения есть.
+    """
+    expected = calculate_totals()
+    actual = {
+        (user, ingredient): total
+        for user, ingredient, total in ShoppingListItem.objects.values_list(
+            'user', 'ingredient', 'total_amount')
+    }
+    diff = {
+        key: (actual.get(key), expected.get(key))
+        for key in actual.keys() | expected.keys()
+        if actual.get(key) != expected.get(key)
+    }
+    if diff and commit:
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                             total_amount=total)
+            for (user, ingredient), total in expected.items()
+        ], batch_size=1000)
+    return diff
@@ -0,0 +1,272 @@
+"""
+Сигналы, поддерживающие производные данные рецептов в актуальном
+состоянии: список покупок (ShoppingListItem), поисковый индекс
+и обратный индекс ингредиентов, а также счётчики ссылок
+на медиафайлы (MediaFile), снимки и журнал взаимодействий
+пользователей (foodgram_app.interactions), журнал изменений рецептов
+(foodgram_app.changes). Изменения тегов, ингредиентов и рецептов
+публикуются в шину инвалидации кешей (foodgram_app.invalidation).
+
+recipe_ingredients_changed отправляется после того, как рецепт
+сохранён вместе с ингредиентами (API и админка): ингредиенты
+добавляются bulk_create, поэтому post_save рецепта для этого
+не подходит. Аргументы: recipe и old_ingredient_ids — ингредиенты
+рецепта до изменения.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import Signal, receiver
+
+from foodgram_users.models import Follow
+
+from . import ingredient_index  # noqa: F401 (обработчик шины)
+from . import interactions
+from .changes import RELATED_LOOKUPS, record_changes
+from .invalidation import publish
+from .models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    RecipeChange,
+    ShoppingCart,
+    Tag,
+)
+from .search import (
+    reindex_recipes,
+    remove_from_search_index,
+    update_search_index,
+)
+from .shopping_list import refresh_for_recipe, refresh_shopping_list
+from .storage import media_fields
+
+User = get_user_model()
+
+recipe_ingredients_changed = Signal()
+
+# Модель, участвующая в представлении рецептов, -> вид строки журнала.
+CHANGE_KINDS = {
+    Tag: RecipeChange.TAG,
+    Ingredient: RecipeChange.INGREDIENT,
+    User: RecipeChange.AUTHOR,
+}
+# Поля автора, которые входят в представление рецепта.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
+
+def recipe_ingredient_ids(recipe_id):
+    """Список id ингредиентов рецепта."""
+    return list(IngredientRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient', flat=True))
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Рецепт добавлен в корзину — увеличиваем позиции списка."""
+    if created:
+        refresh_shopping_list(
+            [instance.user_id], recipe_ingredient_ids(instance.recipe_id))
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remember_cart_ingredients(sender, instance, **kwargs):
+    """
+    Запоминает ингредиенты до удаления: при каскадном удалении рецепта
+    строки IngredientRecipe могут исчезнуть раньше строки корзины.
+    """
+    instance._ingredient_ids = recipe_ingredient_ids(instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """Рецепт убран из корзины — пересчитываем его ингредиенты."""
+    refresh_shopping_list(
+        [instance.user_id], getattr(instance, '_ingredient_ids', ()))
+
+
+@receiver(recipe_ingredients_changed)
+def update_recipe_indexes(sender, recipe, old_ingredient_ids=(), **kwargs):
+    """Пересчитывает списки покупок и индексы изменённого рецепта."""
+    refresh_for_recipe(recipe, old_ingredient_ids)
+    update_search_index(recipe.pk)
+    publish(Recipe, recipe.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_recipe_from_indexes(sender, instance, **kwargs):
+    """Удалённый рецепт убирается из поискового и обратного индексов."""
+    remove_from_search_index(instance.pk)
+
+
+@receiver(pre_save, sender=Ingredient)
+def remember_ingredient_name(sender, instance, **kwargs):
+    """Запоминает прежнее название ингредиента."""
+    if instance.pk is not None:
+        instance._old_name = Ingredient.objects.filter(
+            pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_renamed_ingredient(sender, instance, created, **kwargs):
+    """Название ингредиента входит в поисковый вектор его рецептов."""
+    old_name = instance.__dict__.pop('_old_name', None)
+    if not created and old_name is not None and old_name != instance.name:
+        reindex_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remember_ingredient_recipes(sender, instance, **kwargs):
+    """Строки IngredientRecipe удалятся каскадом — запоминаем рецепты."""
+    instance._reindex_recipe_ids = list(Recipe.objects.filter(
+        ingredients=instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Ingredient)
+def reindex_deleted_ingredient(sender, instance, **kwargs):
+    """Удалённый ингредиент пропадает из векторов его рецептов."""
+    recipe_ids = instance.__dict__.pop('_reindex_recipe_ids', ())
+    if recipe_ids:
+        reindex_recipes(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def log_recipe_saved(sender, instance, **kwargs):
+    """Рецепт создан или изменён — запись в ленте изменений."""
+    record_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def log_recipe_deleted(sender, instance, **kwargs):
+    """Удалённый рецепт оставляет в ленте запись-надгробие."""
+    record_changes([instance.pk], deleted=True)
+
+
+@receiver(recipe_ingredients_changed)
+def log_recipe_ingredients_changed(sender, recipe, **kwargs):
+    """Изменились ингредиенты рецепта."""
+    record_changes([recipe.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def log_recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """Изменились теги рецепта (в том числе со стороны тега)."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            record_changes([instance.pk])
+    elif action == 'pre_clear':
+        instance._changed_recipe_ids = list(
+            instance.recipes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        record_changes(instance.__dict__.pop('_changed_recipe_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        record_changes(pk_set)
+
+
+def related_recipe_ids(instance):
+    """id рецептов, в представлении которых участвует instance."""
+    return Recipe.objects.filter(
+        **{RELATED_LOOKUPS[CHANGE_KINDS[type(instance)]]: instance}
+    ).values_list('pk', flat=True)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=User)
+def log_related_recipes(sender, instance, created, update_fields=None,
+                        **kwargs):
+    """
+    Изменение тега, ингредиента или автора меняет его рецепты:
+    одна строка журнала, рецепты по ней находит читатель ленты.
+    """
+    if created or (sender is User and update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    record_changes([instance.pk], kind=CHANGE_KINDS[sender])
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_related_recipes(sender, instance, **kwargs):
+    """Связи удаляются каскадом без m2m_changed — запоминаем рецепты."""
+    instance._changed_recipe_ids = list(related_recipe_ids(instance))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def log_deleted_related(sender, instance, **kwargs):
+    """Удалённый тег или ингредиент меняет его рецепты."""
+    record_changes(instance.__dict__.pop('_changed_recipe_ids', ()))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+def publish_change(sender, instance, **kwargs):
+    """Изменение строки сбрасывает её в кешах всех процессов."""
+    publish(sender, instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+def interaction_added(sender, instance, created, **kwargs):
+    """Добавление в избранное, корзину или подписки."""
+    if created:
+        interactions.record_change(instance, added=True)
+    interactions.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Follow)
+def interaction_removed(sender, instance, **kwargs):
+    """Удаление из избранного, корзины или подписок."""
+    interactions.record_change(instance, added=False)
+    interactions.invalidate(instance.user_id)
+
+
+def release_media(instance, field, name):
+    """Снимает ссылку на файл name поля field."""
+    if name:
+        instance._meta.get_field(field).storage.delete(name)
+
+
+def remember_replaced_media(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний файл, если поле заменяется или очищается."""
+    field = MEDIA_FIELD_NAMES[sender]
+    if instance.pk is None or (
+            update_fields is not None and field not in update_fields):
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list(
+        field, flat=True).first()
+    if old_name and old_name != getattr(instance, field).name:
+        instance._replaced_media = old_name
+
+
+def release_replaced_media(sender, instance, **kwargs):
+    """После сохранения снимает ссылку на заменённый файл."""
+    release_media(instance, MEDIA_FIELD_NAMES[sender],
+                  instance.__dict__.pop('_replaced_media', None))
+
+
+def release_deleted_media(sender, instance, **kwargs):
+    """Удалённая строка больше не ссылается на свой файл."""
+    field = MEDIA_FIELD_NAMES[sender]
+    release_media(instance, field, getattr(instance, field).name)
+
+
+MEDIA_FIELD_NAMES = dict(media_fields())
+for model in MEDIA_FIELD_NAMES:
+    pre_save.connect(remember_replaced_media, sender=model)
+    post_save.connect(release_replaced_media, sender=model)
+    post_delete.connect(release_deleted_media, sender=model)
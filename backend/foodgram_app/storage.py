@@ -0,0 +1,203 @@
+"""
+Медиа-хранилище с адресацией по содержимому.
+
+Файл сохраняется под именем <каталог upload_to>/<хеш><расширение>,
+поэтому одинаковые изображения хранятся один раз, а URL файла
+никогда не меняет содержимое — nginx отдаёт такие файлы
+с Cache-Control: immutable. Число строк, ссылающихся на файл,
+хранится в MediaFile: save() добавляет ссылку, delete() снимает её
+и удаляет файл с диска после коммита, когда ссылок не осталось.
+
+Файл с тем же содержимым может загружаться в тот момент, когда
+последняя ссылка на него снята. Поэтому проверка «файл есть на диске»
+при загрузке и удаление файла выполняются под одной блокировкой
+строки MediaFile (SELECT ... FOR UPDATE): загрузка сначала берёт
+ссылку и только потом смотрит на диск, а при снятии последней
+ссылки строка остаётся с references = 0 и удаляется вместе
+с файлом после коммита, если под блокировкой ссылок всё ещё нет.
+Ссылки снимаются сигналами при удалении и замене файла в полях
+MEDIA_FIELDS (см. foodgram_app.signals). Файлы без строки MediaFile
+(загруженные до перехода на хранилище) не удаляются: их переносит
+команда migrate_media.
+"""
+import hashlib
+import os
+import re
+from collections import Counter
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+HASH_LENGTH = 32
+HASHED_NAME = re.compile(rf'(^|/)[0-9a-f]{{{HASH_LENGTH}}}(\.\w+)?$')
+# Поля моделей, файлы которых учитываются в MediaFile.
+MEDIA_FIELDS = (
+    ('foodgram_app.Recipe', 'image'),
+    ('foodgram_users.User', 'avatar'),
+)
+
+
+def media_fields():
+    """Пары (модель, имя поля) из MEDIA_FIELDS."""
+    return [(apps.get_model(label), field) for label, field in MEDIA_FIELDS]
+
+
+def is_hashed(name):
+    """Имя файла уже построено по хешу содержимого."""
+    return bool(HASHED_NAME.search(name or ''))
+
+
+def content_hash(content):
+    """Хеш содержимого файла, читаемого по частям."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(name, content):
+    """Имя в том же каталоге, что и name, с хешем вместо имени файла."""
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, content_hash(content) + extension)
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """Файловое хранилище с дедупликацией и подсчётом ссылок."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content)
+        with transaction.atomic():
+            # Пока строка заблокирована, delete_unreferenced не удалит
+            # файл, поэтому проверка наличия на диске надёжна.
+            self.add_reference(name)
+            return self.write(name, content)
+
+    def store(self, name, content):
+        """Записывает файл под хеш-именем, если его ещё нет."""
+        return self.write(hashed_name(name, content), content)
+
+    def write(self, name, content):
+        if not self.exists(name):
+            return self._save(name, content)
+        # Повторная загрузка того же содержимого: для сборщика мусора
+        # (foodgram_app.media_gc) файл снова свежий.
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return self._save(name, content)
+        return name
+
+    def add_reference(self, name, count=1):
+        """Добавляет ссылки на файл."""
+        MediaFile = apps.get_model('foodgram_app', 'MediaFile')
+        with transaction.atomic():
+            file, _ = MediaFile.objects.select_for_update().get_or_create(
+                name=name)
+            file.references = F('references') + count
+            file.save(update_fields=['references'])
+
+    def delete(self, name):
+        """
+        Снимает одну ссылку на файл; последний сам файл удаляется
+        после коммита транзакции.
+        """
+        self.remove_references(name)
+
+    def remove_references(self, name, count=1):
+        """Снимает count ссылок на файл (массовое удаление строк)."""
+        MediaFile = apps.get_model('foodgram_app', 'MediaFile')
+        files = MediaFile.objects.filter(name=name)
+        with transaction.atomic():
+            if files.filter(references__gt=count).update(
+                    references=F('references') - count):
+                return
+            if not files.filter(references__lte=count).update(
+                    references=0):
+                return
+        transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        """
+        Удаляет файл и его строку, если на файл снова не сослались.
+        Проверка и удаление идут под блокировкой строки, которую
+        берёт add_reference: параллельная загрузка того же файла
+        либо дождётся удаления и запишет файл заново, либо успеет
+        добавить ссылку, и тогда файл останется.
+        """
+        MediaFile = apps.get_model('foodgram_app', 'MediaFile')
+        with transaction.atomic():
+            file = MediaFile.objects.select_for_update().filter(
+                name=name, references=0).first()
+            if file is None:
+                return
+            self.delete_file(name)
+            file.delete()
+
+    def delete_file(self, name):
+        """Удаляет файл с диска без учёта ссылок."""
+        super().delete(name)
+
+
+def migrate_media():
+    """
+    Переносит файлы полей MEDIA_FIELDS под хеш-имена и обновляет
+    строки. Возвращает число перенесённых файлов и список
+    отсутствующих на диске.
+    """
+    moved, missing = 0, []
+    for model, field in media_fields():
+        storage = model._meta.get_field(field).storage
+        renamed = {}
+        rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(
+            **{field: ''}).values_list('pk', field)
+        for pk, name in rows.iterator():
+            if is_hashed(name):
+                continue
+            if name not in renamed:
+                if not storage.exists(name):
+                    missing.append(name)
+                    continue
+                with storage.open(name) as content:
+                    renamed[name] = storage.store(name, content)
+            model.objects.filter(pk=pk).update(**{field: renamed[name]})
+        for name in renamed:
+            storage.delete_file(name)
+        moved += len(renamed)
+    return moved, missing
+
+
+def recount_references():
+    """
+    Пересчитывает MediaFile по строкам полей MEDIA_FIELDS.
+    Возвращает расхождения {имя: (было, стало)}.
+    """
+    MediaFile = apps.get_model('foodgram_app', 'MediaFile')
+    expected = Counter()
+    for model, field in media_fields():
+        expected.update(model.objects.exclude(
+            **{f'{field}__isnull': True}).exclude(
+            **{field: ''}).values_list(field, flat=True).iterator())
+    with transaction.atomic():
+        actual = dict(MediaFile.objects.values_list('name', 'references'))
+        diff = {
+            name: (actual.get(name, 0), expected.get(name, 0))
+            for name in set(actual) | set(expected)
+            if actual.get(name, 0) != expected.get(name, 0)
+        }
+        MediaFile.objects.all().delete()
+        MediaFile.objects.bulk_create(
+            MediaFile(name=name, references=references)
+            for name, references in expected.items())
+    return diff
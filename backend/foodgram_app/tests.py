@@ -0,0 +1,1072 @@
+import base64
+import csv
+import json
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from foodgram_users.models import Follow
+
+from . import ingredient_index, invalidation
+from .deletion import delete_user
+from .media_gc import collect_garbage
+from .models import (
+    CacheVersion,
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    InteractionChange,
+    MediaFile,
+    Recipe,
+    RecipeChange,
+    ShoppingCart,
+    ShoppingListItem,
+    SimilarRecipe,
+    SlowQuery,
+    Tag,
+    UserDeletion,
+)
+from .query_log import explain, fingerprint, normalize
+from .search import search_recipes, update_search_index
+from .shopping_list import refresh_shopping_list
+from .signals import recipe_ingredients_changed
+from .storage import is_hashed
+from .units import UNIT_CONVERSIONS, merge_shopping_list, normalize_unit
+
+User = get_user_model()
+
+INGREDIENTS_CSV = (Path(__file__).resolve().parent
+                   / 'management/commands/data/ingredients.csv')
+
+
+class ShoppingListTestCase(TestCase):
+    """
+    Тест-кейс для проверки таблицы ShoppingListItem: она должна
+    совпадать с агрегацией по корзине после любых изменений.
+    """
+
+    def setUp(self):
+        """
+        Создаются пользователь с клиентом, тег, два ингредиента
+        и два рецепта с общим ингредиентом (self.salt).
+        """
+        self.user = User.objects.create_user(
+            username='cook',
+            email='cook@example.com',
+            password='cookpassword'
+        )
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        self.salt = Ingredient.objects.create(name='соль',
+                                              measurement_unit='г')
+        self.milk = Ingredient.objects.create(name='молоко',
+                                              measurement_unit='мл')
+        self.porridge = self.create_recipe('Каша', {self.salt: 5,
+                                                    self.milk: 200})
+        self.omelette = self.create_recipe('Омлет', {self.salt: 2})
+
+    def create_recipe(self, name, ingredients):
+        """Создаёт рецепт с ингредиентами {Ingredient: amount}."""
+        recipe = Recipe.objects.create(
+            author=self.user, name=name, text=name,
+            image='foodgram_app/images/test.png', cooking_time=10)
+        recipe.tags.set([self.tag])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in ingredients.items()
+        ])
+        return recipe
+
+    def shopping_list(self):
+        """Текущее содержимое таблицы для self.user."""
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient__name', 'total_amount'))
+
+    def test_add_and_remove_recipe(self):
+        """
+        Добавление и удаление рецептов из корзины через API
+        меняет только суммы соответствующих ингредиентов.
+        """
+        for recipe in (self.porridge, self.omelette):
+            self.auth_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {'соль': 7, 'молоко': 200})
+        self.auth_client.delete(
+            f'/api/recipes/{self.porridge.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {'соль': 2})
+
+    def test_recipe_update_changes_shopping_list(self):
+        """Изменение ингредиентов рецепта в корзине пересчитывает список."""
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        response = self.auth_client.patch(
+            f'/api/recipes/{self.porridge.id}/',
+            data={'ingredients': [{'id': self.salt.id, 'amount': 1}],
+                  'tags': [self.tag.id], 'name': 'Каша', 'text': 'Каша',
+                  'cooking_time': 10},
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(self.shopping_list(), {'соль': 1})
+
+    def test_recipe_delete_cleans_shopping_list(self):
+        """Удаление рецепта каскадом убирает его из списка покупок."""
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        ShoppingCart.objects.create(user=self.user, recipe=self.omelette)
+        self.porridge.delete()
+        self.assertEqual(self.shopping_list(), {'соль': 2})
+
+    def test_download_uses_shopping_list(self):
+        """Выгрузка списка покупок содержит суммы из таблицы."""
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        ShoppingCart.objects.create(user=self.user, recipe=self.omelette)
+        response = self.auth_client.get(
+            '/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.content.decode(),
+                         'молоко - 200 мл\nсоль - 7 г')
+
+    def test_rebuild_command_fixes_drift(self):
+        """Команда rebuild_shopping_lists находит и исправляет расхождения."""
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        ShoppingListItem.objects.filter(ingredient=self.salt).update(
+            total_amount=100)
+        out = StringIO()
+        call_command('rebuild_shopping_lists', '--check', stdout=out)
+        self.assertIn('100 -> 5', out.getvalue())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.shopping_list(), {'соль': 5, 'молоко': 200})
+
+    def test_refresh_locks_users(self):
+        """
+        Пересчёт блокирует строки пользователей до удаления и вставки:
+        параллельные изменения корзины одного пользователя не
+        вставляют одни и те же пары дважды.
+        """
+        ShoppingCart.objects.create(user=self.user, recipe=self.porridge)
+        with mock.patch.object(
+                QuerySet, 'select_for_update', autospec=True,
+                side_effect=QuerySet.select_for_update) as lock:
+            refresh_shopping_list([self.user.id], [self.salt.id])
+        queryset, = lock.call_args.args
+        self.assertIs(queryset.model, User)
+        self.assertEqual(lock.call_args.kwargs, {'no_key': True})
+        self.assertEqual(self.shopping_list(), {'соль': 5, 'молоко': 200})
+
+
+class UnitsTestCase(SimpleTestCase):
+    """Тест-кейс для объединения единиц измерения в списке покупок."""
+
+    def test_compatible_units_are_merged(self):
+        """
+        Один продукт в граммах и килограммах даёт одну строку в граммах,
+        название сравнивается без учёта регистра и «ё».
+        """
+        merged = merge_shopping_list([
+            ('Сахар', 500, 'г'),
+            ('сахар', 1, 'кг'),
+            ('мёд', 2, 'ст. л.'),
+            ('мед', 10, 'мл'),
+        ])
+        self.assertEqual(merged, [('мёд', 40, 'мл'), ('Сахар', 1500, 'г')])
+
+    def test_incompatible_units_are_not_merged(self):
+        """Масса и штуки одного продукта остаются разными строками."""
+        merged = merge_shopping_list([
+            ('яйца', 2, 'шт.'),
+            ('яйца', 100, 'г'),
+        ])
+        self.assertEqual(len(merged), 2)
+
+    def test_single_unit_is_kept(self):
+        """Если объединять нечего, исходная единица не меняется."""
+        self.assertEqual(merge_shopping_list([('соль', 2, 'ч.л.')]),
+                         [('соль', 2, 'ч. л.')])
+
+    def test_real_catalogue(self):
+        """
+        Каталог ingredients.csv: названия уникальны, поэтому в корзине
+        со всеми ингредиентами не объединяется ни одна строка,
+        а 2127 из 2186 единиц относятся к семействам массы или объёма.
+        """
+        with open(INGREDIENTS_CSV, encoding='utf-8') as csv_file:
+            rows = [(name, 1, unit) for name, unit in csv.reader(csv_file)]
+        merged = merge_shopping_list(rows)
+        self.assertEqual(len(rows), 2186)
+        self.assertEqual(len(rows) - len(merged), 0)
+        convertible = sum(normalize_unit(unit) in UNIT_CONVERSIONS
+                          for _, _, unit in rows)
+        self.assertEqual(convertible, 2127)
+
+
+class RecipeSearchTestCase(TestCase):
+    """Тест-кейс для полнотекстового поиска рецептов: /api/recipes/?search=."""
+
+    def setUp(self):
+        """
+        Создаются автор и три рецепта через Recipe.objects с явным
+        обновлением поискового индекса, как после сохранения в API.
+        """
+        self.user = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='authorpassword'
+        )
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=self.user)
+        self.tag = Tag.objects.create(name='Обед', slug='lunch')
+        self.beet = Ingredient.objects.create(name='свёкла',
+                                              measurement_unit='г')
+        self.honey = Ingredient.objects.create(name='мёд',
+                                               measurement_unit='г')
+        self.borscht = self.create_recipe(
+            'Борщ', 'Варить долго.', self.beet)
+        self.pancakes = self.create_recipe(
+            'Блины', 'Подавать с мёдом или борщом.', self.honey)
+        self.salad = self.create_recipe(
+            'Винегрет', 'Нарезать кубиками.', self.beet)
+
+    def create_recipe(self, name, text, ingredient):
+        """Создаёт рецепт через Recipe.objects и обновляет индекс."""
+        recipe = Recipe.objects.create(
+            author=self.user, name=name, text=text,
+            image='foodgram_app/images/test.png', cooking_time=10)
+        recipe.tags.set([self.tag])
+        IngredientRecipe.objects.create(recipe=recipe, ingredient=ingredient,
+                                        amount=1)
+        update_search_index(recipe.pk)
+        return recipe
+
+    def search(self, query):
+        """Имена рецептов из выдачи поиска, в порядке выдачи."""
+        response = self.auth_client.get('/api/recipes/',
+                                        {'search': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_search_by_name_is_ranked_first(self):
+        """Совпадение в названии выше совпадения в описании."""
+        self.assertEqual(self.search('борщ'), ['Борщ', 'Блины'])
+
+    def test_search_by_ingredient(self):
+        """Поиск по названию ингредиента, «ё» и «е» не различаются."""
+        self.assertCountEqual(self.search('свекла'), ['Борщ', 'Винегрет'])
+
+    def test_deleted_recipe_leaves_index(self):
+        """Удалённый рецепт не находится поиском."""
+        self.salad.delete()
+        self.assertEqual(self.search('свекла'), ['Борщ'])
+
+    def test_search_query_syntax_is_escaped(self):
+        """Служебные символы FTS в запросе не ломают поиск."""
+        self.assertEqual(self.search('"*('), [])
+
+    def test_ingredient_rename_updates_index(self):
+        """Переименование ингредиента пересчитывает векторы его рецептов."""
+        self.beet.name = 'бурак'
+        self.beet.save()
+        self.assertCountEqual(self.search('бурак'), ['Борщ', 'Винегрет'])
+        self.assertEqual(self.search('свекла'), [])
+
+    def test_ingredient_delete_updates_index(self):
+        """Удалённый ингредиент больше не находит его рецепты."""
+        self.honey.delete()
+        self.assertEqual(self.search('мед'), ['Блины'])
+        self.beet.delete()
+        self.assertEqual(self.search('свекла'), [])
+
+
+class IngredientIndexTestCase(TestCase):
+    """
+    Тест-кейс для поиска рецептов по ингредиентам:
+    /api/recipes/by-ingredients/?ids=.
+    """
+
+    def setUp(self):
+        """Три рецепта с разными наборами из трёх ингредиентов."""
+        self.user = User.objects.create_user(
+            username='chef',
+            email='chef@example.com',
+            password='chefpassword'
+        )
+        self.client = APIClient()
+        self.egg, self.milk, self.flour = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('яйца', 'молоко', 'мука')
+        )
+        self.omelette = self.create_recipe('Омлет', self.egg, self.milk)
+        self.pancakes = self.create_recipe('Блины', self.egg, self.milk,
+                                           self.flour)
+        self.create_recipe('Лапша', self.flour)
+        ingredient_index.invalidate()
+
+    def create_recipe(self, name, *ingredients):
+        """Создаёт рецепт с указанными ингредиентами."""
+        recipe = Recipe.objects.create(
+            author=self.user, name=name, text=name,
+            image='foodgram_app/images/test.png', cooking_time=10)
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        ])
+        return recipe
+
+    def by_ingredients(self, *ingredients):
+        """Выдача эндпоинта: (название, совпало, не хватает)."""
+        ids = ','.join(str(ingredient.id) for ingredient in ingredients)
+        response = self.client.get('/api/recipes/by-ingredients/',
+                                   {'ids': ids})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            (recipe['name'], recipe['matched_ingredients'],
+             recipe['missing_ingredients'])
+            for recipe in response.data['results']
+        ]
+
+    def test_recipes_ranked_by_missing_and_coverage(self):
+        """Полностью покрытый рецепт первым, лишние рецепты не попадают."""
+        self.assertEqual(self.by_ingredients(self.egg, self.milk),
+                         [('Омлет', 2, 0), ('Блины', 2, 1)])
+
+    def test_index_is_updated_after_recipe_delete(self):
+        """Удаление рецепта убирает его из индекса без пересборки."""
+        self.assertEqual(self.by_ingredients(self.egg),
+                         [('Омлет', 1, 1), ('Блины', 1, 2)])
+        with mock.patch.object(ingredient_index.IngredientIndex, 'build',
+                               side_effect=AssertionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.omelette.delete()
+        self.assertEqual(self.by_ingredients(self.egg),
+                         [('Блины', 1, 2)])
+
+    def test_index_is_updated_after_ingredients_change(self):
+        """Новые ингредиенты рецепта попадают в индекс без пересборки."""
+        self.by_ingredients(self.egg)
+        with mock.patch.object(ingredient_index.IngredientIndex, 'build',
+                               side_effect=AssertionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.omelette.ingredient_recipe.filter(
+                ingredient=self.milk).delete()
+            IngredientRecipe.objects.create(
+                recipe=self.omelette, ingredient=self.flour, amount=1)
+            recipe_ingredients_changed.send(sender=Recipe,
+                                            recipe=self.omelette)
+        self.assertEqual(self.by_ingredients(self.egg, self.flour),
+                         [('Лапша', 1, 0), ('Омлет', 2, 0), ('Блины', 2, 1)])
+
+    def test_iter_bits(self):
+        """id битовой карты по убыванию, в том числе на границах слов."""
+        recipe_ids = [0, 1, 7, 8, 63, 64, 65, 130, 1000]
+        self.assertEqual(
+            list(ingredient_index.iter_bits(
+                ingredient_index.to_bitmap(recipe_ids))),
+            recipe_ids[::-1])
+
+    def test_match_equals_full_sort(self):
+        """
+        Выдача по битовым картам совпадает с полной сортировкой
+        на частых и редких ингредиентах, в том числе по срезам.
+        """
+        ingredients = [self.egg, self.milk, self.flour]
+        for number in range(150):
+            self.create_recipe(f'Рецепт {number}', *(
+                ingredient for position, ingredient in enumerate(ingredients)
+                if (number + 1) >> position & 1 or number % 7 == position))
+        recipe_ingredients = {}
+        for recipe_id, ingredient_id in IngredientRecipe.objects.values_list(
+                'recipe', 'ingredient'):
+            recipe_ingredients.setdefault(recipe_id, set()).add(ingredient_id)
+        index = ingredient_index.IngredientIndex.build()
+        self.assertIsInstance(index.postings[self.egg.id], int)
+        for query in ({self.egg.id}, {self.milk.id, self.flour.id},
+                      {self.egg.id, self.milk.id, self.flour.id, 0}):
+            expected = sorted(
+                ((recipe_id, len(ids & query), len(ids - query))
+                 for recipe_id, ids in recipe_ingredients.items()
+                 if ids & query),
+                key=lambda item: (item[2], -item[1] / (item[1] + item[2]),
+                                  -item[0]))
+            matches = index.match(query)
+            self.assertEqual(len(matches), len(expected))
+            self.assertEqual(matches[:], expected)
+            for start in range(0, len(expected) + 7, 7):
+                self.assertEqual(matches[start:start + 7],
+                                 expected[start:start + 7])
+
+    def test_invalid_ids(self):
+        """Пустой или нечисловой ids — 400 Bad Request."""
+        for ids in ('', 'a,b'):
+            response = self.client.get('/api/recipes/by-ingredients/',
+                                       {'ids': ids})
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class RecommendationsTestCase(TestCase):
+    """
+    Тест-кейс для похожих рецептов и подборки «для вас»:
+    /api/recipes/{id}/similar/, /api/recipes/for-you/.
+    """
+
+    def setUp(self):
+        """
+        Четыре рецепта и три пользователя: борщ и пампушки часто
+        в избранном вместе, салат — реже, компот — ни с чем.
+        """
+        self.users = [
+            User.objects.create_user(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                password='userpassword')
+            for number in range(3)
+        ]
+        self.borscht, self.buns, self.salad, self.compote = (
+            Recipe.objects.create(
+                author=self.users[0], name=name, text=name,
+                image='foodgram_app/images/test.png', cooking_time=10)
+            for name in ('Борщ', 'Пампушки', 'Салат', 'Компот')
+        )
+        favorites = {
+            self.users[0]: (self.borscht, self.buns, self.salad),
+            self.users[1]: (self.borscht, self.buns),
+            self.users[2]: (self.salad, self.compote),
+        }
+        Favorite.objects.bulk_create([
+            Favorite(user=user, recipe=recipe)
+            for user, recipes in favorites.items() for recipe in recipes
+        ])
+        call_command('build_recommendations', stdout=StringIO())
+        self.auth_client = APIClient()
+
+    def names(self, url):
+        """Имена рецептов из выдачи эндпоинта."""
+        response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_similar_recipes(self):
+        """Ближайший сосед борща — пампушки, компот не похож."""
+        url = f'/api/recipes/{self.borscht.id}/similar/'
+        self.assertEqual(self.names(url), ['Пампушки', 'Салат'])
+
+    def test_for_you_excludes_favorites(self):
+        """В подборке нет рецептов, уже добавленных в избранное."""
+        self.auth_client.force_authenticate(user=self.users[1])
+        self.assertEqual(self.names('/api/recipes/for-you/'), ['Салат'])
+
+    def test_incremental_rebuild_touches_changed_recipes_only(self):
+        """Повторный запуск без изменений ничего не перезаписывает."""
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('изменилось: 0', out.getvalue())
+        Favorite.objects.create(user=self.users[2], recipe=self.borscht)
+        call_command('build_recommendations',
+                     '--recipe', str(self.compote.id), stdout=out)
+        self.assertEqual(
+            list(SimilarRecipe.objects.filter(recipe=self.compote)
+                 .values_list('similar__name', flat=True)),
+            ['Салат', 'Борщ'])
+
+
+class AdminChangelistTestCase(TestCase):
+    """
+    Тест-кейс для списков админки: число запросов не должно
+    зависеть от количества строк на странице.
+    """
+
+    def setUp(self):
+        """Суперпользователь и клиент с выполненным входом."""
+        self.admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword'
+        )
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count):
+        """Создаёт count авторов с рецептом, избранным и подпиской."""
+        start = User.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='authorpassword')
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', text='text',
+                image='foodgram_app/images/test.png', cooking_time=1)
+            Favorite.objects.create(user=self.admin, recipe=recipe)
+            Follow.objects.create(user=self.admin, author=author)
+
+    def count_queries(self, url):
+        """Число SQL-запросов при открытии страницы админки."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(queries)
+
+    def test_changelists_have_constant_queries(self):
+        """Рецепты и подписки: 2 и 10 строк — одинаковое число запросов."""
+        for url in ('/admin/foodgram_app/recipe/',
+                    '/admin/foodgram_users/follow/'):
+            self.create_rows(2)
+            few = self.count_queries(url)
+            self.create_rows(8)
+            self.assertEqual(self.count_queries(url), few, url)
+
+
+def png_bytes(color):
+    """Картинка 1x1 заданного цвета в формате PNG."""
+    buffer = BytesIO()
+    Image.new('RGB', (1, 1), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MediaStorageTestCase(TestCase):
+    """
+    Тест-кейс для хранилища с адресацией по содержимому:
+    дедупликация, подсчёт ссылок и перенос старых файлов.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user(
+            username='cook', email='cook@example.com',
+            password='cookpassword')
+        self.auth_client = APIClient()
+        self.auth_client.force_authenticate(user=self.user)
+
+    def create_recipe(self, number, image=''):
+        """Рецепт с файлом изображения image."""
+        return Recipe.objects.create(
+            author=self.user, name=f'Рецепт {number}', text='text',
+            image=image, cooking_time=1)
+
+    def files(self):
+        """Файлы в MEDIA_ROOT."""
+        return sorted(str(path.relative_to(self.media_root))
+                      for path in Path(self.media_root).rglob('*')
+                      if path.is_file())
+
+    def references(self):
+        """Содержимое MediaFile."""
+        return dict(MediaFile.objects.values_list('name', 'references'))
+
+    def test_identical_images_are_stored_once(self):
+        """Одинаковые изображения хранятся одним файлом до последней ссылки."""
+        recipes = [self.create_recipe(number) for number in range(2)]
+        for number, recipe in enumerate(recipes):
+            recipe.image.save(f'upload{number}.PNG',
+                              ContentFile(png_bytes('red')))
+        name = recipes[0].image.name
+        self.assertEqual(recipes[1].image.name, name)
+        self.assertTrue(is_hashed(name))
+        self.assertTrue(name.endswith('.png'))
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(self.references(), {name: 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[0].delete()
+        self.assertEqual(self.files(), [name])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipes[1].delete()
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.references(), {})
+
+    def test_upload_during_delete_keeps_file(self):
+        """
+        Загрузка того же содержимого, пока снимается последняя ссылка:
+        файл проверяется на диске только после блокировки строки
+        MediaFile, поэтому удалённый файл записывается заново.
+        """
+        recipe = self.create_recipe(1)
+        recipe.image.save('first.png', ContentFile(png_bytes('red')))
+        name = recipe.image.name
+        storage = recipe.image.storage
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.delete()
+        self.assertEqual(self.references(), {name: 0})
+        add_reference = storage.add_reference
+
+        def delete_first(file_name, count=1):
+            # Удаление по on_commit успело взять блокировку раньше.
+            for callback in callbacks:
+                callback()
+            self.assertEqual(self.files(), [])
+            add_reference(file_name, count)
+
+        other = self.create_recipe(2)
+        with mock.patch.object(storage, 'add_reference', delete_first):
+            other.image.save('second.png', ContentFile(png_bytes('red')))
+        self.assertEqual(other.image.name, name)
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(self.references(), {name: 1})
+
+    def test_reference_before_delete_keeps_file(self):
+        """Ссылка, добавленная до удаления по on_commit, сохраняет файл."""
+        recipe = self.create_recipe(1)
+        recipe.image.save('first.png', ContentFile(png_bytes('red')))
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.delete()
+        other = self.create_recipe(2)
+        other.image.save('second.png', ContentFile(png_bytes('red')))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(self.references(), {name: 1})
+
+    def test_avatar_replacement_releases_old_file(self):
+        """Замена и удаление аватара через API удаляют старые файлы."""
+        names = []
+        for color in ('red', 'blue'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.auth_client.put(
+                    '/api/users/me/avatar/',
+                    {'avatar': 'data:image/png;base64,' + base64.b64encode(
+                        png_bytes(color)).decode()},
+                    format='json')
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.user.refresh_from_db()
+            names.append(self.user.avatar.name)
+            self.assertIn(names[-1], response.json()['avatar'])
+        self.assertEqual(self.files(), [names[1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.auth_client.delete('/api/users/me/avatar/')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.references(), {})
+
+    def test_migrate_media_command(self):
+        """Старые файлы получают хеш-имена, дубликаты сливаются."""
+        legacy = FileSystemStorage(location=self.media_root)
+        recipes = [
+            self.create_recipe(number, legacy.save(
+                f'foodgram_app/images/old{number}.png',
+                ContentFile(png_bytes('green'))))
+            for number in range(2)
+        ]
+        call_command('migrate_media', stdout=StringIO())
+        names = {Recipe.objects.get(pk=recipe.pk).image.name
+                 for recipe in recipes}
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(is_hashed(name))
+        self.assertEqual(self.files(), [name])
+        self.assertEqual(self.references(), {name: 2})
+
+
+class InvalidationBusTestCase(TestCase):
+    """
+    Тест-кейс для шины инвалидации: публикация изменений, события
+    других процессов и опрос версий для SQLite.
+    """
+
+    def setUp(self):
+        self.events = []
+        invalidation.register('foodgram_app.Tag', self.events.append)
+        self.addCleanup(invalidation._handlers['foodgram_app.Tag'].remove,
+                        self.events.append)
+        invalidation._versions = None
+        invalidation._pending.changes = None
+
+    def test_change_is_published_after_commit(self):
+        """Сохранение тега увеличивает версию, обработчик — после коммита."""
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='Ужин', slug='dinner')
+            self.assertEqual(self.events, [])
+            self.assertFalse(CacheVersion.objects.exists())
+        self.assertEqual(self.events, [tag.pk])
+        self.assertEqual(
+            CacheVersion.objects.get(label='foodgram_app.Tag').version, 1)
+
+    def test_one_event_per_transaction(self):
+        """
+        Изменения транзакции уходят одним событием: каждая строка
+        один раз, много строк — сброс модели целиком.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            tags = [Tag.objects.create(name=f'Тег {number}',
+                                       slug=f'tag{number}')
+                    for number in range(2)]
+            for tag in tags:
+                tag.save()
+        self.assertEqual(self.events, [tag.pk for tag in tags])
+        self.assertEqual(
+            CacheVersion.objects.get(label='foodgram_app.Tag').version, 1)
+        self.events.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            for pk in range(invalidation.MAX_EVENT_PKS + 1):
+                invalidation.publish(Tag, pk)
+        self.assertEqual(self.events, [None])
+
+    def test_recipe_save_publishes_once(self):
+        """Сохранение рецепта с ингредиентами — одно событие рецепта."""
+        events = []
+        invalidation.register('foodgram_app.Recipe', events.append)
+        self.addCleanup(
+            invalidation._handlers['foodgram_app.Recipe'].remove,
+            events.append)
+        user = get_user_model().objects.create_user(
+            username='cook', email='cook@example.com', password='pass')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=user, name='Каша', text='Каша',
+                image='foodgram_app/images/test.png', cooking_time=10)
+            IngredientRecipe.objects.create(recipe=recipe, ingredient=salt,
+                                            amount=5)
+            recipe_ingredients_changed.send(sender=Recipe, recipe=recipe)
+        self.assertEqual(events, [recipe.pk])
+
+    @mock.patch.object(invalidation.connection, 'vendor', 'postgresql')
+    def test_notify_payload(self):
+        """На PostgreSQL событие — один NOTIFY после коммита."""
+        with mock.patch.object(invalidation.connection,
+                               'cursor') as cursor, \
+                self.captureOnCommitCallbacks() as callbacks:
+            invalidation.publish(Tag, 3)
+            invalidation.publish(Tag, 3)
+            invalidation.publish(Recipe, None)
+        cursor.assert_not_called()
+        with mock.patch.object(invalidation.connection, 'cursor') as cursor:
+            for callback in callbacks:
+                callback()
+        execute = cursor.return_value.__enter__.return_value.execute
+        execute.assert_called_once()
+        channel, payload = execute.call_args.args[1]
+        self.assertEqual(channel, invalidation.CHANNEL)
+        self.assertEqual(json.loads(payload), {
+            'models': {'foodgram_app.Tag': [3],
+                       'foodgram_app.Recipe': None},
+            'origin': invalidation.ORIGIN,
+        })
+        self.assertFalse(CacheVersion.objects.exists())
+
+    def test_notification_from_other_process(self):
+        """Событие другого процесса вызывает обработчик, своё — нет."""
+        for origin in ('other', invalidation.ORIGIN):
+            invalidation.handle_notification(json.dumps({
+                'models': {'foodgram_app.Tag': [7, 8]}, 'origin': origin,
+            }))
+        invalidation.handle_notification(json.dumps({
+            'models': {'foodgram_app.Tag': None}, 'origin': 'other',
+        }))
+        self.assertEqual(self.events, [7, 8, None])
+
+    def test_polling_fallback(self):
+        """Изменение версии в CacheVersion сбрасывает кеш целиком."""
+        CacheVersion.objects.create(label='foodgram_app.Tag', version=5)
+        invalidation.poll_once()
+        self.assertEqual(self.events, [])
+        CacheVersion.objects.update(version=6)
+        invalidation.poll_once()
+        invalidation.poll_once()
+        self.assertEqual(self.events, [None])
+
+    def test_polling_new_version_row(self):
+        """Строка версии, появившаяся после опроса, — тоже изменение."""
+        invalidation.poll_once()
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Ужин', slug='dinner')
+        self.events.clear()
+        invalidation.poll_once()
+        self.assertEqual(self.events, [None])
+
+
+class UserDeletionTestCase(TestCase):
+    """
+    Тест-кейс для удаления пользователя без Collector: связанные
+    строки и производные данные те же, что после каскада.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='authorpassword')
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='readerpassword')
+        self.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        self.ingredient = Ingredient.objects.create(
+            name='морковь', measurement_unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes = [
+                self.create_recipe(author, number)
+                for number, author in enumerate(
+                    (self.author, self.author, self.author, self.reader))
+            ]
+            Favorite.objects.create(user=self.reader,
+                                    recipe=self.recipes[0])
+            Favorite.objects.create(user=self.author,
+                                    recipe=self.recipes[3])
+            for recipe in (self.recipes[1], self.recipes[3]):
+                ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+            Follow.objects.create(user=self.reader, author=self.author)
+            Follow.objects.create(user=self.author, author=self.reader)
+
+    def create_recipe(self, author, number):
+        """Рецепт с ингредиентом, тегом и общим файлом изображения."""
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {number}', text='text',
+            cooking_time=1)
+        recipe.image.save('image.png', ContentFile(png_bytes('red')))
+        recipe.tags.add(self.tag)
+        IngredientRecipe.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=10)
+        update_search_index(recipe.pk)
+        return recipe
+
+    def removals(self, user):
+        """Записи журнала об удалениях у пользователя user."""
+        return set(InteractionChange.objects.filter(
+            user=user, added=False).values_list('kind', 'object_id'))
+
+    def test_delete_user(self):
+        """Рецепты, связи, журналы, списки покупок и файлы."""
+        author_id = self.author.id
+        author_recipe_ids = [recipe.id for recipe in self.recipes[:3]]
+        image = self.recipes[0].image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_user(self.author, chunk_size=2)
+        self.assertFalse(User.objects.filter(pk=author_id).exists())
+        self.assertEqual(list(Recipe.objects.all()), [self.recipes[3]])
+        self.assertEqual(
+            set(IngredientRecipe.objects.values_list('recipe', flat=True)),
+            {self.recipes[3].id})
+        self.assertEqual(
+            list(Favorite.objects.all()) + list(Follow.objects.all()), [])
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'total_amount')),
+            [(self.reader.id, self.ingredient.id, 10)])
+        self.assertEqual(self.removals(self.reader), {
+            (InteractionChange.FAVORITE, self.recipes[0].id),
+            (InteractionChange.SHOPPING_CART, self.recipes[1].id),
+            (InteractionChange.SUBSCRIPTION, author_id),
+        })
+        self.assertFalse(InteractionChange.objects.filter(
+            user_id=author_id).exists())
+        self.assertEqual(
+            set(RecipeChange.objects.filter(deleted=True).values_list(
+                'object_id', flat=True)),
+            set(author_recipe_ids))
+        self.assertEqual(
+            list(search_recipes(Recipe.objects.all(), 'морковь')),
+            [self.recipes[3]])
+        self.assertEqual(
+            dict(MediaFile.objects.values_list('name', 'references')),
+            {image: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_user(self.reader)
+        self.assertFalse(MediaFile.objects.exists())
+        self.assertFalse(Path(self.media_root, image).exists())
+
+    @mock.patch('foodgram_app.deletion.INLINE_RECIPES', 2)
+    def test_large_user_is_deleted_in_background(self):
+        """Автор с большим числом рецептов удаляется командой."""
+        client = APIClient()
+        client.force_authenticate(user=self.author)
+        response = client.delete(f'/api/users/{self.author.id}/',
+                                 {'current_password': 'authorpassword'})
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.is_active)
+        self.assertTrue(UserDeletion.objects.filter(
+            user=self.author).exists())
+        self.assertEqual(Recipe.objects.filter(author=self.author).count(), 3)
+        call_command('process_user_deletions', stdout=StringIO())
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(UserDeletion.objects.exists())
+
+    def test_small_user_is_deleted_at_once(self):
+        """Пользователь с немногими рецептами удаляется сразу."""
+        client = APIClient()
+        client.force_authenticate(user=self.reader)
+        response = client.delete(f'/api/users/{self.reader.id}/',
+                                 {'current_password': 'readerpassword'})
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.assertFalse(User.objects.filter(pk=self.reader.pk).exists())
+
+
+class MediaGarbageCollectorTestCase(TestCase):
+    """
+    Тест-кейс для сборки мусора в медиахранилище: файлы без ссылок
+    удаляются или переносятся в карантин, остальные не трогаются.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com',
+            password='cookpassword')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Рецепт', text='text', cooking_time=1)
+        self.recipe.image.save('image.png', ContentFile(png_bytes('red')))
+        self.orphan = self.create_file('foodgram_app/images/orphan.png')
+        self.young = self.create_file('users/young.png', age=0)
+        MediaFile.objects.create(name='foodgram_app/images/orphan.png',
+                                 references=0)
+
+    def create_file(self, name, age=2 * 60 * 60):
+        """Файл name с временем изменения age секунд назад."""
+        path = Path(self.media_root, name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'orphan')
+        modified = path.stat().st_mtime - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_dry_run(self):
+        """dry-run только находит файлы без ссылок."""
+        found = []
+        stats = collect_garbage(dry_run=True,
+                                report=lambda name, size: found.append(name))
+        self.assertEqual(stats.scanned, 3)
+        self.assertEqual(found, ['foodgram_app/images/orphan.png'])
+        self.assertEqual(stats.orphaned_bytes, len(b'orphan'))
+        self.assertTrue(self.orphan.exists())
+
+    def test_remove_orphans(self):
+        """Удаляются старые файлы без ссылок и их строки MediaFile."""
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertFalse(self.orphan.exists())
+        self.assertTrue(self.young.exists())
+        self.assertTrue(Path(self.media_root, self.recipe.image.name).exists())
+        self.assertEqual(list(MediaFile.objects.values_list('name',
+                                                            flat=True)),
+                         [self.recipe.image.name])
+
+    def test_quarantine(self):
+        """С карантином файл переносится с сохранением пути."""
+        quarantine = Path(self.media_root, 'quarantine')
+        collect_garbage(quarantine=str(quarantine))
+        self.assertFalse(self.orphan.exists())
+        self.assertTrue(
+            (quarantine / 'foodgram_app/images/orphan.png').exists())
+        self.assertEqual(collect_garbage(quarantine=str(quarantine))
+                         .orphaned, 0)
+
+    def test_pending_reference_keeps_file(self):
+        """
+        Файл со ссылкой в MediaFile, строка которой ещё не записана
+        в поле рецепта или аватара, не удаляется.
+        """
+        MediaFile.objects.filter(name='foodgram_app/images/orphan.png'
+                                 ).update(references=1)
+        self.assertEqual(collect_garbage().orphaned, 0)
+        self.assertTrue(self.orphan.exists())
+        self.assertEqual(MediaFile.objects.count(), 2)
+
+    def test_reupload_refreshes_orphan(self):
+        """
+        Загрузка того же содержимого, что у старого файла без ссылок,
+        обновляет время изменения: сборщик его не трогает.
+        """
+        storage = self.recipe.image.storage
+        content = ContentFile(b'orphan')
+        name = storage.store('foodgram_app/images/orphan.png', content)
+        old = self.create_file(name)
+        modified = old.stat().st_mtime
+        storage.save('foodgram_app/images/new.png', content)
+        self.assertGreater(old.stat().st_mtime, modified + 60 * 60)
+        self.assertEqual(collect_garbage().orphaned, 1)
+        self.assertTrue(old.exists())
+        self.assertEqual(MediaFile.objects.get(name=name).references, 1)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=1e-9,
+                   SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1)
+class SlowQueryLogTestCase(TestCase):
+    """
+    Тест-кейс для журнала медленных запросов: при пороге около нуля
+    медленными считаются все запросы, планы снимаются в каждом.
+    """
+
+    def setUp(self):
+        Tag.objects.create(name='Завтрак', slug='breakfast')
+
+    def test_normalize(self):
+        """Отпечаток не зависит от значений параметров и длины списков."""
+        first = normalize(
+            'SELECT "a"."id" FROM "a" WHERE "a"."id" IN (%s, %s)'
+            " AND \"a\".\"name\" = 'x' LIMIT 21")
+        second = normalize(
+            'SELECT "a"."id"\n FROM "a" WHERE "a"."id" IN (%s)'
+            " AND \"a\".\"name\" = 'it''s' LIMIT 5")
+        self.assertEqual(first, second)
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        self.assertEqual(
+            normalize('INSERT INTO "a" ("x", "y") VALUES (%s, %s), '
+                      '(%s, %s), (%s, %s)'),
+            'INSERT INTO "a" ("x", "y") VALUES (?, ?), ...')
+
+    def test_records_view_and_plan(self):
+        """Запросы сводятся по вьюхе, для SELECT снимается план."""
+        client = APIClient()
+        for _ in range(2):
+            self.assertEqual(client.get('/api/tags/').status_code,
+                             HTTPStatus.OK)
+        query = SlowQuery.objects.get(view='TagViewSet.list')
+        self.assertEqual(query.calls, 2)
+        self.assertIn('"foodgram_app_tag"', query.sql)
+        self.assertGreaterEqual(query.max_ms, query.total_ms / 2)
+        self.assertIn('SCAN', query.plan)
+        self.assertIsNotNone(query.explained_at)
+
+    @override_settings(SLOW_QUERY_EXPLAIN_SAMPLE_RATE=0)
+    def test_plans_sampled(self):
+        """Вне выборки запросы записываются без плана."""
+        APIClient().get('/api/tags/')
+        query = SlowQuery.objects.get(view='TagViewSet.list')
+        self.assertEqual(query.plan, '')
+        self.assertIsNone(query.explained_at)
+
+    def test_explain_rolls_back(self):
+        """План снимается в транзакции, которая откатывается."""
+        with mock.patch.object(transaction, 'set_rollback',
+                               wraps=transaction.set_rollback) as rollback:
+            self.assertIn('SCAN', explain(
+                'default', 'SELECT * FROM foodgram_app_tag', []))
+        rollback.assert_called_once_with(True, using='default')
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_disabled(self):
+        """Нулевой порог выключает журнал."""
+        APIClient().get('/api/tags/')
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_command(self):
+        """Команда slow_queries выводит сводку и очищает журнал."""
+        APIClient().get('/api/tags/')
+        out = StringIO()
+        call_command('slow_queries', '--plans', '--view', 'tag', stdout=out)
+        self.assertIn('TagViewSet.list', out.getvalue())
+        self.assertIn('План', out.getvalue())
+        call_command('slow_queries', '--reset', stdout=StringIO())
+        self.assertFalse(SlowQuery.objects.exists())
@@ -0,0 +1,91 @@
+"""
+Нормализация единиц измерения для списка покупок.
+
+У каждого ингредиента одна единица измерения в свободной форме,
+поэтому одинаковые продукты могут прийти в граммах и килограммах
+или с разным написанием названия. Единицы делятся на семейства
+(масса, объём), у каждого семейства есть каноническая единица,
+к которой приводятся количества при объединении строк.
+"""
+import re
+
+# Написание единицы -> каноническое написание.
+UNIT_ALIASES = {
+    'гр': 'г',
+    'гр.': 'г',
+    'грамм': 'г',
+    'кг.': 'кг',
+    'килограмм': 'кг',
+    'мл.': 'мл',
+    'л.': 'л',
+    'литр': 'л',
+    'шт': 'шт.',
+    'штука': 'шт.',
+    'ч.л.': 'ч. л.',
+    'ч л': 'ч. л.',
+    'ст.л.': 'ст. л.',
+    'ст л': 'ст. л.',
+}
+
+# Единица -> (каноническая единица семейства, множитель).
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('мл', 5),
+    'ст. л.': ('мл', 15),
+    'стакан': ('мл', 250),
+}
+
+
+def normalize_unit(unit):
+    """Приводит написание единицы измерения к каноническому."""
+    unit = re.sub(r'\s+', ' ', unit.strip().lower())
+    return UNIT_ALIASES.get(unit, unit)
+
+
+def normalize_name(name):
+    """Ключ для сравнения названий: регистр, пробелы и «ё»."""
+    return re.sub(r'\s+', ' ', name.strip().lower().replace('ё', 'е'))
+
+
+def convert(amount, unit):
+    """
+    Переводит количество в каноническую единицу семейства.
+    Возвращает (количество, единица); неизвестные единицы
+    возвращаются без изменений и ни с чем не объединяются.
+    """
+    unit = normalize_unit(unit)
+    canonical, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+    return amount * factor, canonical
+
+
+def merge_shopping_list(rows):
+    """
+    Объединяет строки списка покупок за один проход.
+    rows — итерируемое (название, количество, единица).
+    Строки с одинаковым названием и совместимыми единицами
+    суммируются; если все они были в одной единице, она сохраняется,
+    иначе результат выводится в канонической единице семейства.
+    Возвращает список (название, количество, единица),
+    отсортированный по названию.
+    """
+    merged = {}
+    for name, amount, unit in rows:
+        converted, canonical = convert(amount, unit)
+        key = (normalize_name(name), canonical)
+        if key not in merged:
+            merged[key] = [name, amount, converted, {normalize_unit(unit)}]
+            continue
+        item = merged[key]
+        item[1] += amount
+        item[2] += converted
+        item[3].add(normalize_unit(unit))
+    result = []
+    for (_, canonical), (name, amount, converted, units) in merged.items():
+        if len(units) == 1:
+            result.append((name, amount, units.pop()))
+        else:
+            result.append((name, converted, canonical))
+    return sorted(result, key=lambda item: normalize_name(item[0]))
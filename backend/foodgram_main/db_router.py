@@ -0,0 +1,211 @@
+"""
+Чтение с реплик и запись в основную базу.
+
+ReplicaRoutingMiddleware на время запроса выбирает базу для чтения:
+безопасные запросы к API (GET, HEAD, OPTIONS по REPLICA_READ_PATHS)
+читают с одной из здоровых реплик DATABASE_REPLICAS, остальные —
+с основной базы. После успешного изменяющего запроса клиент
+REPLICA_PIN_SECONDS секунд читает с основной базы, чтобы сразу
+видеть свои изменения (read-your-writes), пока реплики догоняют
+основную базу. Закрепление хранится на сервере — в общем для рабочих
+процессов кеше PIN_CACHE_ALIAS по id пользователя — и не зависит
+от того, вернёт ли клиент cookie. Поэтому реплика выбирается только
+после аутентификации: чтения сессии и токена идут в основную базу.
+Анонимный клиент закрепляется cookie PIN_COOKIE.
+
+Состояние реплики проверяется запросом SELECT 1 не чаще раза
+в REPLICA_HEALTH_CHECK_INTERVAL секунд; недоступная реплика
+исключается из выбора, а если здоровых реплик нет, чтение
+идёт с основной базы. Запросы вне middleware (команды, тесты,
+сигналы) и внутри транзакций всегда идут в основную базу.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'primary_pin'
+PIN_CACHE_ALIAS = 'shared'
+
+_read_alias = ContextVar('read_alias', default=None)
+# Псевдоним реплики -> (доступна, время проверки).
+_health = {}
+
+
+def replica_aliases():
+    """Псевдонимы реплик из настроек."""
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def check_replica(alias):
+    """Реплика отвечает на запрос."""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except DatabaseError:
+        connections[alias].close()
+        return False
+    return True
+
+
+def is_healthy(alias):
+    """Состояние реплики с кешированием на время интервала проверки."""
+    healthy, checked_at = _health.get(alias, (None, 0))
+    now = time.monotonic()
+    if (healthy is None
+            or now - checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL):
+        healthy = check_replica(alias)
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    """Исключает реплику из выбора до следующей проверки."""
+    _health[alias] = (False, time.monotonic())
+
+
+def choose_replica():
+    """Случайная здоровая реплика или основная база."""
+    healthy = [alias for alias in replica_aliases() if is_healthy(alias)]
+    return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Чтение из базы alias внутри блока: например, для потоковых
+    ответов, которые читают данные уже после выхода из middleware.
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def reads_from_replica(request):
+    """Запрос можно обслужить чтением с реплики."""
+    return (request.method in SAFE_METHODS
+            and request.path.startswith(settings.REPLICA_READ_PATHS)
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block)
+
+
+def resolved_user(request):
+    """
+    Пользователь запроса, если аутентификация уже выполнена
+    (AuthenticationMiddleware или DRF), иначе None.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user
+
+
+def pin_key(user_id):
+    return f'primary_pin:{user_id}'
+
+
+def is_pinned(request, user):
+    """Клиент недавно писал и читает с основной базы."""
+    if user.is_authenticated:
+        return caches[PIN_CACHE_ALIAS].get(pin_key(user.pk)) is not None
+    return PIN_COOKIE in request.COOKIES
+
+
+def pin(request, response):
+    """Закрепляет клиента за основной базой после изменения."""
+    user = resolved_user(request)
+    if user is not None and user.is_authenticated:
+        caches[PIN_CACHE_ALIAS].set(pin_key(user.pk), 1,
+                                    settings.REPLICA_PIN_SECONDS)
+        return
+    response.set_cookie(
+        PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+        httponly=True, samesite='Lax')
+
+
+class ReadChoice:
+    """
+    Выбор базы для чтения безопасного запроса: до аутентификации —
+    основная база, затем один раз — реплика, если клиент
+    не закреплён за основной базой.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.alias = None
+
+    def get(self):
+        if self.alias is None:
+            user = resolved_user(self.request)
+            if user is None:
+                return DEFAULT_DB_ALIAS
+            self.alias = (DEFAULT_DB_ALIAS if is_pinned(self.request, user)
+                          else choose_replica())
+        return self.alias
+
+
+def current_alias():
+    """База для чтения, выбранная для запроса, или None."""
+    alias = _read_alias.get()
+    if isinstance(alias, ReadChoice):
+        return alias.alias
+    return alias
+
+
+class ReplicaRouter:
+    """Роутер: чтение с выбранной для запроса базы, запись в основную."""
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if isinstance(alias, ReadChoice):
+            return alias.get()
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Выбирает базу для чтения на время запроса и закрепляет клиента
+    за основной базой после изменений. Должен стоять в MIDDLEWARE
+    выше всех, кто читает из базы (сессии, аутентификация).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        choice = ReadChoice(request) if reads_from_replica(request) else None
+        token = _read_alias.set(choice)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            pin(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        """Реплика, на которой упал запрос, исключается из выбора."""
+        alias = current_alias()
+        if alias not in (None, DEFAULT_DB_ALIAS) and isinstance(
+                exception, DatabaseError) and not check_replica(alias):
+            mark_unhealthy(alias)
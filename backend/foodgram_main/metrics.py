@@ -0,0 +1,347 @@
+"""
+Метрики в текстовом формате Prometheus: /metrics.
+
+Каждый рабочий процесс gunicorn считает метрики у себя в памяти:
+у каждого потока свой словарь (threading.local), поэтому запись
+на горячем пути — обычное изменение словаря без блокировок.
+Раз в METRICS_FLUSH_INTERVAL секунд (и при выходе процесса) снимок
+процесса записывается в METRICS_DIR/<pid>.json через временный файл
+и os.replace. /metrics читает снимки всех процессов, складывает
+счётчики и гистограммы, а RSS отдаёт по каждому живому процессу.
+Снимки завершившихся процессов при чтении переносятся в
+archive.json под блокировкой flock, чтобы счётчики не убывали после
+перезапуска воркеров (max_requests) и каталог не рос.
+
+Метрики:
+- foodgram_http_requests_total{view, method, status};
+- foodgram_http_request_duration_seconds{view, method} — гистограмма;
+- foodgram_db_queries_total{view},
+  foodgram_db_query_duration_seconds_total{view} и гистограмма
+  foodgram_db_queries_per_request{view};
+- foodgram_cache_requests_total{cache, result} — попадания и промахи
+  кешей (count_cache);
+- foodgram_worker_rss_bytes{pid}.
+
+view — вьюха и действие DRF (RecipeViewSet.list,
+FudgramUserViewSet.subscriptions), а не путь: число рядов
+не зависит от id в адресах. Если задан METRICS_TOKEN, /metrics
+требует заголовок Authorization: Bearer <METRICS_TOKEN>.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from foodgram_app.query_log import view_name
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+METRICS = {
+    'foodgram_http_requests_total': (
+        'counter', 'HTTP-запросы по вьюхам, методам и статусам.',
+        ('view', 'method', 'status'), None),
+    'foodgram_http_request_duration_seconds': (
+        'histogram', 'Время обработки HTTP-запроса.',
+        ('view', 'method'), DURATION_BUCKETS),
+    'foodgram_db_queries_total': (
+        'counter', 'Запросы к базе по вьюхам.', ('view',), None),
+    'foodgram_db_query_duration_seconds_total': (
+        'counter', 'Время запросов к базе по вьюхам.', ('view',), None),
+    'foodgram_db_queries_per_request': (
+        'histogram', 'Запросов к базе на один HTTP-запрос.',
+        ('view',), QUERY_BUCKETS),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам: hit или miss.',
+        ('cache', 'result'), None),
+    'foodgram_worker_rss_bytes': (
+        'gauge', 'Резидентная память рабочего процесса.', ('pid',), None),
+}
+ARCHIVE = 'archive.json'
+LOCK = '.lock'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_local = threading.local()
+# Словари всех потоков процесса; list.append атомарен.
+_stores = []
+_next_flush = 0.0
+
+
+class Store:
+    """Метрики одного потока: значения счётчиков и корзины гистограмм."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+def store():
+    try:
+        return _local.store
+    except AttributeError:
+        _local.store = Store()
+        _stores.append(_local.store)
+        return _local.store
+
+
+def inc(name, labels, value=1):
+    """Увеличивает счётчик name с метками labels (кортеж значений)."""
+    counters = store().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    """Добавляет значение в гистограмму name."""
+    histograms = store().histograms
+    key = (name, labels)
+    buckets = METRICS[name][3]
+    counts = histograms.get(key)
+    if counts is None:
+        # Корзины без накопления, последняя — +Inf, затем сумма.
+        counts = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    counts[bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+def count_cache(cache, hit):
+    """Попадание или промах кеша cache."""
+    inc('foodgram_cache_requests_total', (cache, 'hit' if hit else 'miss'))
+
+
+def current_rss():
+    """Текущий RSS процесса в байтах или None вне Linux."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def merge(target, snapshot):
+    """Складывает счётчики и гистограммы снимка в target."""
+    for name, labels, value in snapshot['counters']:
+        key = (name, tuple(labels))
+        target['counters'][key] = target['counters'].get(key, 0) + value
+    for name, labels, counts in snapshot['histograms']:
+        key = (name, tuple(labels))
+        current = target['histograms'].get(key)
+        target['histograms'][key] = (
+            list(counts) if current is None
+            else [a + b for a, b in zip(current, counts)])
+
+
+def empty():
+    return {'counters': {}, 'histograms': {}}
+
+
+def dump(state):
+    return {
+        'counters': [[name, labels, value]
+                     for (name, labels), value in state['counters'].items()],
+        'histograms': [[name, labels, counts] for (name, labels), counts
+                       in state['histograms'].items()],
+    }
+
+
+def snapshot():
+    """Снимок процесса: сумма словарей всех потоков и RSS."""
+    state = empty()
+    for thread_store in list(_stores):
+        # dict() и list() копируют без переключения потоков.
+        merge(state, {
+            'counters': [[name, labels, value] for (name, labels), value
+                         in dict(thread_store.counters).items()],
+            'histograms': [[name, labels, list(counts)]
+                           for (name, labels), counts
+                           in dict(thread_store.histograms).items()],
+        })
+    return {'pid': os.getpid(), 'rss': current_rss(), **dump(state)}
+
+
+def write_json(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as target:
+        json.dump(data, target)
+    os.replace(temporary, path)
+
+
+def read_json(path):
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Записывает снимок процесса в METRICS_DIR."""
+    global _next_flush
+    _next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL
+    if not _stores:
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    write_json(os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json'),
+               snapshot())
+
+
+def maybe_flush():
+    if time.monotonic() >= _next_flush:
+        flush()
+
+
+atexit.register(flush)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """
+    Сумма снимков всех процессов и RSS живых процессов.
+    Снимки завершившихся процессов переносятся в архив.
+    """
+    flush()
+    directory = settings.METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    state = empty()
+    rss = {}
+    with open(os.path.join(directory, LOCK), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = read_json(os.path.join(directory, ARCHIVE))
+        archived = empty()
+        if archive is not None:
+            merge(archived, archive)
+        changed = False
+        for name in os.listdir(directory):
+            stem, extension = os.path.splitext(name)
+            if extension != '.json' or not stem.isdigit():
+                continue
+            process = read_json(os.path.join(directory, name))
+            if process is None:
+                continue
+            if is_alive(int(stem)):
+                merge(state, process)
+                if process.get('rss') is not None:
+                    rss[stem] = process['rss']
+            else:
+                merge(archived, process)
+                os.remove(os.path.join(directory, name))
+                changed = True
+        if changed:
+            write_json(os.path.join(directory, ARCHIVE), dump(archived))
+    merge(state, dump(archived))
+    return state, rss
+
+
+def escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+    state, rss = collect()
+    series = {name: [] for name in METRICS}
+    for (name, labels), value in state['counters'].items():
+        series[name].append((labels, value))
+    for (name, labels), counts in state['histograms'].items():
+        series[name].append((labels, counts))
+    series['foodgram_worker_rss_bytes'] = [
+        ((pid,), value) for pid, value in rss.items()]
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(series[name]):
+            if kind != 'histogram':
+                lines.append(
+                    f'{name}{format_labels(label_names, labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                lines.append(f'{name}_bucket' + format_labels(
+                    label_names, labels, [('le', bound)]) + f' {cumulative}')
+            labels_text = format_labels(label_names, labels)
+            lines.append(f'{name}_sum{labels_text} {value[-1]}')
+            lines.append(f'{name}_count{labels_text} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Эндпоинт /metrics для Prometheus."""
+    token = settings.METRICS_TOKEN
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+class QueryCounter:
+    """Обёртка execute_wrapper: число и время запросов к базе."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, их длительность и запросы к базе по вьюхам.
+    Должен стоять в MIDDLEWARE первым, чтобы учитывать всю обработку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        view = view_name(request)
+        inc('foodgram_http_requests_total',
+            (view, request.method, str(response.status_code)))
+        observe('foodgram_http_request_duration_seconds',
+                (view, request.method), duration)
+        inc('foodgram_db_queries_total', (view,), counter.queries)
+        inc('foodgram_db_query_duration_seconds_total', (view,),
+            counter.seconds)
+        observe('foodgram_db_queries_per_request', (view,), counter.queries)
+        maybe_flush()
+        return response
@@ -0,0 +1,97 @@
+"""
+Поиск N+1 в тестах.
+
+detect_n_plus_one() на время блока записывает все запросы к базе
+(connection.execute_wrapper на всех подключениях), группирует их
+по отпечатку SQL (см. foodgram_app.query_log.normalize: литералы,
+параметры и списки IN заменены) и бросает RepeatedQueriesError,
+если один отпечаток повторился больше threshold раз: запрос
+в цикле по строкам выдачи — типичный N+1.
+
+NPlusOneMixin для TestCase проверяет так каждый HTTP-запрос теста:
+на время теста в начало MIDDLEWARE добавляется NPlusOneMiddleware,
+а порог берётся из атрибута n_plus_one_threshold.
+"""
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test import modify_settings, override_settings
+
+from foodgram_app.query_log import fingerprint, normalize, view_name
+
+DEFAULT_THRESHOLD = 3
+MIDDLEWARE = 'foodgram_main.n_plus_one.NPlusOneMiddleware'
+
+
+class RepeatedQueriesError(AssertionError):
+    """Один и тот же запрос выполнен слишком много раз."""
+
+
+class QueryGroups:
+    """
+    Обёртка execute_wrapper: число запросов по отпечаткам.
+    label — что проверяется, для текста ошибки.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.counts = Counter()
+        self.examples = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        self.counts[key] += 1
+        self.examples.setdefault(key, normalized)
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """(число, SQL) отпечатков, повторённых больше threshold раз."""
+        return [(count, self.examples[key])
+                for key, count in self.counts.most_common()
+                if count > threshold]
+
+
+@contextmanager
+def detect_n_plus_one(threshold=DEFAULT_THRESHOLD, label='блок'):
+    """Бросает RepeatedQueriesError, если в блоке есть N+1."""
+    groups = QueryGroups(label)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(groups))
+        yield groups
+    repeated = groups.repeated(threshold)
+    if repeated:
+        raise RepeatedQueriesError(
+            f'{groups.label}: запросы повторяются больше {threshold} раз:\n'
+            + '\n'.join(f'  {count} × {sql}' for count, sql in repeated))
+
+
+class NPlusOneMiddleware:
+    """Проверяет каждый запрос на N+1 с порогом N_PLUS_ONE_THRESHOLD."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with detect_n_plus_one(settings.N_PLUS_ONE_THRESHOLD) as groups:
+            response = self.get_response(request)
+            groups.label = (f'{request.method} {request.get_full_path()} '
+                            f'({view_name(request)})')
+        return response
+
+
+class NPlusOneMixin:
+    """Миксин TestCase: падать на N+1 в любом запросе тестового клиента."""
+    n_plus_one_threshold = DEFAULT_THRESHOLD
+
+    def setUp(self):
+        super().setUp()
+        for patch in (
+                modify_settings(MIDDLEWARE={'prepend': MIDDLEWARE}),
+                override_settings(
+                    N_PLUS_ONE_THRESHOLD=self.n_plus_one_threshold)):
+            patch.enable()
+            self.addCleanup(patch.disable)
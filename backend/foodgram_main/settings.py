@@ -33,13 +33,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram_main.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'foodgram_api.compression.CompressionMiddleware',
+    'foodgram_app.query_log.SlowQueryMiddleware',
+    'foodgram_main.db_router.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram_api.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram_main.urls'
@@ -87,6 +92,42 @@ else:
         }
     }
 
+# Реплики для чтения (см. foodgram_main.db_router):
+# DB_REPLICA_HOSTS=host1,host2 — реплики PostgreSQL с теми же
+# учётными данными; SQLITE_REPLICA=1 — второй псевдоним на тот же
+# файл SQLite, чтобы проверить маршрутизацию локально.
+if USE_SQLITE:
+    replicas = ([DATABASES['default']]
+                if os.getenv('SQLITE_REPLICA', '') in ('1', 'True') else [])
+else:
+    replicas = [
+        {**DATABASES['default'], 'HOST': host.strip()}
+        for host in os.getenv('DB_REPLICA_HOSTS', '').split(',')
+        if host.strip()
+    ]
+DATABASE_REPLICAS = []
+for number, replica in enumerate(replicas, 1):
+    DATABASES[f'replica_{number}'] = {**replica,
+                                      'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{number}')
+DATABASE_ROUTERS = ['foodgram_main.db_router.ReplicaRouter']
+REPLICA_READ_PATHS = ('/api/',)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
+# default — кеш процесса; shared — общий для рабочих процессов
+# gunicorn кеш на диске (закрепление за основной базой,
+# foodgram_main.db_router).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SHARED_CACHE_DIR', '/tmp/foodgram_cache'),
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -114,6 +155,15 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'foodgram_api.pagination.CustomPagination',
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'foodgram_api.uploads.MultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram_api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'PAGE_SIZE': 6,
 }
 
@@ -141,6 +191,36 @@ STATIC_ROOT = '/backend_static/static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/media'
 
+# Загрузка изображений multipart и «сырым» телом (foodgram_api.uploads).
+IMAGE_UPLOAD_MAX_SIZE = 25 * 1024 * 1024
+
+# Профилирование запросов (foodgram_api.profiling): staff включает
+# его заголовком X-Profile: 1 или ?profile=1, доля случайной выборки
+# задаётся PROFILING_SAMPLE_RATE (0 — выключена).
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_INTERVAL = 0.002
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/tmp/foodgram_profiles')
+PROFILING_MAX_CAPTURES = int(os.getenv('PROFILING_MAX_CAPTURES', 200))
+
+# Журнал медленных запросов к базе (foodgram_app.query_log,
+# команда slow_queries); 0 — выключен.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 100))
+# Доля HTTP-запросов, в которых снимаются планы медленных запросов.
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(
+    os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.01))
+SLOW_QUERY_EXPLAINS_PER_REQUEST = 1
+SLOW_QUERY_EXPLAIN_INTERVAL = 60 * 60
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = 5000
+
+# Метрики Prometheus на /metrics (foodgram_main.metrics): снимки
+# рабочих процессов gunicorn в общем каталоге.
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/foodgram_metrics')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Имена файлов по хешу содержимого, см. foodgram_app.storage.
+DEFAULT_FILE_STORAGE = 'foodgram_app.storage.HashedMediaStorage'
+
 # Настройки Djoser
 DJOSER = {
     'HIDE_USERS': True,     # Или True, если нужно скрывать эндпоинт "Все пользователи"
@@ -3,10 +3,13 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('foodgram_api.urls')),
     path('s/', include('foodgram_app.urls')),
+    path('metrics', metrics_view),
 ]
 
 if settings.DEBUG:
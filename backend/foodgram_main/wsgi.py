@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_main.settings')
 
 application = get_wsgi_application()
+
+# Слушатель шины инвалидации кешей в каждом рабочем процессе.
+from foodgram_app.invalidation import start_listener  # noqa: E402
+
+start_listener()
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
+from django.db.models import Exists, OuterRef
 from django.utils.html import format_html
 
+from foodgram_app.deletion import request_user_deletion
+from foodgram_app.paginators import EstimatedCountPaginator
+
 from .models import Follow, User
 
 
@@ -16,25 +20,59 @@ class FoodgramUserAdmin(BaseUserAdmin):
                     )
     search_fields = ('username', 'email')
     ordering = ('username',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Страница подтверждения перечисляет только пользователей:
+        стандартный обход связанных строк загружает все рецепты,
+        избранное и подписки автора.
+        """
+        objs = list(objs)
+        return ([str(obj) for obj in objs],
+                {User._meta.verbose_name_plural: len(objs)}, set(), [])
+
+    def delete_model(self, request, obj):
+        """Удаление без Collector, большие аккаунты — в фоне."""
+        request_user_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            request_user_deletion(user)
 
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     """
     Админ-модель для управления подписками (Follow).
+    Пользователи выбираются через автодополнение, а не через
+    полный выпадающий список.
     """
     list_display = ('id', 'user', 'author', 'get_is_subscribed')
     list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        """
+        Подписка пользователя на автора вычисляется подзапросом EXISTS
+        в том же запросе, что и страница списка.
+        """
+        return super().get_queryset(request).annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=OuterRef('user'), author=OuterRef('author'))))
 
     def get_is_subscribed(self, obj):
         """
         Метод для вычисления, подписан ли текущий пользователь на автора.
         """
-        is_subscribed = obj.user.follower.filter(author=obj.author).exists()
         return format_html(
             '<span style="color: {};">{}</span>',
-            'green' if is_subscribed else 'red',
-            'Да' if is_subscribed else 'Нет'
+            'green' if obj.is_subscribed else 'red',
+            'Да' if obj.is_subscribed else 'Нет'
         )
 
     @admin.display(description='Подписан ли пользователь на автора?')
@@ -42,8 +80,7 @@ class FollowAdmin(admin.ModelAdmin):
         """
         Отображение "Да"/"Нет" для подписки в админке.
         """
-        is_subscribed = obj.user.follower.filter(author=obj.author).exists()
-        return 'Да' if is_subscribed else 'Нет'
+        return 'Да' if obj.is_subscribed else 'Нет'
 
 
 admin.site.unregister(Group)
@@ -1,9 +1,17 @@
 from http import HTTPStatus
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 from rest_framework.test import APIClient
 
+from foodgram_app.models import (
+    Favorite,
+    InteractionChange,
+    Recipe,
+    ShoppingCart,
+)
+
 from .models import Follow
 
 User = get_user_model()
@@ -163,3 +171,98 @@ class UsersAPITestCase(TestCase):
         response = self.auth_client.get('/api/users/subscriptions/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertIn('results', response.data)
+
+
+class UserStateTestCase(TestCase):
+    """
+    Тест-кейс для api/users/me/state/: полный снимок и изменения
+    после курсора, включая удаления.
+    """
+
+    def setUp(self):
+        """Читатель, автор и два рецепта автора."""
+        self.reader = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='readerpassword')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            password='authorpassword')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'Рецепт {number}', text='text',
+                image='foodgram_app/images/test.png', cooking_time=1)
+            for number in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.reader)
+
+    def state(self, **params):
+        response = self.client.get('/api/users/me/state/', params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return response.json()
+
+    def test_full_state(self):
+        """Без since — все id пользователя."""
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[1])
+        Follow.objects.create(user=self.reader, author=self.author)
+        state = self.state()
+        self.assertTrue(state['full'])
+        self.assertEqual(state['favorites'],
+                         {'added': [self.recipes[0].id], 'removed': []})
+        self.assertEqual(state['shopping_cart']['added'],
+                         [self.recipes[1].id])
+        self.assertEqual(state['subscriptions']['added'], [self.author.id])
+
+    def test_delta_since_cursor(self):
+        """С since — итог изменений после курсора, включая удаления."""
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        cursor = self.state()['cursor']
+        Favorite.objects.filter(user=self.reader).delete()
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[1])
+        self.recipes[1].delete()
+        Follow.objects.create(user=self.reader, author=self.author)
+        Favorite.objects.create(user=self.author, recipe=self.recipes[0])
+        state = self.state(since=cursor)
+        self.assertFalse(state['full'])
+        self.assertEqual(state['favorites'], {
+            'added': [], 'removed': recipe_ids,
+        })
+        self.assertEqual(state['subscriptions']['added'], [self.author.id])
+        self.assertEqual(self.state(since=state['cursor'])['favorites'],
+                         {'added': [], 'removed': []})
+
+    def test_cursor_follows_commit_order(self):
+        """
+        На PostgreSQL курсор — pg_snapshot_xmin: строка с меньшим id,
+        закоммиченная позже курсора, не теряется, а уже прочитанные
+        строки завершённых транзакций могут прийти повторно.
+        """
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        InteractionChange.objects.update(xid=10)
+        with mock.patch('foodgram_app.interactions.snapshot_xmin',
+                        return_value=20):
+            state = self.state()
+            self.assertEqual(state['cursor'], '20')
+            self.assertTrue(self.state(since='5')['full'])
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[1])
+        Follow.objects.create(user=self.reader, author=self.author)
+        late, early = InteractionChange.objects.order_by('id')[1:]
+        # Транзакция с меньшим id закоммичена позже.
+        InteractionChange.objects.filter(pk=late.pk).update(xid=30)
+        InteractionChange.objects.filter(pk=early.pk).update(xid=25)
+        with mock.patch('foodgram_app.interactions.snapshot_xmin',
+                        return_value=40):
+            state = self.state(since=state['cursor'])
+        self.assertFalse(state['full'])
+        self.assertEqual(state['cursor'], '40')
+        self.assertEqual(state['favorites']['added'], [self.recipes[1].id])
+        self.assertEqual(state['subscriptions']['added'], [self.author.id])
+
+    def test_invalid_since(self):
+        """Некорректный since — 400, анониму — 401."""
+        response = self.client.get('/api/users/me/state/', {'since': 'x'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        response = APIClient().get('/api/users/me/state/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)